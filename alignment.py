@@ -0,0 +1,125 @@
+from datetime import datetime, timezone
+
+import numpy as np
+
+from downsample import downsample_aligned
+from metrics import span
+from readings import nullable, read_readings
+from timestamps import format_minute_keys
+
+
+def minute_iso(minute):
+    """UTC ISO string for the start of an epoch minute."""
+    return datetime.fromtimestamp(int(minute) * 60, tz=timezone.utc).isoformat()
+
+
+def last_per_minute(minutes):
+    """Return indices that keep the last sample of every minute, in time order."""
+    order = np.argsort(minutes, kind='stable')
+    ordered = minutes[order]
+    keep = np.ones(len(ordered), dtype=bool)
+    keep[:-1] = ordered[1:] != ordered[:-1]
+    return order[keep]
+
+
+def align_columns(series):
+    """Align several time series onto the union of their minutes.
+
+    ``series`` maps a name to ``(minutes, {field: values})``. The result is
+    ``(axis, columns)`` where ``axis`` is the sorted epoch-minute axis and
+    ``columns[name][field]`` is a list of the same length with ``None`` in
+    the gaps. Cost is O(total points), not O(timestamps x series).
+    """
+    deduped = {}
+    for name, (minutes, fields) in series.items():
+        minutes = np.asarray(minutes, dtype=np.int64)
+        idx = last_per_minute(minutes)
+        deduped[name] = (minutes[idx], {
+            field: np.asarray(values, dtype=object)[idx] for field, values in fields.items()
+        })
+
+    if deduped:
+        axis = np.unique(np.concatenate([m for m, _ in deduped.values()]))
+    else:
+        axis = np.empty(0, dtype=np.int64)
+
+    columns = {}
+    for name, (minutes, fields) in deduped.items():
+        positions = np.searchsorted(axis, minutes)
+        columns[name] = {}
+        for field, values in fields.items():
+            column = np.full(len(axis), None, dtype=object)
+            column[positions] = values
+            columns[name][field] = column.tolist()
+    return axis, columns
+
+
+def build_combined_data(weather_docs, ac_docs, room_docs, max_points=None):
+    """Build the ``/api/combined-data`` payload from raw Mongo documents.
+
+    With ``max_points`` the aligned columns are LTTB-downsampled to at most
+    that many timestamps. ``cursor`` is the UTC start of the last row's
+    minute; clients pass it back as ``since`` to fetch only newer rows.
+    """
+    return with_timestamps(combined_columns(weather_docs, ac_docs, room_docs, max_points))
+
+
+def with_timestamps(data):
+    """Swap the ``minutes`` axis of combined columns for formatted local ``timestamps``."""
+    with span("align"):
+        minutes = data.pop("minutes")
+        return {"timestamps": format_minute_keys(minutes), **data}
+
+
+def combined_columns(weather_docs, ac_docs, room_docs, max_points=None):
+    """``build_combined_data`` with the epoch-minute axis as ``minutes`` in
+    place of the formatted ``timestamps``, for the binary format."""
+    with span("parse"):
+        series, room_names = _parse_sources(weather_docs, ac_docs, room_docs)
+    return aligned_columns(series, room_names, max_points)
+
+
+def aligned_columns(series, room_names, max_points=None):
+    """Combined columns from parsed series: ``series`` maps ``"weather"``,
+    ``"ac"`` and ``("room", name)`` to ``(minutes, {field: values})``, as
+    ``_parse_sources`` builds them (or from bucket starts, for history)."""
+    with span("align"):
+        axis, columns = align_columns(series)
+        axis, columns = downsample_aligned(axis, columns, max_points)
+
+    return {
+        "minutes": axis,
+        "outside_temp": columns["weather"]["temp"],
+        "outside_feels_like": columns["weather"]["feels_like"],
+        "outside_humidity": columns["weather"]["humidity"],
+        "ac_temp": columns["ac"]["temp"],
+        "ac_humidity": columns["ac"]["humidity"],
+        "ac_feels_like": columns["ac"]["feels_like"],
+        "room_temps": {name: columns[("room", name)]["temp"] for name in room_names},
+        "room_humidity": {name: columns[("room", name)]["humidity"] for name in room_names},
+        "cursor": minute_iso(axis[-1]) if len(axis) else None
+    }
+
+
+def _parse_sources(weather_docs, ac_docs, room_docs):
+    # Per-source (minutes, columns) series for align_columns, plus the room names in order
+    series = {}
+    for source, docs in (("weather", weather_docs), ("ac", ac_docs)):
+        readings = read_readings(docs, source)
+        series[source] = (readings.minutes, {
+            "temp": nullable(readings.values["temperature"]),
+            "feels_like": nullable(readings.values["feels_like"]),
+            "humidity": nullable(readings.values["humidity"])
+        })
+
+    # Room rows need a room and both values to be charted
+    rooms = read_readings(room_docs, "room").complete()
+    room_names = []
+    for room_name, readings in rooms.by_room().items():
+        room_names.append(room_name)
+        series[("room", room_name)] = (readings.minutes, {
+            "temp": readings.values["temperature"].astype(object),
+            "humidity": readings.values["humidity"].astype(object)
+        })
+
+    return series, room_names
@@ -0,0 +1,249 @@
+from datetime import timedelta
+
+import numpy as np
+
+from metrics import span
+from planner import PYTHON_BUCKET_LIMIT, parse_range, plan_history, plan_request, read_buckets
+from readings import to_float
+from rollups import RESOLUTIONS, bucket_minutes
+from timestamps import format_minute_keys
+
+# /api/analytics: degree-days, outside/room correlation and lag, AC runtime
+# against the outside-inside difference, and per-room percentiles, over any
+# ?start=&end= range. Everything is computed from bucket means (hourly by
+# default) on one shared axis: from the rollups when they are kept, so 90
+# days cost about 2,000 buckets per series rather than a read of every raw
+# reading, or bucketed from the raw readings the way the history routes do.
+
+ANALYTICS_SOURCES = ("weather", "ac", "room")
+ANALYTICS_SPAN = timedelta(days=30)
+ANALYTICS_RESOLUTIONS = ("15m", "1h")
+# Degree-day base temperature (°F), as the US utilities use
+DEFAULT_BASE = 65.0
+# Longest lag tried between the outside temperature and a room, in hours
+DEFAULT_MAX_LAG = 12
+MAX_LAG_LIMIT = 72
+# Fewer aligned pairs than this give no correlation
+MIN_PAIRS = 3
+# A bucket-to-bucket change in the AC room smaller than this (°F) counts as drift
+RUNTIME_THRESHOLD = 0.1
+# Width (°F) of the outside-inside difference bands the runtime is reported in
+DELTA_T_BAND = 5
+PERCENTILES = (5, 25, 50, 75, 95)
+
+
+def parse_analytics_resolution(args):
+    resolution = args.get("resolution", "1h")
+    if resolution not in ANALYTICS_RESOLUTIONS:
+        raise ValueError(f"resolution must be one of: {', '.join(ANALYTICS_RESOLUTIONS)}")
+    return resolution
+
+
+def parse_base(args):
+    try:
+        return float(args.get("base", DEFAULT_BASE))
+    except ValueError:
+        raise ValueError("base must be a number")
+
+
+def parse_max_lag(args):
+    try:
+        max_lag = int(args.get("max_lag", DEFAULT_MAX_LAG))
+    except ValueError:
+        raise ValueError("max_lag must be an integer")
+    if not 0 <= max_lag <= MAX_LAG_LIMIT:
+        raise ValueError(f"max_lag must be between 0 and {MAX_LAG_LIMIT}")
+    return max_lag
+
+
+def plan_analytics(db, args, engine, use_rollups, archive=None):
+    """The planner's bucketed plan for all three sources at the requested
+    resolution; invalid values raise ValueError."""
+    resolution = parse_analytics_resolution(args)
+    if not (use_rollups and engine == "pipeline"):
+        return plan_request(db, {**args, "resolution": resolution}, ANALYTICS_SOURCES, ANALYTICS_SPAN, engine,
+                            use_rollups, archive=archive)
+
+    # The rollups answer without the raw readings, so they aren't counted; should
+    # the worker never have run, they are taken to be too many to bucket here
+    start, end = parse_range(args, ANALYTICS_SPAN)
+    plan = plan_history(PYTHON_BUCKET_LIMIT + 1, start, end, resolution, engine=engine, use_rollups=True)
+    plan["archive"], plan["archived"] = archive, archive.archived(db, ANALYTICS_SOURCES, start) if archive else {}
+    return plan
+
+
+def _round(value):
+    # Adding 0.0 turns -0.0 into 0.0
+    return None if value is None or np.isnan(value) else round(float(value), 2) + 0.0
+
+
+def _on_axis(axis, minutes, values):
+    # A series' bucket means as a float array on the shared axis, NaN in its gaps
+    column = np.full(len(axis), np.nan)
+    column[np.searchsorted(axis, minutes)] = to_float(values)
+    return column
+
+
+def degree_days(minutes, temperature, base=DEFAULT_BASE):
+    """Heating and cooling degree-days per local day from bucket means.
+
+    A day's mean is the mean of its buckets; heating is how far it falls
+    below ``base`` and cooling how far it rises above.
+    """
+    ok = ~np.isnan(temperature)
+    days, index = np.unique(bucket_minutes(minutes[ok], "1d"), return_inverse=True)
+    counts = np.bincount(index, minlength=len(days))
+    means = np.bincount(index, weights=temperature[ok], minlength=len(days)) / np.maximum(counts, 1)
+    heating = np.maximum(base - means, 0)
+    cooling = np.maximum(means - base, 0)
+    return {
+        "base": base,
+        "heating": _round(heating.sum()),
+        "cooling": _round(cooling.sum()),
+        "days": [
+            {"date": key[:10], "mean": _round(mean), "heating": _round(hdd), "cooling": _round(cdd), "buckets": int(count)}
+            for key, mean, hdd, cdd, count in zip(format_minute_keys(days), means, heating, cooling, counts)
+        ]
+    }
+
+
+def lagged_correlation(x, y, max_lag):
+    """Pearson correlation of ``x[t]`` with ``y[t + lag]`` for each lag from 0
+    to ``max_lag`` buckets, over the pairs where both are present; NaN where
+    there are too few pairs or either side is constant."""
+    result = np.full(max_lag + 1, np.nan)
+    for lag in range(min(max_lag, len(x) - 1) + 1):
+        a, b = x[:len(x) - lag], y[lag:]
+        ok = ~(np.isnan(a) | np.isnan(b))
+        if ok.sum() < MIN_PAIRS:
+            continue
+        a = a[ok] - a[ok].mean()
+        b = b[ok] - b[ok].mean()
+        scale = np.sqrt((a * a).sum() * (b * b).sum())
+        if scale > 0:
+            result[lag] = (a * b).sum() / scale
+    return result
+
+
+def room_correlations(outside, rooms, max_lag, bucket_hours):
+    """``{room: {lag0, best_lag_hours, best, by_lag}}`` between the outside
+    temperature and each room's; ``best`` is the strongest positive
+    correlation, and its lag how far the room trails the outside."""
+    correlations = {}
+    for name, temperature in rooms.items():
+        by_lag = lagged_correlation(outside, temperature, max_lag)
+        best = int(np.nanargmax(by_lag)) if not np.isnan(by_lag).all() else None
+        correlations[name] = {
+            "lag0": _round(by_lag[0]),
+            "best_lag_hours": best * bucket_hours if best is not None else None,
+            "best": _round(by_lag[best]) if best is not None else None,
+            "by_lag": [_round(r) for r in by_lag]
+        }
+    return correlations
+
+
+def ac_runtime(outside, inside, bucket_hours):
+    """AC runtime against the outside-inside temperature difference.
+
+    ``sensibo_logs`` records no power state, so runtime is inferred: a
+    bucket counts as running when the AC room's temperature moved away from
+    the outside temperature by more than RUNTIME_THRESHOLD before the next
+    bucket, which a house left alone rarely does. Buckets are banded by the
+    size of the difference; ``runtime_pct_per_degree`` is the slope of the
+    running share (in percent) against it, so a unit that holds the house
+    with less runtime per degree of difference is the more efficient one.
+    """
+    delta_t = outside[:-1] - inside[:-1]
+    change = np.diff(inside)
+    ok = ~(np.isnan(delta_t) | np.isnan(change))
+    delta_t, change = delta_t[ok], change[ok]
+    # Moving against the gradient: cooling while it's warmer outside, heating while colder
+    running = change * np.sign(delta_t) < -RUNTIME_THRESHOLD
+    gap = np.abs(delta_t)
+
+    bands = []
+    if len(gap):
+        band = (gap // DELTA_T_BAND).astype(np.int64)
+        counts = np.bincount(band)
+        running_counts = np.bincount(band, weights=running)
+        rates = np.bincount(band, weights=np.where(running, np.abs(change), 0)) / np.maximum(running_counts, 1)
+        for i in np.flatnonzero(counts):
+            bands.append({
+                "delta_t": f"{i * DELTA_T_BAND}-{(i + 1) * DELTA_T_BAND}",
+                "hours": _round(counts[i] * bucket_hours),
+                "runtime_hours": _round(running_counts[i] * bucket_hours),
+                "runtime_share": _round(running_counts[i] / counts[i]),
+                # °F per hour the room was pulled away from the outside while running
+                "rate": _round(rates[i] / bucket_hours) if running_counts[i] else None
+            })
+
+    slope = np.polyfit(gap, running.astype(float), 1)[0] if len(gap) >= MIN_PAIRS and np.ptp(gap) > 0 else np.nan
+    return {
+        "hours": _round(len(gap) * bucket_hours),
+        "runtime_hours": _round(running.sum() * bucket_hours),
+        "runtime_share": _round(running.mean()) if len(gap) else None,
+        "mean_delta_t": _round(delta_t.mean()) if len(gap) else None,
+        "runtime_pct_per_degree": _round(slope * 100) if not np.isnan(slope) else None,
+        "by_delta_t": bands
+    }
+
+
+def distribution(values):
+    """Min, mean, max and PERCENTILES of the present values; None when there are none."""
+    values = values[~np.isnan(values)]
+    if not len(values):
+        return None
+    points = np.percentile(values, PERCENTILES)
+    return {
+        "min": _round(values.min()),
+        **{f"p{p}": _round(point) for p, point in zip(PERCENTILES, points)},
+        "max": _round(values.max()),
+        "mean": _round(values.mean())
+    }
+
+
+def analytics_payload(weather, ac, rooms, resolution, base=DEFAULT_BASE, max_lag=DEFAULT_MAX_LAG):
+    """The ``/api/analytics`` metrics from ``planner.read_buckets`` output of each source.
+
+    ``max_lag`` is in hours; it is tried at the resolution's bucket width.
+    """
+    bucket_hours = RESOLUTIONS[resolution] / 60
+    room_names = sorted(name for name in rooms if name is not None)
+    series = [weather.get(None), ac.get(None), *(rooms[name] for name in room_names)]
+    present = [minutes for minutes, _ in filter(None, series)]
+    axis = np.unique(np.concatenate(present)) if present else np.empty(0, dtype=np.int64)
+
+    def column(buckets, field):
+        if not buckets:
+            return np.full(len(axis), np.nan)
+        minutes, columns = buckets
+        return _on_axis(axis, minutes, columns[field])
+
+    with span("align"):
+        outside = column(weather.get(None), "temperature")
+        inside = column(ac.get(None), "temperature")
+        temperatures = {name: column(rooms[name], "temperature") for name in room_names}
+        humidities = {name: column(rooms[name], "humidity") for name in room_names}
+
+        return {
+            "resolution": resolution,
+            "buckets": len(axis),
+            "degree_days": degree_days(axis, outside, base),
+            "correlation": room_correlations(outside, temperatures, int(max_lag / bucket_hours), bucket_hours),
+            "ac_runtime": ac_runtime(outside, inside, bucket_hours),
+            "percentiles": {
+                name: {"temperature": distribution(temperatures[name]), "humidity": distribution(humidities[name])}
+                for name in room_names
+            }
+        }
+
+
+def read_analytics(db, plan, base=DEFAULT_BASE, max_lag=DEFAULT_MAX_LAG):
+    """``analytics_payload`` over the planned range, with the range it covers."""
+    buckets = {source: read_buckets(db, source, plan) for source in ANALYTICS_SOURCES}
+    return {
+        "start": plan["start"].isoformat(),
+        "end": plan["end"].isoformat(),
+        "strategy": plan["strategy"],
+        **analytics_payload(buckets["weather"], buckets["ac"], buckets["room"], plan["resolution"], base, max_lag)
+    }
@@ -1,11 +1,65 @@
-from flask import Flask, render_template, jsonify
-from pymongo import MongoClient
+from flask import Flask, Response, g, render_template, jsonify, request, stream_with_context
+from flask.json.provider import DefaultJSONProvider
 from datetime import datetime, timedelta
 import os
 from dotenv import load_dotenv
 import logging
 import pytz
 
+from alignment import build_combined_data, combined_columns, with_timestamps
+from analytics import parse_base, parse_max_lag, plan_analytics, read_analytics
+from archive import EXPORT_FORMATS, ParquetArchive, export_batches, iter_export, parse_export_format, parse_export_source
+from cache import SharedCache, TTLCache, cached_view
+from columnar import MIMETYPE as COLUMNAR_MIMETYPE, pack_combined
+from conditional import conditional_view, is_fallback_room, latest_timestamps
+from database import MongoConnection, history_read_preference
+from json_stream import json_body
+from indexes import ensure_indexes, verify_query_plans
+from live import DEFAULT_CAPACITY as LIVE_DEFAULT_CAPACITY, MAX_SILENCE as LIVE_DEFAULT_MAX_SILENCE, LiveWindows, window_summary
+from metrics import (
+    MetricsRegistry,
+    PoolStats,
+    begin_request,
+    cache_gauges,
+    end_request,
+    format_request_line,
+    span,
+    timed_cursor,
+    timed_fetch
+)
+from planner import combined_history, parse_range, plan_request, range_requested, room_history, row_budget, weather_history
+from pipelines import combined_pipelines, latest_per_room_pipeline, room_hourly_pipeline, rooms_history_pipeline
+from rollups import pick_resolution, read_history, read_room_histories, summarize
+from snapshots import DEFAULT_INTERVAL as SNAPSHOT_DEFAULT_INTERVAL, read_snapshot, snapshot_name, snapshot_view, start_snapshot_worker
+from stream import ReadingBroadcaster, format_sse
+from views import (
+    EST,
+    current_conditions_payload,
+    current_weather_payload,
+    hourly_pipeline_payload,
+    hourly_room_averages,
+    iter_weather_records,
+    log_combined_fetch,
+    log_combined_summary,
+    log_separator,
+    parse_bucket,
+    parse_engine,
+    parse_format,
+    parse_max_points,
+    parse_rooms,
+    parse_since,
+    parse_stream,
+    pipeline_room_series,
+    rollup_history_payload,
+    rollup_room_series,
+    room_history_payload,
+    rooms_history_payload,
+    summary_room_series,
+    WEATHER_PROJECTION,
+    weather_records,
+    window_start as history_window_start
+)
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -14,260 +68,303 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Define timezone
-EST = pytz.timezone('America/New_York')
-
-# Function to convert UTC to EST
-def convert_to_est(utc_dt):
-    try:
-        if isinstance(utc_dt, str):
-            try:
-                utc_dt = datetime.fromisoformat(utc_dt.replace("Z", "+00:00"))
-            except Exception as e:
-                logger.error(f"❌ Error parsing timestamp string: {utc_dt}")
-                logger.error(f"   └─ Error details: {str(e)}")
-                raise
-        
-        if not utc_dt.tzinfo:
-            utc_dt = pytz.utc.localize(utc_dt)
-        est_dt = utc_dt.astimezone(EST)
-        return est_dt
-    except Exception as e:
-        logger.error(f"❌ Error converting to EST: {str(e)}")
-        logger.error(f"   └─ Input datetime: {utc_dt}")
-        raise
-
 # Load environment variables
 load_dotenv()
 
+class TimedJSONProvider(DefaultJSONProvider):
+    # jsonify() writes json_body(), like the snapshots and the ASGI app (even
+    # under debug=True, which would otherwise indent); its time shows up as
+    # the "serialize" stage of every route
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        with span("serialize"):
+            body = json_body(obj, default=self.default)
+        return self._app.response_class(body, mimetype=self.mimetype)
+
 app = Flask(__name__)
+app.json = TimedJSONProvider(app)
 
 # MongoDB connection - use environment variable for connection string
 MONGO_URI = os.getenv('MONGO_URI', 'mongodb://10.0.1.252:27017/')
+# Serve bucketed history from the rollup collections when the worker has populated them
+USE_ROLLUPS = os.getenv('USE_ROLLUPS', 'true').lower() == 'true'
+# "pipeline" buckets inside MongoDB; "python" keeps the original in-app loops for comparison
+AGGREGATION_ENGINE = os.getenv('AGGREGATION_ENGINE', 'pipeline')
+# Create the indexes the routes rely on when the app starts
+ENSURE_INDEXES = os.getenv('ENSURE_INDEXES', 'true').lower() == 'true'
+
+# Stream large JSON bodies batch by batch instead of building them whole (per-request ?stream= overrides)
+STREAM_RESPONSES = os.getenv('STREAM_RESPONSES', 'false').lower() == 'true'
+# Documents per cursor batch when streaming; bounds the memory one response holds
+STREAM_BATCH_SIZE = int(os.getenv('STREAM_BATCH_SIZE', '1000'))
+
+# Rows a ?start=&end= history response may hold, whatever the range; long ranges are bucketed to fit
+HISTORY_ROW_BUDGET = int(os.getenv('HISTORY_ROW_BUDGET', '1500'))
+
+# Answer the shared dashboard routes from pre-built snapshots no older than this many seconds (0 disables)
+SNAPSHOT_MAX_AGE = int(os.getenv('SNAPSHOT_MAX_AGE', '180'))
+# Build the snapshots on a thread of this process instead of running `python snapshots.py --interval`
+SNAPSHOT_WORKER = os.getenv('SNAPSHOT_WORKER', 'false').lower() == 'true'
+SNAPSHOT_INTERVAL = int(os.getenv('SNAPSHOT_INTERVAL', str(SNAPSHOT_DEFAULT_INTERVAL)))
+
+# Parquet archive that `python archive.py` moves old readings into; ranged history and /api/export read it
+ARCHIVE_DIR = os.getenv('ARCHIVE_DIR', 'archive')
+archive = ParquetArchive(ARCHIVE_DIR) if ARCHIVE_DIR else None
+
+# Seconds between keepalive comments on idle /api/stream connections
+STREAM_KEEPALIVE = 15
+
+# Keep rolling 1 h / 24 h windows of every sensor in memory, loaded on connect and fed by the
+# reading watcher, so /api/current-conditions and /api/summary answer without querying MongoDB
+LIVE_WINDOWS = os.getenv('LIVE_WINDOWS', 'false').lower() == 'true'
+# Readings each sensor's ring buffer holds; memory is fixed per sensor (live.sensor_bytes)
+LIVE_CAPACITY = int(os.getenv('LIVE_CAPACITY', str(LIVE_DEFAULT_CAPACITY)))
+LIVE_MAX_SILENCE = float(os.getenv('LIVE_MAX_SILENCE', str(LIVE_DEFAULT_MAX_SILENCE)))
+live_windows = LiveWindows(LIVE_CAPACITY) if LIVE_WINDOWS else None
+
+# Response cache shared by all clients; TTLs follow each source's reporting cadence.
+# With SHARED_CACHE_PATH (gunicorn.conf.py sets it) every worker process shares it through that file
+CACHE_MAX_ENTRIES = int(os.getenv('CACHE_MAX_ENTRIES', '256'))
+SHARED_CACHE_PATH = os.getenv('SHARED_CACHE_PATH')
+if SHARED_CACHE_PATH:
+    response_cache = SharedCache(SHARED_CACHE_PATH, max_size=CACHE_MAX_ENTRIES)
+else:
+    response_cache = TTLCache(max_size=CACHE_MAX_ENTRIES)
+CACHE_TTLS = {
+    "current_conditions": 30,
+    "combined_data": 60,
+    "room_data": 60,
+    "weather_data": 300,
+    "current_weather": 60,
+    "analytics": 300,
+    "summary": 30
+}
+# Per-route latency and stage histograms plus pool counters, served at /metrics
+metrics_registry = MetricsRegistry()
+pool_stats = PoolStats()
+
+# Runs each time MongoDB becomes reachable, so indexes also get created after an outage at startup
+def on_connect(db):
+    if ENSURE_INDEXES:
+        ensure_indexes(db)
+    # Reload the windows: readings written while MongoDB was unreachable never reached the watcher
+    if live_windows:
+        live_windows.warm(db)
+
 try:
-    client = MongoClient(MONGO_URI)
-    # Test the connection
-    client.server_info()
-    logger.info("Successfully connected to MongoDB")
-    db = client["sensordata"]
-    weather_collection = db["weatherData"]
+    # The client connects lazily; requests check db_available(), which retries with backoff
+    mongo = MongoConnection(MONGO_URI, [pool_stats], history_read_preference(), [on_connect])
+    db = mongo.db
     weather_collection = db["weatherData"]
     sensibo_collection = db["sensibo_logs"]
     temp_logs_collection = db["temperature_logs"]
-    logger.info("Connected to all collections successfully")
+    # History routes may read from secondaries (MONGO_HISTORY_READ_PREFERENCE)
+    history_db = mongo.history_db
+    weather_history_collection = history_db["weatherData"]
+    sensibo_history_collection = history_db["sensibo_logs"]
+    temp_logs_history_collection = history_db["temperature_logs"]
+    # One shared watcher feeds every /api/stream client
+    broadcaster = ReadingBroadcaster(
+        db,
+        max_queue=int(os.getenv('STREAM_QUEUE_SIZE', '100')),
+        max_clients=int(os.getenv('STREAM_MAX_CLIENTS', '500'))
+    )
+    if live_windows:
+        broadcaster.add_listener(live_windows.add_reading)
+    if SNAPSHOT_WORKER:
+        # One build per interval across the gunicorn workers sharing the cache file
+        start_snapshot_worker(db, SNAPSHOT_INTERVAL, AGGREGATION_ENGINE, response_cache.claim)
+    mongo.connect_in_background()
 except Exception as e:
-    logger.error(f"Failed to connect to MongoDB: {str(e)}")
-    client = None
+    # Only a malformed MONGO_URI or setting gets here; an unreachable server is retried
+    logger.error(f"Failed to configure MongoDB: {str(e)}")
+    mongo = None
+
+# Whether MongoDB answered its last health check (re-checked lazily, with backoff while it is down)
+def db_available():
+    return mongo is not None and mongo.available()
+
+# Parse the optional max_points query parameter shared by the history routes
+def get_max_points():
+    return parse_max_points(request.args)
+
+# Pick the aggregation engine, allowing a per-request ?engine= override
+def get_engine():
+    return parse_engine(request.args, AGGREGATION_ENGINE)
+
+# Parse the optional since cursor (the "cursor" value of an earlier response)
+def get_since():
+    return parse_since(request.args)
+
+# Data version of a route: the latest timestamp of each source it reads (None skips validation).
+# History routes read it where they read their data, so it never runs ahead of a lagging secondary.
+def data_versions(*sources, room=None, history=False):
+    if not db_available():
+        return None
+    with span("validate"):
+        return latest_timestamps(history_db if history else db, sources, room)
+
+# data_versions of /api/room-data, plus every room's when the room is answered with the fallback
+def room_data_versions(room_name):
+    versions = data_versions("room", room=room_name, history=True)
+    if versions is not None and is_fallback_room(versions):
+        versions["fallback"] = data_versions("room", history=True)["room"]
+    return versions
+
+# Whether the in-memory windows can answer (LIVE_WINDOWS): loaded, fed by a healthy
+# watcher and not silent for LIVE_MAX_SILENCE seconds; otherwise the routes read MongoDB
+def live_ready():
+    return (live_windows is not None and broadcaster is not None and broadcaster.healthy()
+            and live_windows.fresh(LIVE_MAX_SILENCE))
+
+# data_versions of the latest readings, from the windows when they answer
+def live_versions(*sources):
+    if live_ready():
+        return live_windows.latest_timestamps(sources)
+    return data_versions(*sources)
+
+# Plan a ?start=&end=&resolution= request: raw readings or buckets, within the row budget
+def get_history_plan(sources, default_span, max_points=None, room=None):
+    return plan_request(history_db, request.args, sources, default_span, get_engine(), USE_ROLLUPS,
+                        row_budget(HISTORY_ROW_BUDGET, max_points), room, archive)
+
+# The fresh snapshot that answers this request, or None to compute it live
+def current_snapshot(route):
+    if SNAPSHOT_MAX_AGE <= 0 or not db_available():
+        return None
+    name = snapshot_name(route, request.args, request.headers.get("Accept"))
+    if name is None:
+        return None
+    with span("query"):
+        return read_snapshot(db, name, SNAPSHOT_MAX_AGE)
+
+# Whether to stream this response; downsampled and ranged payloads are small, so they stay buffered (and cached)
+def stream_requested():
+    try:
+        return (parse_stream(request.args, STREAM_RESPONSES) and get_max_points() is None
+                and not range_requested(request.args))
+    except ValueError:
+        return False
+
+# Negotiated response format, from ?format= or the Accept header; a bad value gets a 400 from the view
+def get_format():
+    return parse_format(request.args, request.headers.get("Accept"))
 
-# Add a separator function for cleaner logs
-def log_separator(message=""):
-    logger.info("=" * 50)
-    if message:
-        logger.info(message)
-        logger.info("=" * 50)
+def response_variant():
+    try:
+        return get_format()
+    except ValueError:
+        return None
+
+# Send JSON chunks as they are produced. The status line is already out by the
+# time a chunk fails, so the error is logged and the body is cut short.
+def stream_json(chunks, name):
+    def generate():
+        try:
+            yield from chunks
+        except Exception as e:
+            logger.error(f"❌ Error streaming {name}: {str(e)}")
+    return Response(stream_with_context(generate()), mimetype="application/json")
+
+# Room history payload; the cursor is the last bucket, which clients send back as since
+def room_history_response(timestamps, temperature, humidity):
+    return jsonify(room_history_payload(timestamps, temperature, humidity, request.args.get("since")))
+
+@app.before_request
+def start_request_timer():
+    route = request.url_rule.rule if request.url_rule else "unmatched"
+    g.request_timings, g.request_timings_token = begin_request(route)
+
+@app.after_request
+def record_request(response):
+    timings = getattr(g, "request_timings", None)
+    if timings is not None:
+        duration = metrics_registry.observe(timings, response.status_code)
+        # The one INFO line per request; route details are at DEBUG
+        logger.info(format_request_line(request.method, request.full_path.rstrip("?"), response.status_code, duration, timings))
+    return response
+
+@app.teardown_request
+def stop_request_timer(error=None):
+    token = g.pop("request_timings_token", None)
+    if token is not None:
+        end_request(token)
+
+@app.route("/metrics")
+def metrics():
+    gauges = {**cache_gauges(response_cache.stats()), **pool_stats.gauges()}
+    if mongo:
+        gauges.update(mongo.gauges())
+        gauges["dashboard_stream_clients"] = ("gauge", "Connected /api/stream clients.", broadcaster.stats()["clients"])
+    if live_windows:
+        gauges["dashboard_live_window_bytes"] = ("gauge", "Memory held by the in-memory sensor windows.",
+                                                 live_windows.stats()["bytes"])
+    return Response(metrics_registry.render(gauges, pool_stats.histograms()), mimetype="text/plain; version=0.0.4")
 
 @app.route("/")
 def index():
     return render_template("index.html")
 
 @app.route("/api/combined-data")
+@conditional_view(lambda: data_versions("weather", "ac", "room", history=True))
+@snapshot_view(lambda: current_snapshot("combined_data"), vary="Accept")
+@cached_view(response_cache, CACHE_TTLS["combined_data"], variant=response_variant)
 def combined_data():
     try:
         log_separator("🔄 Starting Data Fetch")
-        if not client:
+        if not db_available():
             logger.error("❌ No MongoDB connection available")
             return jsonify({"error": "Database connection not available"}), 500
 
-        # Get the last 24 hours of data in EST
-        twenty_four_hours_ago = datetime.now(EST) - timedelta(hours=24)
-        logger.info(f"Fetching data since: {twenty_four_hours_ago.isoformat()}")
-
-        # Get weather data - convert the EST time back to UTC for query
-        weather_query = {
-            "Time Stamp": {
-                "$gte": twenty_four_hours_ago.astimezone(pytz.UTC).isoformat()
-            }
-        }
-        weather_data = list(weather_collection.find(weather_query).sort("Time Stamp", 1))
-        weather_status = "✅" if len(weather_data) > 0 else "⚠️"
-        logger.info(f"{weather_status} Weather Data: {len(weather_data)} points")
-        if len(weather_data) > 0:
-            logger.info(f"   └─ First weather timestamp: {weather_data[0].get('Time Stamp')}")
-            logger.info(f"   └─ Last weather timestamp: {weather_data[-1].get('Time Stamp')}")
-
-        # Get AC data - convert the EST time back to UTC for query
-        ac_query = {
-            "Timestamp": {
-                "$gte": twenty_four_hours_ago.astimezone(pytz.UTC).isoformat()
-            }
-        }
-        ac_data = list(sensibo_collection.find(ac_query).sort("Timestamp", 1))
-        ac_status = "✅" if len(ac_data) > 0 else "⚠️"
-        logger.info(f"{ac_status} AC Data: {len(ac_data)} points")
-        if len(ac_data) > 0:
-            logger.info(f"   └─ First AC timestamp: {ac_data[0].get('Timestamp')}")
-            logger.info(f"   └─ Last AC timestamp: {ac_data[-1].get('Timestamp')}")
-
-        # Get room temperature data - convert the EST time back to UTC for query
-        room_query = {
-            "Timestamp": {
-                "$gte": twenty_four_hours_ago.astimezone(pytz.UTC).isoformat()
-            }
-        }
-        room_data = list(temp_logs_collection.find(room_query).sort("Timestamp", 1))
-        room_status = "✅" if len(room_data) > 0 else "⚠️"
-        logger.info(f"{room_status} Room Data: {len(room_data)} points")
-        if len(room_data) > 0:
-            logger.info(f"   └─ First room timestamp: {room_data[0].get('Timestamp')}")
-            logger.info(f"   └─ Last room timestamp: {room_data[-1].get('Timestamp')}")
-            logger.info(f"   └─ Sample room data: {room_data[0]}")
-
-        # Process and combine the data
-        processed_data = {
-            "timestamps": [],
-            "outside_temp": [],
-            "outside_feels_like": [],
-            "outside_humidity": [],
-            "ac_temp": [],
-            "ac_humidity": [],
-            "ac_feels_like": [],
-            "room_temps": {},
-            "room_humidity": {}
-        }
-
-        # Create a set of all unique timestamps
-        all_timestamps = set()
-
-        # Process weather data
-        logger.info("📊 Processing weather data...")
-        weather_points = {}
-        for doc in weather_data:
-            try:
-                time_str = doc.get("Time Stamp")
-                if isinstance(time_str, str):
-                    # Parse the timestamp and convert to EST
-                    time = datetime.fromisoformat(time_str.replace("Z", "+00:00"))
-                    est_time = convert_to_est(time)
-                    time_key = est_time.strftime("%Y-%m-%d %H:%M")
-                    all_timestamps.add(time_key)
-                    weather_points[time_key] = {
-                        "temp": doc.get("Current Temperature"),
-                        "feels_like": doc.get("Feels Like"),
-                        "humidity": doc.get("Humidity")
-                    }
-                    logger.debug(f"   └─ Processed weather point: {time_key}")
-            except Exception as e:
-                logger.error(f"Error processing weather point: {str(e)}")
-                continue
-
-        # Process AC data
-        logger.info("📊 Processing AC data...")
-        ac_points = {}
-        for doc in ac_data:
-            try:
-                timestamp = doc.get("Timestamp")
-                if timestamp:
-                    # Parse the timestamp and convert to EST
-                    time = datetime.fromisoformat(timestamp.replace("Z", "+00:00"))
-                    est_time = convert_to_est(time)
-                    time_key = est_time.strftime("%Y-%m-%d %H:%M")
-                    all_timestamps.add(time_key)
-                    ac_points[time_key] = {
-                        "temp": doc.get("Temperature"),
-                        "humidity": doc.get("Humidity"),
-                        "feels_like": doc.get("Feels Like")
-                    }
-                    logger.debug(f"   └─ Processed AC point: {time_key}")
-            except Exception as e:
-                logger.error(f"Error processing AC point: {str(e)}")
-                continue
-
-        # Process room temperature data
-        logger.info("📊 Processing room temperature data...")
-        room_points = {}
-        for doc in room_data:
-            try:
-                timestamp = doc.get("Timestamp")
-                if timestamp:
-                    # Parse the timestamp and convert to EST
-                    time = datetime.fromisoformat(timestamp.replace("Z", "+00:00"))
-                    est_time = convert_to_est(time)
-                    time_key = est_time.strftime("%Y-%m-%d %H:%M")
-                    all_timestamps.add(time_key)
-                    
-                    room_name = doc.get("Room")
-                    if room_name:
-                        if room_name not in room_points:
-                            room_points[room_name] = {}
-                        room_points[room_name][time_key] = {
-                            "temp": float(doc.get("Temperature")),
-                            "humidity": float(doc.get("Humidity"))
-                        }
-                        logger.debug(f"   └─ Processed room point: {room_name} at {time_key}")
-            except Exception as e:
-                logger.error(f"Error processing room point: {str(e)}")
-                continue
-
-        # Sort timestamps
-        sorted_timestamps = sorted(list(all_timestamps))
-        processed_data["timestamps"] = sorted_timestamps
-
-        # Initialize room data arrays
-        for room_name in room_points:
-            processed_data["room_temps"][room_name] = []
-            processed_data["room_humidity"][room_name] = []
-
-        # Fill in data points
-        for ts in sorted_timestamps:
-            # Weather data
-            if ts in weather_points:
-                processed_data["outside_temp"].append(weather_points[ts]["temp"])
-                processed_data["outside_feels_like"].append(weather_points[ts]["feels_like"])
-                processed_data["outside_humidity"].append(weather_points[ts]["humidity"])
-            else:
-                processed_data["outside_temp"].append(None)
-                processed_data["outside_feels_like"].append(None)
-                processed_data["outside_humidity"].append(None)
-
-            # AC data
-            if ts in ac_points:
-                processed_data["ac_temp"].append(ac_points[ts]["temp"])
-                processed_data["ac_humidity"].append(ac_points[ts]["humidity"])
-                processed_data["ac_feels_like"].append(ac_points[ts]["feels_like"])
-            else:
-                processed_data["ac_temp"].append(None)
-                processed_data["ac_humidity"].append(None)
-                processed_data["ac_feels_like"].append(None)
-
-            # Room data
-            for room_name in room_points:
-                if ts in room_points[room_name]:
-                    processed_data["room_temps"][room_name].append(room_points[room_name][ts]["temp"])
-                    processed_data["room_humidity"][room_name].append(room_points[room_name][ts]["humidity"])
-                else:
-                    processed_data["room_temps"][room_name].append(None)
-                    processed_data["room_humidity"][room_name].append(None)
+        try:
+            max_points = get_max_points()
+            engine = get_engine()
+            cursor = get_since()
+            binary = get_format() == "binary"
+            ranged = range_requested(request.args)
+            plan = get_history_plan(("weather", "ac", "room"), timedelta(hours=24), max_points) if ranged else None
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        if plan:
+            # An explicit range: raw minutes or buckets, at most the row budget of them
+            columns = combined_history(history_db, plan)
+            if binary:
+                with span("serialize"):
+                    return Response(pack_combined(columns), mimetype=COLUMNAR_MIMETYPE)
+            return jsonify(with_timestamps(columns))
+
+        # Get the last 24 hours of data in EST, or only the rows from the since cursor onwards
+        window_start = history_window_start(timedelta(hours=24), cursor)
+        since = window_start.astimezone(pytz.UTC).isoformat()
+        logger.debug(f"Fetching data since: {window_start.isoformat()} ({engine} engine)")
+
+        if engine == "pipeline":
+            # Only the last reading of each minute, with only the charted fields, leaves the server
+            pipelines = combined_pipelines(since)
+            weather_data = timed_fetch(lambda: weather_history_collection.aggregate(pipelines["weatherData"]))
+            ac_data = timed_fetch(lambda: sensibo_history_collection.aggregate(pipelines["sensibo_logs"]))
+            room_data = timed_fetch(lambda: temp_logs_history_collection.aggregate(pipelines["temperature_logs"]))
+        else:
+            weather_data = timed_fetch(lambda: weather_history_collection.find({"Time Stamp": {"$gte": since}}).sort("Time Stamp", 1))
+            ac_data = timed_fetch(lambda: sensibo_history_collection.find({"Timestamp": {"$gte": since}}).sort("Timestamp", 1))
+            room_data = timed_fetch(lambda: temp_logs_history_collection.find({"Timestamp": {"$gte": since}}).sort("Timestamp", 1))
+
+        log_combined_fetch(weather_data, ac_data, room_data)
+
+        # Align all sources onto a shared minute axis
+        logger.debug("📊 Aligning weather, AC and room data...")
+        if binary:
+            # Typed columns with NaN gaps and delta-encoded minutes, decoded by dashboard.js
+            columns = combined_columns(weather_data, ac_data, room_data, max_points)
+            with span("serialize"):
+                body = pack_combined(columns)
+            log_separator("✨ Request Complete")
+            return Response(body, mimetype=COLUMNAR_MIMETYPE)
+        processed_data = build_combined_data(weather_data, ac_data, room_data, max_points)
 
         # Log data summary
-        log_separator("📈 Data Summary")
-        logger.info(f"⏰ Total timestamps: {len(processed_data['timestamps'])}")
-        logger.info(f"📅 Time range: {processed_data['timestamps'][0]} to {processed_data['timestamps'][-1]}")
-        
-        if len(processed_data['outside_temp']) > 0:
-            outside_temps = list(filter(None, processed_data['outside_temp']))
-            if outside_temps:
-                logger.info(f"🌡️ Outside temp range: {min(outside_temps)}°F to {max(outside_temps)}°F")
-        
-        if len(processed_data['ac_temp']) > 0:
-            ac_temps = list(filter(None, processed_data['ac_temp']))
-            if ac_temps:
-                logger.info(f"❄️ AC temp range: {min(ac_temps)}°F to {max(ac_temps)}°F")
-
-        # Log room data summary
-        for room_name in processed_data["room_temps"]:
-            room_temps = list(filter(None, processed_data["room_temps"][room_name]))
-            if room_temps:
-                logger.info(f"🏠 {room_name} temp range: {min(room_temps)}°F to {max(room_temps)}°F")
+        log_combined_summary(processed_data)
         
         log_separator("✨ Request Complete")
         return jsonify(processed_data)
@@ -276,139 +373,108 @@ def combined_data():
         return jsonify({"error": str(e)}), 500
 
 @app.route("/api/current-conditions")
+@conditional_view(lambda: live_versions("weather", "ac", "room"))
+@snapshot_view(lambda: None if live_ready() else current_snapshot("current_conditions"))
+@cached_view(response_cache, CACHE_TTLS["current_conditions"])
 def current_conditions():
     try:
-        if not client:
+        if live_ready():
+            return jsonify(live_windows.current_conditions())
+
+        if not db_available():
             return jsonify({"error": "Database connection not available"}), 500
 
-        # Get latest weather data
-        latest_weather = weather_collection.find_one(sort=[("Time Stamp", -1)])
-        
-        # Get latest AC data
-        latest_ac = sensibo_collection.find_one(sort=[("Timestamp", -1)])
+        with span("query"):
+            # Get latest weather data
+            latest_weather = weather_collection.find_one(sort=[("Time Stamp", -1)])
+
+            # Get latest AC data
+            latest_ac = sensibo_collection.find_one(sort=[("Timestamp", -1)])
 
         # Get latest room data for each room
-        room_data = {}
-        pipeline = [
-            {
-                "$sort": {"Timestamp": -1}
-            },
-            {
-                "$group": {
-                    "_id": "$Room",
-                    "latest": {"$first": "$$ROOT"}
-                }
-            }
-        ]
-        latest_rooms = list(temp_logs_collection.aggregate(pipeline))
-        
-        for room in latest_rooms:
-            room_name = room["_id"]
-            latest = room["latest"]
-            room_data[room_name] = {
-                "temperature": float(latest.get("Temperature")),
-                "humidity": float(latest.get("Humidity")),
-                "timestamp": latest.get("Timestamp")
-            }
+        latest_rooms = timed_fetch(lambda: temp_logs_collection.aggregate(latest_per_room_pipeline()))
 
         # Prepare response
-        response = {
-            "outside": {
-                "temperature": latest_weather.get("Current Temperature") if latest_weather else None,
-                "feels_like": latest_weather.get("Feels Like") if latest_weather else None,
-                "humidity": latest_weather.get("Humidity") if latest_weather else None,
-                "description": latest_weather.get("Description") if latest_weather else None,
-                "icon": latest_weather.get("Icon") if latest_weather else None,
-                "timestamp": latest_weather.get("Time Stamp") if latest_weather else None
-            },
-            "ac": {
-                "temperature": latest_ac.get("Temperature") if latest_ac else None,
-                "feels_like": latest_ac.get("Feels Like") if latest_ac else None,
-                "humidity": latest_ac.get("Humidity") if latest_ac else None,
-                "timestamp": latest_ac.get("Timestamp") if latest_ac else None
-            },
-            "rooms": room_data
-        }
+        response = current_conditions_payload(latest_weather, latest_ac, latest_rooms)
 
         return jsonify(response)
     except Exception as e:
         logger.error(f"Error in current_conditions: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
+@app.route("/api/summary")
+@conditional_view(lambda: live_versions("weather", "ac", "room"))
+@cached_view(response_cache, CACHE_TTLS["summary"])
+def summary():
+    try:
+        if live_ready():
+            return jsonify(live_windows.summary())
+
+        if not db_available():
+            return jsonify({"error": "Database connection not available"}), 500
+
+        # Without resident windows, build them from the last 24 hours for this response
+        with span("query"):
+            return jsonify(window_summary(db, LIVE_CAPACITY))
+    except Exception as e:
+        logger.error(f"❌ Error in summary endpoint: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
 @app.route("/api/weather-data")
+@conditional_view(lambda: data_versions("weather", history=True))
+@cached_view(response_cache, CACHE_TTLS["weather_data"], bypass=stream_requested)
 def weather_data():
     try:
-        if not client:
+        if not db_available():
             logger.error("No MongoDB connection available")
             return jsonify({"error": "Database connection not available"}), 500
 
+        try:
+            max_points = get_max_points()
+            ranged = range_requested(request.args)
+            streaming = parse_stream(request.args, STREAM_RESPONSES) and max_points is None and not ranged
+            plan = get_history_plan(("weather",), timedelta(days=7), max_points) if ranged else None
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        if plan:
+            return jsonify(weather_history(history_db, plan))
+
         # Get the last 7 days of data in EST
-        seven_days_ago = datetime.now(EST) - timedelta(days=7)
-        
+        seven_days_ago = history_window_start(timedelta(days=7))
+        query = {"Time Stamp": {"$gte": seven_days_ago.isoformat()}}
+
+        if streaming:
+            # Documents are converted and encoded as each cursor batch arrives
+            docs = timed_cursor(lambda: weather_history_collection.find(query, WEATHER_PROJECTION)
+                                .sort("Time Stamp", 1).batch_size(STREAM_BATCH_SIZE))
+            return stream_json(iter_weather_records(docs, STREAM_BATCH_SIZE), "weather data")
+
         # Query MongoDB for the data, sorting by timestamp
-        cursor = weather_collection.find({
-            "Time Stamp": {"$gte": seven_days_ago.isoformat()}
-        }).sort("Time Stamp", 1)
-        
-        # Process the data
-        data = []
-        for doc in cursor:
-            time_str = doc.get("Time Stamp")
-            if isinstance(time_str, str):
-                time = datetime.fromisoformat(time_str.replace("Z", "+00:00"))
-            else:
-                time = time_str
-            
-            # Convert to EST
-            est_time = convert_to_est(time)
-            
-            data.append({
-                "time": est_time.strftime("%Y-%m-%d %H:%M"),
-                "temperature": doc.get("Current Temperature"),
-                "feels_like": doc.get("Feels Like"),
-                "humidity": doc.get("Humidity"),
-                "wind_speed": doc.get("Wind Speed"),
-                "description": doc.get("Description"),
-                "icon": doc.get("Icon")
-            })
+        docs = timed_fetch(lambda: weather_history_collection.find(query, WEATHER_PROJECTION).sort("Time Stamp", 1))
         
-        logger.info(f"Retrieved {len(data)} weather records")
+        data = weather_records(docs, max_points)
         return jsonify(data)
     except Exception as e:
         logger.error(f"Error fetching weather data: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
 @app.route("/api/current-weather")
+@conditional_view(lambda: data_versions("weather"))
+@cached_view(response_cache, CACHE_TTLS["current_weather"])
 def current_weather():
     try:
-        if not client:
+        if not db_available():
             logger.error("No MongoDB connection available")
             return jsonify({"error": "Database connection not available"}), 500
 
         # Get the most recent weather data
-        latest = weather_collection.find_one(sort=[("Time Stamp", -1)])
+        with span("query"):
+            latest = weather_collection.find_one(sort=[("Time Stamp", -1)])
         
         if latest:
-            logger.info("Retrieved latest weather data")
-            
-            # Convert timestamp to EST
-            time_str = latest.get("Time Stamp")
-            if time_str:
-                est_time = convert_to_est(time_str)
-                timestamp = est_time.strftime("%Y-%m-%d %H:%M")
-            else:
-                timestamp = None
-            
-            return jsonify({
-                "location": latest.get("Location"),
-                "temperature": latest.get("Current Temperature"),
-                "feels_like": latest.get("Feels Like"),
-                "humidity": latest.get("Humidity"),
-                "wind_speed": latest.get("Wind Speed"),
-                "description": latest.get("Description"),
-                "icon": latest.get("Icon"),
-                "timestamp": timestamp
-            })
+            logger.debug("Retrieved latest weather data")
+            return jsonify(current_weather_payload(latest))
         
         logger.warning("No weather data found in database")
         return jsonify({"error": "No weather data available"}), 404
@@ -419,7 +485,7 @@ def current_weather():
 @app.route("/api/debug/data-count")
 def debug_data_count():
     try:
-        if not client:
+        if not db_available():
             return jsonify({"error": "Database connection not available"}), 500
         weather_count = weather_collection.count_documents({})
         return jsonify({
@@ -430,110 +496,258 @@ def debug_data_count():
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@app.route("/api/stream")
+def stream():
+    if not db_available():
+        return jsonify({"error": "Database connection not available"}), 500
+
+    subscriber = broadcaster.subscribe()
+    if subscriber is None:
+        return jsonify({"error": "Too many stream clients"}), 503
+
+    def events():
+        try:
+            yield "retry: 5000\n\n"
+            while True:
+                event = subscriber.get(timeout=STREAM_KEEPALIVE)
+                if event is None:
+                    # Comment line keeps proxies from closing idle connections
+                    yield ": keepalive\n\n"
+                    continue
+                yield format_sse(*event)
+        finally:
+            broadcaster.unsubscribe(subscriber)
+
+    return Response(
+        stream_with_context(events()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.route("/api/debug/stream")
+def debug_stream():
+    if not db_available():
+        return jsonify({"error": "Database connection not available"}), 500
+    return jsonify(broadcaster.stats())
+
+@app.route("/api/debug/live")
+def debug_live():
+    if live_windows is None:
+        return jsonify({"error": "Live windows not enabled (LIVE_WINDOWS)"}), 500
+    return jsonify(live_windows.stats())
+
+@app.route("/api/debug/cache")
+def debug_cache():
+    return jsonify(response_cache.stats())
+
+@app.route("/api/debug/connection")
+def debug_connection():
+    if not mongo:
+        return jsonify({"error": "Database connection not configured"}), 500
+    return jsonify({**mongo.stats(), "pool": pool_stats.stats()})
+
+@app.route("/api/debug/query-plans")
+def debug_query_plans():
+    try:
+        if not db_available():
+            return jsonify({"error": "Database connection not available"}), 500
+        report = verify_query_plans(db)
+        return jsonify({
+            "collscans": sorted(name for name, result in report.items() if result.get("collscan")),
+            "queries": report
+        })
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
 @app.route("/api/room-data/<room_name>")
+@conditional_view(room_data_versions)
+@cached_view(response_cache, CACHE_TTLS["room_data"])
 def room_data(room_name):
     try:
-        logger.info(f"🔍 Fetching data for room: {room_name}")
-        if not client:
+        logger.debug(f"🔍 Fetching data for room: {room_name}")
+        if not db_available():
             logger.error("❌ Database connection not available")
             return jsonify({"error": "Database connection not available"}), 500
 
-        # Get the last 24 hours of data in EST
-        twenty_four_hours_ago = datetime.now(EST) - timedelta(hours=24)
-        logger.info(f"📅 Fetching data since: {twenty_four_hours_ago.isoformat()}")
+        try:
+            engine = get_engine()
+            cursor = get_since()
+            plan = get_history_plan(("room",), timedelta(hours=24), room=room_name) if range_requested(request.args) else None
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        if plan:
+            return jsonify(room_history(history_db, plan, room_name))
+
+        # Get the last 24 hours of data in EST; with a since cursor, only the
+        # buckets from the cursor's (possibly still filling) hour onwards
+        now = datetime.now(EST)
+        twenty_four_hours_ago = now - timedelta(hours=24)
+        window_start = max(twenty_four_hours_ago, cursor) if cursor else twenty_four_hours_ago
+        logger.debug(f"📅 Fetching data since: {window_start.isoformat()}")
+
+        # Serve hourly averages from the rollups when the worker keeps them current
+        if USE_ROLLUPS and engine == "pipeline":
+            resolution = pick_resolution(twenty_four_hours_ago, now, min_buckets=24)
+            with span("query"):
+                history = read_history(history_db, "room", window_start, resolution, room=room_name)
+            if history or (history is not None and cursor):
+                logger.debug(f"📦 Serving {len(history)} {resolution} rollup buckets for room {room_name}")
+                return jsonify(rollup_history_payload(history, request.args.get("since")))
+
+        if engine == "pipeline":
+            # Hourly averages are computed server-side; only the buckets cross the wire
+            since = window_start.astimezone(pytz.UTC).isoformat()
+            hourly = timed_fetch(lambda: temp_logs_history_collection.aggregate(room_hourly_pipeline(since, room_name)))
+            if not hourly and cursor:
+                return room_history_response([], [], [])
+            if not hourly:
+                logger.warning(f"⚠️ No data found for room: {room_name}")
+                # Try without the Room field as a fallback, like the Python path
+                hourly = timed_fetch(lambda: temp_logs_history_collection.aggregate(room_hourly_pipeline(since)))
+                if not hourly:
+                    logger.error(f"❌ No data found even in fallback query")
+                    return jsonify({"error": f"No data found for room: {room_name}"}), 404
+            logger.debug(f"✨ Pipeline returned {len(hourly)} hourly points for room {room_name}")
+            return jsonify(hourly_pipeline_payload(hourly, request.args.get("since")))
         
         # Query MongoDB for room data
-        room_data = list(temp_logs_collection.find({
+        room_data = timed_fetch(lambda: temp_logs_history_collection.find({
             "Room": room_name,
             "Timestamp": {
-                "$gte": twenty_four_hours_ago.astimezone(pytz.UTC).isoformat()
+                "$gte": window_start.astimezone(pytz.UTC).isoformat()
             }
         }).sort("Timestamp", 1))
 
-        logger.info(f"📊 Found {len(room_data)} records for room {room_name}")
+        logger.debug(f"📊 Found {len(room_data)} records for room {room_name}")
+
+        if not room_data and cursor:
+            return room_history_response([], [], [])
         
         if not room_data:
             logger.warning(f"⚠️ No data found for room: {room_name}")
             # Try querying without the Room field as a fallback
-            room_data = list(temp_logs_collection.find({
+            room_data = timed_fetch(lambda: temp_logs_history_collection.find({
                 "Timestamp": {
                     "$gte": twenty_four_hours_ago.astimezone(pytz.UTC).isoformat()
                 }
             }).sort("Timestamp", 1))
-            logger.info(f"📊 Found {len(room_data)} records in fallback query")
+            logger.debug(f"📊 Found {len(room_data)} records in fallback query")
             if not room_data:
                 logger.error(f"❌ No data found even in fallback query")
                 return jsonify({"error": f"No data found for room: {room_name}"}), 404
 
-        # Process data into hourly points
-        hourly_data = {}
-        skipped_records = 0
-        for doc in room_data:
-            try:
-                timestamp = doc.get("Timestamp")
-                if isinstance(timestamp, str):
-                    timestamp = datetime.fromisoformat(timestamp.replace("Z", "+00:00"))
-                
-                # Convert to EST and round to nearest hour
-                est_time = convert_to_est(timestamp)
-                hour_key = est_time.replace(minute=0, second=0, microsecond=0)
-                
-                if hour_key not in hourly_data:
-                    hourly_data[hour_key] = {
-                        "temps": [],
-                        "humidity": []
-                    }
-                
-                # Handle temperature as string or number
-                temp = doc.get("Temperature")
-                if isinstance(temp, str):
-                    temp = float(temp)
-                
-                # Handle humidity as number
-                humidity = doc.get("Humidity")
-                if humidity is not None:
-                    humidity = float(humidity)
-                
-                hourly_data[hour_key]["temps"].append(temp)
-                hourly_data[hour_key]["humidity"].append(humidity)
-            except (ValueError, TypeError) as e:
-                skipped_records += 1
-                logger.error(f"❌ Error processing document: {doc}")
-                logger.error(f"   └─ Error details: {str(e)}")
-                continue
-
-        # Calculate hourly averages
-        processed_data = {
-            "timestamps": [],
-            "temperature": [],
-            "humidity": []
-        }
-
-        for hour in sorted(hourly_data.keys()):
-            processed_data["timestamps"].append(hour.isoformat())
-            if hourly_data[hour]["temps"]:
-                processed_data["temperature"].append(
-                    sum(hourly_data[hour]["temps"]) / len(hourly_data[hour]["temps"])
-                )
-            if hourly_data[hour]["humidity"]:
-                processed_data["humidity"].append(
-                    sum(hourly_data[hour]["humidity"]) / len(hourly_data[hour]["humidity"])
-                )
-
-        logger.info(f"✨ Processing complete:")
-        logger.info(f"   └─ Input records: {len(room_data)}")
-        logger.info(f"   └─ Skipped records: {skipped_records}")
-        logger.info(f"   └─ Output hourly points: {len(processed_data['timestamps'])}")
-        logger.info(f"   └─ Sample data point: {processed_data['timestamps'][0] if processed_data['timestamps'] else 'None'}")
-        logger.info(f"   └─ Temperature range: {min(processed_data['temperature'])} to {max(processed_data['temperature'])}")
-        logger.info(f"   └─ Humidity range: {min(processed_data['humidity'])} to {max(processed_data['humidity'])}")
-        
-        return jsonify(processed_data)
+        return jsonify(hourly_room_averages(room_data, request.args.get("since")))
     except Exception as e:
         logger.error(f"❌ Error in room_data endpoint: {str(e)}")
         logger.exception("Detailed traceback:")
         return jsonify({"error": str(e)}), 500
 
+@app.route("/api/rooms/history")
+@conditional_view(lambda: data_versions("room", history=True))
+@cached_view(response_cache, CACHE_TTLS["room_data"])
+def rooms_history():
+    try:
+        if not db_available():
+            logger.error("❌ Database connection not available")
+            return jsonify({"error": "Database connection not available"}), 500
+
+        try:
+            rooms = parse_rooms(request.args)
+            bucket = parse_bucket(request.args)
+            engine = get_engine()
+            cursor = get_since()
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        # Same 24 hour window as /api/room-data, for every requested room at once
+        now = datetime.now(EST)
+        twenty_four_hours_ago = now - timedelta(hours=24)
+        window_start = max(twenty_four_hours_ago, cursor) if cursor else twenty_four_hours_ago
+        since = window_start.astimezone(pytz.UTC).isoformat()
+        logger.debug(f"🔍 Fetching {bucket} history for {len(rooms)} rooms since {window_start.isoformat()}")
+
+        if USE_ROLLUPS and engine == "pipeline":
+            with span("query"):
+                histories = read_room_histories(history_db, rooms, window_start, bucket)
+            if histories is not None:
+                return jsonify(rooms_history_payload(rollup_room_series(histories), rooms, request.args.get("since")))
+
+        if engine == "pipeline":
+            buckets = timed_fetch(lambda: temp_logs_history_collection.aggregate(rooms_history_pipeline(since, rooms, bucket)))
+            return jsonify(rooms_history_payload(pipeline_room_series(buckets), rooms, request.args.get("since")))
+
+        # One $in query over the (Room, Timestamp) index for all rooms
+        readings = timed_fetch(lambda: temp_logs_history_collection.find(
+            {"Room": {"$in": rooms}, "Timestamp": {"$gte": since}},
+            {"_id": 0, "Room": 1, "Timestamp": 1, "Temperature": 1, "Humidity": 1}
+        ))
+        logger.debug(f"📊 Found {len(readings)} records for {len(rooms)} rooms")
+        with span("parse"):
+            series = summary_room_series(summarize(readings, "room", bucket))
+        return jsonify(rooms_history_payload(series, rooms, request.args.get("since")))
+    except Exception as e:
+        logger.error(f"❌ Error in rooms_history endpoint: {str(e)}")
+        logger.exception("Detailed traceback:")
+        return jsonify({"error": str(e)}), 500
+
+@app.route("/api/analytics")
+@conditional_view(lambda: data_versions("weather", "ac", "room", history=True))
+@cached_view(response_cache, CACHE_TTLS["analytics"])
+def analytics():
+    try:
+        if not db_available():
+            logger.error("❌ Database connection not available")
+            return jsonify({"error": "Database connection not available"}), 500
+
+        try:
+            base = parse_base(request.args)
+            max_lag = parse_max_lag(request.args)
+            plan = plan_analytics(history_db, request.args, get_engine(), USE_ROLLUPS, archive)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        logger.debug(f"📈 Analytics from {plan['start'].isoformat()} to {plan['end'].isoformat()} "
+                     f"({plan['strategy']} {plan['resolution']})")
+        return jsonify(read_analytics(history_db, plan, base, max_lag))
+    except Exception as e:
+        logger.error(f"❌ Error in analytics endpoint: {str(e)}")
+        logger.exception("Detailed traceback:")
+        return jsonify({"error": str(e)}), 500
+
+@app.route("/api/export")
+def export_readings():
+    try:
+        if not db_available():
+            logger.error("No MongoDB connection available")
+            return jsonify({"error": "Database connection not available"}), 500
+
+        try:
+            source = parse_export_source(request.args)
+            export_format = parse_export_format(request.args)
+            start, end = parse_range(request.args, timedelta(hours=24))
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        # Archived months first, then MongoDB, one batch in memory at a time
+        batches = export_batches(history_db, archive, source, start, end, request.args.get("room"))
+        filename = f"{source}-{start:%Y%m%d}-{end:%Y%m%d}.{export_format}"
+        logger.debug(f"📤 Exporting {source} from {start.isoformat()} to {end.isoformat()} as {export_format}")
+
+        def generate():
+            try:
+                yield from iter_export(batches, source, export_format)
+            except Exception as e:
+                logger.error(f"❌ Error streaming export: {str(e)}")
+        return Response(
+            stream_with_context(generate()),
+            mimetype=EXPORT_FORMATS[export_format],
+            headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+        )
+    except Exception as e:
+        logger.error(f"Error exporting readings: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
 if __name__ == "__main__":
     # Allow access from local network and enable debug mode
     logger.info("🌐 Starting server on all network interfaces (0.0.0.0)")
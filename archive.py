@@ -0,0 +1,465 @@
+import argparse
+import logging
+import os
+import time
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.dataset as pa_ds
+import pyarrow.parquet as pq
+import pytz
+from dotenv import load_dotenv
+from pymongo import MongoClient
+
+from json_stream import chunked
+from readings import SOURCES, Readings, read_readings, to_float
+from rollups import bucket_minutes, get_high_water_mark
+from timestamps import LOCAL_TZ, parse_epoch_seconds, to_local_seconds
+
+logger = logging.getLogger(__name__)
+
+# Cold archive: readings older than ARCHIVE_AFTER_DAYS are moved out of the
+# hot collections into one Parquet file per source per local month,
+# <directory>/<source>/<YYYY-MM>.parquet, sorted by time. The archive state
+# records each source's mark: every reading before it is in the files, every
+# reading from it on is in MongoDB. Marks fall on local midnight, so no
+# history bucket straddles them, and never pass the rollup high-water mark,
+# so the rollups keep covering archived readings.
+STATE_COLLECTION = "archive_state"
+DEFAULT_AGE = timedelta(days=90)
+# The default windows read up to a week back; those readings stay in MongoDB
+MIN_AGE = timedelta(days=8)
+# Documents per cursor batch while archiving or exporting
+BATCH_SIZE = 50000
+# Readings per row group. Reads skip every row group whose time (and room)
+# statistics fall outside the filter, so this is the unit of a pushdown
+ROW_GROUP_SIZE = 65536
+# Seconds the marks are trusted before they are read again; the archiver runs daily
+MARK_TTL = 60
+# Seconds archived documents stay in MongoDB after the mark passes them, so
+# readers still holding the previous mark find them there
+DELETE_GRACE = MARK_TTL
+# Arrow types of the pass-through fields
+EXTRA_TYPES = {
+    "wind_speed": pa.float64(),
+    "description": pa.string(),
+    "icon": pa.string()
+}
+EXPORT_FORMATS = {
+    "csv": "text/csv",
+    "parquet": "application/vnd.apache.parquet"
+}
+
+EST = pytz.timezone(LOCAL_TZ)
+
+
+def archive_schema(source):
+    """Arrow schema of a source's archive files and exports, with the API field names."""
+    spec = SOURCES[source]
+    columns = [("time", pa.timestamp("s", tz="UTC"))]
+    if spec["room_field"]:
+        columns.append(("room", pa.string()))
+    columns += [(name, pa.float64()) for name in spec["fields"]]
+    columns += [(name, EXTRA_TYPES[name]) for name in spec["extras"]]
+    return pa.schema(columns)
+
+
+def _strings(values):
+    return [None if value is None else str(value) for value in values]
+
+
+def readings_table(readings):
+    """An Arrow table of ``readings`` (read with extras) in the archive schema."""
+    schema = archive_schema(readings.source)
+    columns = {"time": readings.seconds}
+    if readings.rooms is not None:
+        columns["room"] = _strings(readings.rooms)
+    columns.update(readings.values)
+    for name in SOURCES[readings.source]["extras"]:
+        values = readings.extras[name]
+        columns[name] = to_float(values) if EXTRA_TYPES[name] == pa.float64() else _strings(values)
+    # from_pandas: NaN is stored as null, so a missing reading is empty in CSV too
+    return pa.table([pa.array(columns[field.name], field.type, from_pandas=True) for field in schema], schema=schema)
+
+
+def _seconds(table):
+    # Parquet has no second unit, so files read back in milliseconds
+    return table.column("time").cast(pa.timestamp("s", tz="UTC")).cast(pa.int64()).to_numpy()
+
+
+def table_readings(table, source, extras=False):
+    """``Readings`` from an archive table, without going through documents
+    (``extras`` as in ``read_readings``)."""
+    spec = SOURCES[source]
+    return Readings(
+        source,
+        _seconds(table),
+        np.array(table.column("room").to_pylist(), dtype=object) if spec["room_field"] else None,
+        {name: table.column(name).to_numpy() for name in spec["fields"]},
+        {name: table.column(name).to_pylist() for name in spec["extras"]} if extras else {}
+    )
+
+
+def table_documents(table, source):
+    """Archive rows as documents shaped like the hot collection's (UTC ISO
+    timestamps), for the raw paths that take documents."""
+    spec = SOURCES[source]
+    seconds = _seconds(table)
+    names = {
+        "time": spec["time_field"],
+        **({"room": spec["room_field"]} if spec["room_field"] else {}),
+        **spec["fields"],
+        **spec["extras"]
+    }
+    columns = [np.char.add(np.datetime_as_string(seconds.astype("datetime64[s]")), "+00:00").tolist()]
+    for name in list(names)[1:]:
+        values = table.column(name).to_pylist()
+        # NaN marks a missing reading in the archive; documents leave it out as None
+        columns.append([None if value != value else value for value in values])
+    fields = list(names.values())
+    return [dict(zip(fields, row)) for row in zip(*columns)]
+
+
+def _local_month(moment):
+    return moment.astimezone(EST).strftime("%Y-%m")
+
+
+def _month_start(month):
+    return EST.localize(datetime.strptime(month, "%Y-%m"))
+
+
+def _next_month(month):
+    start = _month_start(month)
+    return _local_month(EST.localize(datetime(start.year + start.month // 12, start.month % 12 + 1, 1)))
+
+
+def _months(start, end):
+    # Local months overlapping [start, end)
+    months, month, last = [], _local_month(start), _local_month(end - timedelta(seconds=1))
+    while month <= last:
+        months.append(month)
+        month = _next_month(month)
+    return months
+
+
+def _months_of(seconds):
+    # Local month of each epoch second, as "YYYY-MM"
+    local = to_local_seconds(seconds).astype("datetime64[s]").astype("datetime64[M]")
+    return np.datetime_as_string(local)
+
+
+def _iso(moment):
+    return moment.astimezone(timezone.utc).isoformat()
+
+
+def _parse_mark(value):
+    return datetime.fromisoformat(value).astimezone(timezone.utc)
+
+
+class ParquetArchive:
+    """The archive files under ``directory``: memory-mapped reads with the
+    time range (and room) pushed down to the row groups, plus the marks."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._marks = {}
+        self._marks_read_at = None
+
+    def path(self, source, month):
+        return os.path.join(self.directory, source, f"{month}.parquet")
+
+    def files(self, source, start, end):
+        """The month files overlapping [start, end); the others are never opened."""
+        paths = (self.path(source, month) for month in _months(start, end))
+        return [path for path in paths if os.path.exists(path)]
+
+    def marks(self, db):
+        """``{source: datetime}``: readings before each mark are in the archive."""
+        now = time.monotonic()
+        if self._marks_read_at is None or now - self._marks_read_at >= MARK_TTL:
+            self._marks = {
+                doc["_id"]: _parse_mark(doc["archived_through"])
+                for doc in db[STATE_COLLECTION].find({}, {"archived_through": 1})
+            }
+            self._marks_read_at = now
+        return self._marks
+
+    def forget_marks(self):
+        """Read the marks again on the next request, after moving one."""
+        self._marks_read_at = None
+
+    def archived(self, db, sources, start):
+        """Marks of the ``sources`` whose archived readings a range from ``start`` reaches."""
+        marks = self.marks(db)
+        return {source: marks[source] for source in sources if source in marks and start < marks[source]}
+
+    def _filter(self, start, end, room=None):
+        stamp = pa.timestamp("s", tz="UTC")
+        expression = (pa_ds.field("time") >= pa.scalar(start, stamp)) & (pa_ds.field("time") < pa.scalar(end, stamp))
+        if isinstance(room, (list, tuple)):
+            expression &= pa_ds.field("room").isin(list(room))
+        elif room is not None:
+            expression &= pa_ds.field("room") == room
+        return expression
+
+    def _dataset(self, source, files):
+        return pa_ds.dataset(files, schema=archive_schema(source), format="parquet")
+
+    def read_table(self, source, start, end, room=None):
+        """Archived readings in [start, end), optionally of one room (or a list), sorted by time."""
+        files = self.files(source, start, end)
+        if not files:
+            return archive_schema(source).empty_table()
+        return pq.read_table(files, schema=archive_schema(source), filters=self._filter(start, end, room),
+                             memory_map=True)
+
+    def count(self, source, start, end, room=None):
+        files = self.files(source, start, end)
+        if not files:
+            return 0
+        return self._dataset(source, files).count_rows(filter=self._filter(start, end, room))
+
+    def iter_batches(self, source, start, end, room=None, batch_size=BATCH_SIZE):
+        """``read_table`` one record batch at a time, file by file."""
+        for path in self.files(source, start, end):
+            dataset = self._dataset(source, [path])
+            yield from dataset.to_batches(filter=self._filter(start, end, room), batch_size=batch_size)
+
+    def write_month(self, source, month, tables):
+        """Merge ``tables`` into a month's file. Rows already archived by an
+        interrupted run are dropped as duplicates, so a rerun is safe."""
+        path = self.path(source, month)
+        schema = archive_schema(source)
+        if os.path.exists(path):
+            tables = [pq.read_table(path, memory_map=True).cast(schema), *tables]
+        frame = pa.concat_tables(tables).to_pandas().drop_duplicates()
+        frame = frame.sort_values([name for name in ("time", "room") if name in frame], kind="stable")
+        table = pa.Table.from_pandas(frame, schema=schema, preserve_index=False).replace_schema_metadata()
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Written aside and renamed, so readers never see a half-written file
+        partial = f"{path}.partial"
+        pq.write_table(table, partial, row_group_size=ROW_GROUP_SIZE, compression="zstd")
+        os.replace(partial, path)
+        return table.num_rows
+
+
+def archive_cutoff(db, source, now, age, use_rollups=True):
+    """Local midnight ``age`` ago, kept at or before the rollup high-water mark.
+    None when rollups are in use but the worker hasn't folded in any of the
+    source's readings yet, so nothing can be archived."""
+    cutoff = now - age
+    high_water_mark = get_high_water_mark(db, source)
+    if high_water_mark is not None:
+        cutoff = min(cutoff, _parse_mark(high_water_mark))
+    elif use_rollups:
+        return None
+    minute = bucket_minutes([int(cutoff.timestamp() // 60)], "1d")[0]
+    return datetime.fromtimestamp(int(minute) * 60, timezone.utc)
+
+
+def _set_mark(db, source, mark, now):
+    # $max: a mark only ever moves forward
+    db[STATE_COLLECTION].update_one(
+        {"_id": source},
+        {"$max": {"archived_through": _iso(mark)}, "$set": {"updated_at": now.isoformat()}},
+        upsert=True
+    )
+
+
+def _delete(collection, ids):
+    for batch in chunked(ids, 10000):
+        collection.delete_many({"_id": {"$in": batch}})
+
+
+def archive_source(db, archive, source, now=None, age=DEFAULT_AGE, use_rollups=True, grace=DELETE_GRACE):
+    """Move a source's readings from before the cutoff into the archive.
+
+    Months are written in time order; after each one the mark moves up to
+    the month's end (or the cutoff) and its documents are deleted once the
+    mark has stood for ``grace`` seconds. Readings whose timestamp doesn't
+    parse are left in MongoDB.
+    """
+    spec = SOURCES[source]
+    now = now or datetime.now(timezone.utc)
+    cutoff = archive_cutoff(db, source, now, age, use_rollups)
+    if cutoff is None:
+        logger.warning(f"⚠️ Not archiving {source}: the rollup worker has no high-water mark for it yet")
+        return 0
+    collection = db[spec["collection"]]
+    cursor = collection.find({spec["time_field"]: {"$lt": _iso(cutoff)}}).sort(spec["time_field"], 1).batch_size(BATCH_SIZE)
+
+    pending = {}
+    # (when the mark moved past them, ids) of archived documents not yet deleted
+    deletions = []
+    moved = skipped = 0
+
+    def delete_archived(wait=False):
+        nonlocal moved
+        while deletions:
+            remaining = deletions[0][0] + grace - time.monotonic()
+            if remaining > 0:
+                if not wait:
+                    return
+                time.sleep(remaining)
+            _, ids = deletions.pop(0)
+            _delete(collection, ids)
+            moved += len(ids)
+
+    def flush(month):
+        tables, ids = pending.pop(month)
+        archive.write_month(source, month, tables)
+        _set_mark(db, source, min(cutoff, _month_start(_next_month(month))), now)
+        archive.forget_marks()
+        deletions.append((time.monotonic(), ids))
+        delete_archived()
+
+    for docs in chunked(cursor, BATCH_SIZE):
+        readings = read_readings(docs, source, extras=True)
+        if not len(readings):
+            skipped += len(docs)
+            continue
+        if len(readings) < len(docs):
+            _, valid = parse_epoch_seconds([doc.get(spec["time_field"]) for doc in docs])
+            skipped += len(docs) - len(readings)
+            docs = [doc for doc, ok in zip(docs, valid) if ok]
+        months = _months_of(readings.seconds)
+        for month in pd.unique(months):
+            rows = np.flatnonzero(months == month)
+            tables, ids = pending.setdefault(month, ([], []))
+            tables.append(readings_table(readings.take(rows)))
+            ids.extend(docs[i]["_id"] for i in rows.tolist())
+        # The cursor is in time order, so months before this batch's last are complete
+        for month in sorted(pending):
+            if month < months[-1]:
+                flush(month)
+
+    for month in sorted(pending):
+        flush(month)
+    _set_mark(db, source, cutoff, now)
+    archive.forget_marks()
+    delete_archived(wait=True)
+
+    if skipped:
+        logger.warning(f"⚠️ Left {skipped} {source} readings with unparseable timestamps in MongoDB")
+    logger.info(f"🧊 Archived {moved} {source} readings before {_iso(cutoff)}")
+    return moved
+
+
+def run_archive(db, archive, now=None, age=DEFAULT_AGE, use_rollups=True, grace=DELETE_GRACE):
+    if age < MIN_AGE:
+        raise ValueError(f"The archive age must be at least {MIN_AGE.days} days, so the default windows stay in MongoDB")
+    return {source: archive_source(db, archive, source, now=now, age=age, use_rollups=use_rollups, grace=grace)
+            for source in SOURCES}
+
+
+class _Drain:
+    # Write-only file that hands its bytes out as they are written. tell()
+    # keeps counting across drains, so Parquet's footer offsets stay right
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+        self.closed = False
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def parse_export_format(args):
+    export_format = args.get("format", "csv")
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f"format must be one of: {', '.join(EXPORT_FORMATS)}")
+    return export_format
+
+
+def parse_export_source(args):
+    source = args.get("source")
+    if source not in SOURCES:
+        raise ValueError(f"source must be one of: {', '.join(SOURCES)}")
+    return source
+
+
+def export_batches(db, archive, source, start, end, room=None, batch_size=BATCH_SIZE):
+    """Record batches of a source's readings in [start, end), archived ones
+    first, then MongoDB's read a cursor batch at a time."""
+    spec = SOURCES[source]
+    room = room if spec["room_field"] else None
+    mark = archive.archived(db, (source,), start).get(source) if archive else None
+    if mark:
+        yield from archive.iter_batches(source, start, min(end, mark), room, batch_size)
+        start = max(start, mark)
+    if start >= end:
+        return
+
+    query = {spec["time_field"]: {"$gte": _iso(start), "$lt": _iso(end)}}
+    if room is not None and spec["room_field"]:
+        query[spec["room_field"]] = room
+    cursor = db[spec["collection"]].find(query, {"_id": 0}).sort(spec["time_field"], 1).batch_size(batch_size)
+    for docs in chunked(cursor, batch_size):
+        yield from readings_table(read_readings(docs, source, extras=True)).to_batches()
+
+
+def iter_export(batches, source, export_format):
+    """Encode record batches as CSV or Parquet, yielding the bytes of each
+    batch as it is written; only one batch is held at a time."""
+    sink = _Drain()
+    schema = archive_schema(source)
+    stream = pa.PythonFile(sink, mode="w")
+    writer = (pa_csv.CSVWriter(stream, schema) if export_format == "csv"
+              else pq.ParquetWriter(stream, schema, compression="zstd"))
+    try:
+        for batch in batches:
+            if batch.num_rows:
+                # Each batch becomes its own Parquet row group
+                writer.write_batch(batch)
+                yield sink.drain()
+    finally:
+        writer.close()
+    yield sink.drain()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Move old sensor readings into the Parquet archive")
+    parser.add_argument("--interval", type=int, default=0,
+                        help="Seconds between runs; 0 runs once and exits")
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s [%(levelname)s] %(message)s',
+        datefmt='%Y-%m-%d %H:%M:%S'
+    )
+    load_dotenv()
+    db = MongoClient(os.getenv('MONGO_URI', 'mongodb://10.0.1.252:27017/'))["sensordata"]
+    archive = ParquetArchive(os.getenv('ARCHIVE_DIR', 'archive'))
+    age = timedelta(days=int(os.getenv('ARCHIVE_AFTER_DAYS', str(DEFAULT_AGE.days))))
+    use_rollups = os.getenv('USE_ROLLUPS', 'true').lower() == 'true'
+
+    while True:
+        run_archive(db, archive, age=age, use_rollups=use_rollups)
+        if not args.interval:
+            break
+        time.sleep(args.interval)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,905 @@
+import asyncio
+import contextlib
+import functools
+import logging
+import os
+from datetime import datetime, timedelta
+
+import pytz
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+from starlette.applications import Starlette
+from starlette.concurrency import iterate_in_threadpool, run_in_threadpool
+from starlette.middleware import Middleware
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Match, Mount, Route
+from starlette.staticfiles import StaticFiles
+from starlette.templating import Jinja2Templates
+
+from alignment import build_combined_data, combined_columns, with_timestamps
+from analytics import parse_base, parse_max_lag, plan_analytics, read_analytics
+from archive import EXPORT_FORMATS, ParquetArchive, export_batches, iter_export, parse_export_format, parse_export_source
+from cache import SharedCache, TTLCache
+from columnar import MIMETYPE as COLUMNAR_MIMETYPE, pack_combined
+from conditional import is_fallback_room, is_not_modified, last_modified, latest_timestamps_async, make_etag, validator_headers
+from database import AsyncMongoConnection, history_read_preference
+from json_stream import aiter_json_array, json_body
+from indexes import ensure_indexes, verify_query_plans
+from live import DEFAULT_CAPACITY as LIVE_DEFAULT_CAPACITY, MAX_SILENCE as LIVE_DEFAULT_MAX_SILENCE, LiveWindows, window_summary
+from metrics import (
+    MetricsRegistry,
+    PoolStats,
+    begin_request,
+    cache_gauges,
+    end_request,
+    format_request_line,
+    span,
+    timed_fetch_async
+)
+from planner import combined_history, parse_range, plan_request, range_requested, room_history, row_budget, weather_history
+from pipelines import combined_pipelines, latest_per_room_pipeline, room_hourly_pipeline, rooms_history_pipeline
+from rollups import pick_resolution, read_history_async, read_room_histories_async, summarize
+from snapshots import (
+    DEFAULT_INTERVAL as SNAPSHOT_DEFAULT_INTERVAL,
+    read_snapshot_async,
+    snapshot_headers,
+    snapshot_name,
+    start_snapshot_worker
+)
+from stream import AsyncSubscriber, ReadingBroadcaster, format_sse
+from views import (
+    EST,
+    current_conditions_payload,
+    current_weather_payload,
+    hourly_pipeline_payload,
+    hourly_room_averages,
+    log_combined_fetch,
+    log_combined_summary,
+    log_separator,
+    parse_bucket,
+    parse_engine,
+    parse_format,
+    parse_max_points,
+    parse_rooms,
+    parse_since,
+    parse_stream,
+    pipeline_room_series,
+    rollup_history_payload,
+    rollup_room_series,
+    room_history_payload,
+    rooms_history_payload,
+    summary_room_series,
+    WEATHER_PROJECTION,
+    weather_records,
+    weather_rows,
+    window_start as history_window_start
+)
+
+# Async serving mode: the same endpoints and JSON as app.py, served by an
+# ASGI server with the Motor driver so slow clients and database round
+# trips don't each hold a thread. Run with:
+#   uvicorn asgi_app:app --host 0.0.0.0 --port 5000
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s [%(levelname)s] %(message)s',
+    datefmt='%Y-%m-%d %H:%M:%S'
+)
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv()
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Same settings as the Flask app
+MONGO_URI = os.getenv('MONGO_URI', 'mongodb://10.0.1.252:27017/')
+USE_ROLLUPS = os.getenv('USE_ROLLUPS', 'true').lower() == 'true'
+AGGREGATION_ENGINE = os.getenv('AGGREGATION_ENGINE', 'pipeline')
+ENSURE_INDEXES = os.getenv('ENSURE_INDEXES', 'true').lower() == 'true'
+STREAM_KEEPALIVE = 15
+STREAM_RESPONSES = os.getenv('STREAM_RESPONSES', 'false').lower() == 'true'
+STREAM_BATCH_SIZE = int(os.getenv('STREAM_BATCH_SIZE', '1000'))
+HISTORY_ROW_BUDGET = int(os.getenv('HISTORY_ROW_BUDGET', '1500'))
+SNAPSHOT_MAX_AGE = int(os.getenv('SNAPSHOT_MAX_AGE', '180'))
+SNAPSHOT_WORKER = os.getenv('SNAPSHOT_WORKER', 'false').lower() == 'true'
+SNAPSHOT_INTERVAL = int(os.getenv('SNAPSHOT_INTERVAL', str(SNAPSHOT_DEFAULT_INTERVAL)))
+ARCHIVE_DIR = os.getenv('ARCHIVE_DIR', 'archive')
+archive = ParquetArchive(ARCHIVE_DIR) if ARCHIVE_DIR else None
+LIVE_WINDOWS = os.getenv('LIVE_WINDOWS', 'false').lower() == 'true'
+LIVE_CAPACITY = int(os.getenv('LIVE_CAPACITY', str(LIVE_DEFAULT_CAPACITY)))
+LIVE_MAX_SILENCE = float(os.getenv('LIVE_MAX_SILENCE', str(LIVE_DEFAULT_MAX_SILENCE)))
+live_windows = LiveWindows(LIVE_CAPACITY) if LIVE_WINDOWS else None
+
+CACHE_MAX_ENTRIES = int(os.getenv('CACHE_MAX_ENTRIES', '256'))
+SHARED_CACHE_PATH = os.getenv('SHARED_CACHE_PATH')
+if SHARED_CACHE_PATH:
+    response_cache = SharedCache(SHARED_CACHE_PATH, max_size=CACHE_MAX_ENTRIES)
+else:
+    response_cache = TTLCache(max_size=CACHE_MAX_ENTRIES)
+CACHE_TTLS = {
+    "current_conditions": 30,
+    "combined_data": 60,
+    "room_data": 60,
+    "weather_data": 300,
+    "current_weather": 60,
+    "analytics": 300,
+    "summary": 30
+}
+
+templates = Jinja2Templates(directory=os.path.join(BASE_DIR, "templates"))
+
+metrics_registry = MetricsRegistry()
+pool_stats = PoolStats()
+
+# Set when the app starts serving
+mongo = None
+db = None
+history_db = None
+broadcaster = None
+
+
+class FlaskJSONResponse(JSONResponse):
+    # The same bytes as the Flask app's jsonify(), so clients can't tell the modes apart
+    def render(self, content):
+        with span("serialize"):
+            return json_body(content)
+
+
+def jsonify(content, status_code=200):
+    return FlaskJSONResponse(content, status_code=status_code)
+
+
+async def db_available():
+    # Whether MongoDB answered its last health check (re-checked lazily, with backoff while it is down)
+    return mongo is not None and await mongo.available()
+
+
+def stream_requested(request):
+    # Downsampled and ranged payloads are small, so they stay buffered (and cached)
+    try:
+        return (parse_stream(request.query_params, STREAM_RESPONSES) and parse_max_points(request.query_params) is None
+                and not range_requested(request.query_params))
+    except ValueError:
+        return False
+
+
+async def history_plan(request, sources, default_span, max_points=None, room=None):
+    # The planner's bounded counts run on the synchronous driver under Motor
+    engine = parse_engine(request.query_params, AGGREGATION_ENGINE)
+    return await run_in_threadpool(plan_request, history_db.delegate, request.query_params, sources, default_span, engine,
+                                   USE_ROLLUPS, row_budget(HISTORY_ROW_BUDGET, max_points), room, archive)
+
+
+def stream_json(chunks, name):
+    """Send JSON chunks from a sync or async iterable as they are produced.
+
+    Sync chunks are encoded in the threadpool. A failure mid-body can only be
+    logged; the client sees a truncated document.
+    """
+    async def generate():
+        try:
+            if not hasattr(chunks, "__aiter__"):
+                async for chunk in iterate_in_threadpool(chunks):
+                    yield chunk
+            else:
+                async for chunk in chunks:
+                    yield chunk
+        except Exception as e:
+            logger.error(f"❌ Error streaming {name}: {str(e)}")
+    return StreamingResponse(generate(), media_type="application/json")
+
+
+async def cursor_batches(cursor, first, batch_size):
+    # Motor cursor batches, starting from an already fetched first batch
+    batch = first
+    while batch:
+        yield batch
+        batch = await cursor.to_list(length=batch_size)
+
+
+def response_variant(request):
+    try:
+        return parse_format(request.query_params, request.headers.get("accept"))
+    except ValueError:
+        return None
+
+
+def live_ready():
+    # Whether the in-memory windows can answer (LIVE_WINDOWS): loaded, fed by a healthy
+    # watcher and not silent for LIVE_MAX_SILENCE seconds; otherwise the routes read MongoDB
+    return (live_windows is not None and broadcaster is not None and broadcaster.healthy()
+            and live_windows.fresh(LIVE_MAX_SILENCE))
+
+
+def conditional_route(*sources, per_room=False, history=False, live=False):
+    """``conditional.conditional_view`` for the async endpoints: 304 when the
+    client's validators match the latest timestamps of ``sources`` (and, for
+    a ``per_room`` room served with the all-rooms fallback, every room's). History
+    routes read them from ``history_db``, where they read their data; ``live``
+    routes from the in-memory windows while those answer."""
+    def decorator(endpoint):
+        @functools.wraps(endpoint)
+        async def wrapper(request):
+            if live and live_ready():
+                current = live_windows.latest_timestamps(sources)
+            elif not await db_available():
+                return await endpoint(request)
+            else:
+                room = request.path_params.get("room_name") if per_room else None
+                try:
+                    with span("validate"):
+                        source_db = history_db if history else db
+                        current = await latest_timestamps_async(source_db, sources, room)
+                        # A room without recent readings is answered with every room's
+                        if per_room and is_fallback_room(current):
+                            current["fallback"] = (await latest_timestamps_async(source_db, ("room",)))["room"]
+                except Exception as e:
+                    logger.warning(f"⚠️ Could not read data versions for {endpoint.__name__}: {str(e)}")
+                    return await endpoint(request)
+
+            etag = make_etag(current, f"{request.url.path}?{request.url.query}", request.headers.get("accept", ""))
+            modified = last_modified(current)
+            request.state.data_version = etag
+            if is_not_modified(etag, modified, request.headers.get("if-none-match"),
+                               request.headers.get("if-modified-since")):
+                response = Response(status_code=304)
+            else:
+                response = await endpoint(request)
+                if response.status_code != 200:
+                    return response
+            for name, value in validator_headers(etag, modified).items():
+                response.headers.setdefault(name, value)
+            return response
+        return wrapper
+    return decorator
+
+
+def snapshot_route(route, vary=None, live=False):
+    """``snapshots.snapshot_view`` for the async endpoints: answer from the
+    route's snapshot when a fresh one exists (``live`` routes only while the
+    in-memory windows don't answer)."""
+    def decorator(endpoint):
+        @functools.wraps(endpoint)
+        async def wrapper(request):
+            name = snapshot_name(route, request.query_params, request.headers.get("accept"))
+            if SNAPSHOT_MAX_AGE <= 0 or name is None or (live and live_ready()) or not await db_available():
+                return await endpoint(request)
+            try:
+                with span("query"):
+                    doc = await read_snapshot_async(db, name, SNAPSHOT_MAX_AGE)
+            except Exception as e:
+                logger.warning(f"⚠️ Could not read snapshot for {endpoint.__name__}: {str(e)}")
+                doc = None
+            if doc is None:
+                return await endpoint(request)
+
+            headers, not_modified = snapshot_headers(
+                doc, f"{request.url.path}?{request.url.query}", request.headers.get("accept", ""),
+                request.headers.get("if-none-match"), request.headers.get("if-modified-since")
+            )
+            if not_modified:
+                response = Response(status_code=304, headers=headers)
+            else:
+                response = Response(doc["body"], media_type=doc["mimetype"], headers=headers)
+            if vary:
+                response.headers.append("Vary", vary)
+            return response
+        return wrapper
+    return decorator
+
+
+def cached_route(ttl, bypass=None, variant=None):
+    """Cache an endpoint's successful responses per path and query string.
+
+    Concurrent misses on the same URL await one computation. Requests for
+    which ``bypass(request)`` is true (streamed responses) skip the cache.
+    ``variant(request)`` names the representation negotiated from the Accept
+    header; it is part of the key, and responses are marked ``Vary: Accept``.
+    Under ``conditional_route`` the data version is part of the key too.
+    """
+    def decorator(endpoint):
+        @functools.wraps(endpoint)
+        async def wrapper(request):
+            if ttl <= 0 or response_cache.max_size <= 0 or (bypass and bypass(request)):
+                response = await endpoint(request)
+            else:
+                async def compute():
+                    response = await endpoint(request)
+                    return response.status_code, response.body, response.media_type
+
+                status, body, media_type = await response_cache.get_or_compute_async(
+                    (endpoint.__name__, f"{request.url.path}?{request.url.query}",
+                     variant(request) if variant else None, getattr(request.state, "data_version", None)),
+                    ttl,
+                    compute,
+                    cacheable=lambda value: value[0] == 200
+                )
+                response = Response(body, status_code=status, media_type=media_type)
+            if variant:
+                response.headers.append("Vary", "Accept")
+            return response
+        return wrapper
+    return decorator
+
+
+class RequestMetricsMiddleware:
+    """Times each HTTP request into the metrics registry and logs one INFO line for it.
+
+    Like the Flask app's after_request hook, a request is recorded when its
+    response starts, so long-lived streams don't skew the histograms.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timings, token = begin_request(_route_template(scope))
+        recorded = False
+
+        def record(status):
+            nonlocal recorded
+            recorded = True
+            duration = metrics_registry.observe(timings, status)
+            path = scope["path"] + (f"?{scope['query_string'].decode()}" if scope["query_string"] else "")
+            logger.info(format_request_line(scope["method"], path, status, duration, timings))
+
+        async def send_and_record(message):
+            if message["type"] == "http.response.start" and not recorded:
+                record(message["status"])
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_and_record)
+        finally:
+            if not recorded:
+                record(500)
+            end_request(token)
+
+
+def _route_template(scope):
+    # Label by route pattern, not raw path, to keep the metric cardinality bounded
+    for route in routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return getattr(route, "path", "unmatched")
+    return "unmatched"
+
+
+async def on_connect(db):
+    # Runs each time MongoDB becomes reachable, so indexes also get created after an outage at startup
+    if ENSURE_INDEXES:
+        await run_in_threadpool(ensure_indexes, db.delegate)
+    # Reload the windows: readings written while MongoDB was unreachable never reached the watcher
+    if live_windows:
+        await run_in_threadpool(live_windows.warm, db.delegate)
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    global mongo, db, history_db, broadcaster
+    snapshot_stop = None
+    connecting = None
+    try:
+        # The client connects lazily; requests await db_available(), which retries with backoff
+        mongo = AsyncMongoConnection(MONGO_URI, AsyncIOMotorClient, [pool_stats], history_read_preference(), [on_connect])
+        db = mongo.db
+        # History routes may read from secondaries (MONGO_HISTORY_READ_PREFERENCE)
+        history_db = mongo.history_db
+        # The watcher thread and the index bootstrap use the synchronous
+        # driver underneath Motor, sharing its connection pool
+        broadcaster = ReadingBroadcaster(
+            db.delegate,
+            max_queue=int(os.getenv('STREAM_QUEUE_SIZE', '100')),
+            max_clients=int(os.getenv('STREAM_MAX_CLIENTS', '500'))
+        )
+        if live_windows:
+            broadcaster.add_listener(live_windows.add_reading)
+        if SNAPSHOT_WORKER:
+            # One build per interval across the gunicorn workers sharing the cache file
+            snapshot_stop = start_snapshot_worker(db.delegate, SNAPSHOT_INTERVAL, AGGREGATION_ENGINE, response_cache.claim)
+        # First check in the background, so serving starts without waiting for it
+        connecting = asyncio.ensure_future(mongo.available())
+    except Exception as e:
+        # Only a malformed MONGO_URI or setting gets here; an unreachable server is retried
+        logger.error(f"Failed to configure MongoDB: {str(e)}")
+        mongo = None
+    yield
+    if connecting:
+        connecting.cancel()
+    if snapshot_stop:
+        snapshot_stop.set()
+    if mongo:
+        mongo.close()
+
+
+async def index(request):
+    # The template links assets with Flask's url_for('static', filename=...)
+    return templates.TemplateResponse(request, "index.html", {
+        "url_for": lambda endpoint, filename: f"/static/{filename}"
+    })
+
+
+def pack_combined_columns(weather_data, ac_data, room_data, max_points):
+    # The binary format: typed columns with NaN gaps and delta-encoded minutes
+    columns = combined_columns(weather_data, ac_data, room_data, max_points)
+    with span("serialize"):
+        return pack_combined(columns)
+
+
+@conditional_route("weather", "ac", "room", history=True)
+@snapshot_route("combined_data", vary="Accept")
+@cached_route(CACHE_TTLS["combined_data"], variant=response_variant)
+async def combined_data(request):
+    try:
+        log_separator("🔄 Starting Data Fetch")
+        if not await db_available():
+            logger.error("❌ No MongoDB connection available")
+            return jsonify({"error": "Database connection not available"}, 500)
+
+        try:
+            max_points = parse_max_points(request.query_params)
+            engine = parse_engine(request.query_params, AGGREGATION_ENGINE)
+            cursor = parse_since(request.query_params)
+            binary = parse_format(request.query_params, request.headers.get("accept")) == "binary"
+            ranged = range_requested(request.query_params)
+            plan = await history_plan(request, ("weather", "ac", "room"), timedelta(hours=24), max_points) if ranged else None
+        except ValueError as e:
+            return jsonify({"error": str(e)}, 400)
+
+        if plan:
+            columns = await run_in_threadpool(combined_history, history_db.delegate, plan)
+            if binary:
+                with span("serialize"):
+                    return Response(pack_combined(columns), media_type=COLUMNAR_MIMETYPE)
+            return jsonify(with_timestamps(columns))
+
+        window_start = history_window_start(timedelta(hours=24), cursor)
+        since = window_start.astimezone(pytz.UTC).isoformat()
+        logger.debug(f"Fetching data since: {window_start.isoformat()} ({engine} engine)")
+
+        # The three collections are fetched concurrently, so the wait is the
+        # slowest round trip rather than the sum of all three
+        if engine == "pipeline":
+            pipelines = combined_pipelines(since)
+            weather_data, ac_data, room_data = await asyncio.gather(
+                timed_fetch_async(history_db["weatherData"].aggregate(pipelines["weatherData"])),
+                timed_fetch_async(history_db["sensibo_logs"].aggregate(pipelines["sensibo_logs"])),
+                timed_fetch_async(history_db["temperature_logs"].aggregate(pipelines["temperature_logs"]))
+            )
+        else:
+            weather_data, ac_data, room_data = await asyncio.gather(
+                timed_fetch_async(history_db["weatherData"].find({"Time Stamp": {"$gte": since}}).sort("Time Stamp", 1)),
+                timed_fetch_async(history_db["sensibo_logs"].find({"Timestamp": {"$gte": since}}).sort("Timestamp", 1)),
+                timed_fetch_async(history_db["temperature_logs"].find({"Timestamp": {"$gte": since}}).sort("Timestamp", 1))
+            )
+
+        log_combined_fetch(weather_data, ac_data, room_data)
+
+        # Alignment is CPU-bound; keep it off the event loop
+        logger.debug("📊 Aligning weather, AC and room data...")
+        if binary:
+            body = await run_in_threadpool(pack_combined_columns, weather_data, ac_data, room_data, max_points)
+            log_separator("✨ Request Complete")
+            return Response(body, media_type=COLUMNAR_MIMETYPE)
+        processed_data = await run_in_threadpool(build_combined_data, weather_data, ac_data, room_data, max_points)
+
+        log_combined_summary(processed_data)
+        log_separator("✨ Request Complete")
+        return jsonify(processed_data)
+    except Exception as e:
+        logger.error(f"❌ Error in combined_data route: {str(e)}")
+        return jsonify({"error": str(e)}, 500)
+
+
+@conditional_route("weather", "ac", "room", live=True)
+@snapshot_route("current_conditions", live=True)
+@cached_route(CACHE_TTLS["current_conditions"])
+async def current_conditions(request):
+    try:
+        if live_ready():
+            return jsonify(live_windows.current_conditions())
+
+        if not await db_available():
+            return jsonify({"error": "Database connection not available"}, 500)
+
+        with span("query"):
+            latest_weather, latest_ac, latest_rooms = await asyncio.gather(
+                db["weatherData"].find_one(sort=[("Time Stamp", -1)]),
+                db["sensibo_logs"].find_one(sort=[("Timestamp", -1)]),
+                db["temperature_logs"].aggregate(latest_per_room_pipeline()).to_list(None)
+            )
+        return jsonify(current_conditions_payload(latest_weather, latest_ac, latest_rooms))
+    except Exception as e:
+        logger.error(f"Error in current_conditions: {str(e)}")
+        return jsonify({"error": str(e)}, 500)
+
+
+@conditional_route("weather", "ac", "room", live=True)
+@cached_route(CACHE_TTLS["summary"])
+async def summary(request):
+    try:
+        if live_ready():
+            return jsonify(live_windows.summary())
+
+        if not await db_available():
+            return jsonify({"error": "Database connection not available"}, 500)
+
+        # Without resident windows, build them from the last 24 hours for this response
+        with span("query"):
+            return jsonify(await run_in_threadpool(window_summary, db.delegate, LIVE_CAPACITY))
+    except Exception as e:
+        logger.error(f"❌ Error in summary endpoint: {str(e)}")
+        return jsonify({"error": str(e)}, 500)
+
+
+@conditional_route("weather", history=True)
+@cached_route(CACHE_TTLS["weather_data"], bypass=stream_requested)
+async def weather_data(request):
+    try:
+        if not await db_available():
+            logger.error("No MongoDB connection available")
+            return jsonify({"error": "Database connection not available"}, 500)
+
+        try:
+            max_points = parse_max_points(request.query_params)
+            ranged = range_requested(request.query_params)
+            streaming = parse_stream(request.query_params, STREAM_RESPONSES) and max_points is None and not ranged
+            plan = await history_plan(request, ("weather",), timedelta(days=7), max_points) if ranged else None
+        except ValueError as e:
+            return jsonify({"error": str(e)}, 400)
+
+        if plan:
+            return jsonify(await run_in_threadpool(weather_history, history_db.delegate, plan))
+
+        seven_days_ago = history_window_start(timedelta(days=7))
+        query = {"Time Stamp": {"$gte": seven_days_ago.isoformat()}}
+
+        if streaming:
+            # Each cursor batch is converted and encoded as it arrives
+            cursor = history_db["weatherData"].find(query, WEATHER_PROJECTION).sort("Time Stamp", 1).batch_size(STREAM_BATCH_SIZE)
+            with span("query"):
+                first = await cursor.to_list(length=STREAM_BATCH_SIZE)
+            batches = cursor_batches(cursor, first, STREAM_BATCH_SIZE)
+            return stream_json(aiter_json_array(weather_rows(batch)[0] async for batch in batches), "weather data")
+
+        docs = await timed_fetch_async(history_db["weatherData"].find(query, WEATHER_PROJECTION).sort("Time Stamp", 1))
+        data = await run_in_threadpool(weather_records, docs, max_points)
+        return jsonify(data)
+    except Exception as e:
+        logger.error(f"Error fetching weather data: {str(e)}")
+        return jsonify({"error": str(e)}, 500)
+
+
+@conditional_route("weather")
+@cached_route(CACHE_TTLS["current_weather"])
+async def current_weather(request):
+    try:
+        if not await db_available():
+            logger.error("No MongoDB connection available")
+            return jsonify({"error": "Database connection not available"}, 500)
+
+        with span("query"):
+            latest = await db["weatherData"].find_one(sort=[("Time Stamp", -1)])
+        if latest:
+            logger.debug("Retrieved latest weather data")
+            return jsonify(current_weather_payload(latest))
+
+        logger.warning("No weather data found in database")
+        return jsonify({"error": "No weather data available"}, 404)
+    except Exception as e:
+        logger.error(f"Error fetching current weather: {str(e)}")
+        return jsonify({"error": str(e)}, 500)
+
+
+async def debug_data_count(request):
+    try:
+        if not await db_available():
+            return jsonify({"error": "Database connection not available"}, 500)
+        weather_count = await db["weatherData"].count_documents({})
+        return jsonify({
+            "weatherData_count": weather_count,
+            "database": "sensordata",
+            "collection": "weatherData"
+        })
+    except Exception as e:
+        return jsonify({"error": str(e)}, 500)
+
+
+async def stream(request):
+    if not await db_available():
+        return jsonify({"error": "Database connection not available"}, 500)
+
+    # Waiting clients sit on the event loop, not on a thread each
+    subscriber = broadcaster.subscribe(AsyncSubscriber)
+    if subscriber is None:
+        return jsonify({"error": "Too many stream clients"}, 503)
+
+    async def events():
+        try:
+            yield "retry: 5000\n\n"
+            while True:
+                event = await subscriber.get(timeout=STREAM_KEEPALIVE)
+                if event is None:
+                    # Comment line keeps proxies from closing idle connections
+                    yield ": keepalive\n\n"
+                    continue
+                yield format_sse(*event)
+        finally:
+            broadcaster.unsubscribe(subscriber)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+async def debug_stream(request):
+    if not await db_available():
+        return jsonify({"error": "Database connection not available"}, 500)
+    return jsonify(broadcaster.stats())
+
+
+async def metrics(request):
+    gauges = {**cache_gauges(response_cache.stats()), **pool_stats.gauges()}
+    if mongo:
+        gauges.update(mongo.gauges())
+        gauges["dashboard_stream_clients"] = ("gauge", "Connected /api/stream clients.", broadcaster.stats()["clients"])
+    if live_windows:
+        gauges["dashboard_live_window_bytes"] = ("gauge", "Memory held by the in-memory sensor windows.",
+                                                 live_windows.stats()["bytes"])
+    return Response(metrics_registry.render(gauges, pool_stats.histograms()), media_type="text/plain; version=0.0.4")
+
+
+async def debug_live(request):
+    if live_windows is None:
+        return jsonify({"error": "Live windows not enabled (LIVE_WINDOWS)"}, 500)
+    return jsonify(live_windows.stats())
+
+
+async def debug_cache(request):
+    return jsonify(response_cache.stats())
+
+
+async def debug_connection(request):
+    if not mongo:
+        return jsonify({"error": "Database connection not configured"}, 500)
+    return jsonify({**mongo.stats(), "pool": pool_stats.stats()})
+
+
+async def debug_query_plans(request):
+    try:
+        if not await db_available():
+            return jsonify({"error": "Database connection not available"}, 500)
+        report = await run_in_threadpool(verify_query_plans, db.delegate)
+        return jsonify({
+            "collscans": sorted(name for name, result in report.items() if result.get("collscan")),
+            "queries": report
+        })
+    except Exception as e:
+        return jsonify({"error": str(e)}, 500)
+
+
+@conditional_route("room", per_room=True, history=True)
+@cached_route(CACHE_TTLS["room_data"])
+async def room_data(request):
+    room_name = request.path_params["room_name"]
+    try:
+        logger.debug(f"🔍 Fetching data for room: {room_name}")
+        if not await db_available():
+            logger.error("❌ Database connection not available")
+            return jsonify({"error": "Database connection not available"}, 500)
+
+        try:
+            engine = parse_engine(request.query_params, AGGREGATION_ENGINE)
+            cursor = parse_since(request.query_params)
+            ranged = range_requested(request.query_params)
+            plan = await history_plan(request, ("room",), timedelta(hours=24), room=room_name) if ranged else None
+        except ValueError as e:
+            return jsonify({"error": str(e)}, 400)
+
+        if plan:
+            return jsonify(await run_in_threadpool(room_history, history_db.delegate, plan, room_name))
+
+        since_param = request.query_params.get("since")
+        now = datetime.now(EST)
+        twenty_four_hours_ago = now - timedelta(hours=24)
+        window_start = max(twenty_four_hours_ago, cursor) if cursor else twenty_four_hours_ago
+        logger.debug(f"📅 Fetching data since: {window_start.isoformat()}")
+
+        if USE_ROLLUPS and engine == "pipeline":
+            resolution = pick_resolution(twenty_four_hours_ago, now, min_buckets=24)
+            with span("query"):
+                history = await read_history_async(history_db, "room", window_start, resolution, room=room_name)
+            if history or (history is not None and cursor):
+                logger.debug(f"📦 Serving {len(history)} {resolution} rollup buckets for room {room_name}")
+                return jsonify(rollup_history_payload(history, since_param))
+
+        temp_logs_collection = history_db["temperature_logs"]
+        if engine == "pipeline":
+            since = window_start.astimezone(pytz.UTC).isoformat()
+            hourly = await timed_fetch_async(temp_logs_collection.aggregate(room_hourly_pipeline(since, room_name)))
+            if not hourly and cursor:
+                return jsonify(room_history_payload([], [], [], since_param))
+            if not hourly:
+                logger.warning(f"⚠️ No data found for room: {room_name}")
+                hourly = await timed_fetch_async(temp_logs_collection.aggregate(room_hourly_pipeline(since)))
+                if not hourly:
+                    logger.error(f"❌ No data found even in fallback query")
+                    return jsonify({"error": f"No data found for room: {room_name}"}, 404)
+            logger.debug(f"✨ Pipeline returned {len(hourly)} hourly points for room {room_name}")
+            return jsonify(hourly_pipeline_payload(hourly, since_param))
+
+        room_docs = await timed_fetch_async(temp_logs_collection.find({
+            "Room": room_name,
+            "Timestamp": {"$gte": window_start.astimezone(pytz.UTC).isoformat()}
+        }).sort("Timestamp", 1))
+        logger.debug(f"📊 Found {len(room_docs)} records for room {room_name}")
+
+        if not room_docs and cursor:
+            return jsonify(room_history_payload([], [], [], since_param))
+
+        if not room_docs:
+            logger.warning(f"⚠️ No data found for room: {room_name}")
+            room_docs = await timed_fetch_async(temp_logs_collection.find({
+                "Timestamp": {"$gte": twenty_four_hours_ago.astimezone(pytz.UTC).isoformat()}
+            }).sort("Timestamp", 1))
+            logger.debug(f"📊 Found {len(room_docs)} records in fallback query")
+            if not room_docs:
+                logger.error(f"❌ No data found even in fallback query")
+                return jsonify({"error": f"No data found for room: {room_name}"}, 404)
+
+        return jsonify(await run_in_threadpool(hourly_room_averages, room_docs, since_param))
+    except Exception as e:
+        logger.error(f"❌ Error in room_data endpoint: {str(e)}")
+        logger.exception("Detailed traceback:")
+        return jsonify({"error": str(e)}, 500)
+
+
+def rooms_history_series(readings, bucket):
+    return summary_room_series(summarize(readings, "room", bucket))
+
+
+@conditional_route("room", history=True)
+@cached_route(CACHE_TTLS["room_data"])
+async def rooms_history(request):
+    try:
+        if not await db_available():
+            logger.error("❌ Database connection not available")
+            return jsonify({"error": "Database connection not available"}, 500)
+
+        try:
+            rooms = parse_rooms(request.query_params)
+            bucket = parse_bucket(request.query_params)
+            engine = parse_engine(request.query_params, AGGREGATION_ENGINE)
+            cursor = parse_since(request.query_params)
+        except ValueError as e:
+            return jsonify({"error": str(e)}, 400)
+
+        since_param = request.query_params.get("since")
+        now = datetime.now(EST)
+        twenty_four_hours_ago = now - timedelta(hours=24)
+        window_start = max(twenty_four_hours_ago, cursor) if cursor else twenty_four_hours_ago
+        since = window_start.astimezone(pytz.UTC).isoformat()
+        logger.debug(f"🔍 Fetching {bucket} history for {len(rooms)} rooms since {window_start.isoformat()}")
+
+        if USE_ROLLUPS and engine == "pipeline":
+            with span("query"):
+                histories = await read_room_histories_async(history_db, rooms, window_start, bucket)
+            if histories is not None:
+                return jsonify(rooms_history_payload(rollup_room_series(histories), rooms, since_param))
+
+        temp_logs_collection = history_db["temperature_logs"]
+        if engine == "pipeline":
+            buckets = await timed_fetch_async(temp_logs_collection.aggregate(rooms_history_pipeline(since, rooms, bucket)))
+            return jsonify(rooms_history_payload(pipeline_room_series(buckets), rooms, since_param))
+
+        readings = await timed_fetch_async(temp_logs_collection.find(
+            {"Room": {"$in": rooms}, "Timestamp": {"$gte": since}},
+            {"_id": 0, "Room": 1, "Timestamp": 1, "Temperature": 1, "Humidity": 1}
+        ))
+        logger.debug(f"📊 Found {len(readings)} records for {len(rooms)} rooms")
+        with span("parse"):
+            series = await run_in_threadpool(rooms_history_series, readings, bucket)
+        return jsonify(rooms_history_payload(series, rooms, since_param))
+    except Exception as e:
+        logger.error(f"❌ Error in rooms_history endpoint: {str(e)}")
+        logger.exception("Detailed traceback:")
+        return jsonify({"error": str(e)}, 500)
+
+
+@conditional_route("weather", "ac", "room", history=True)
+@cached_route(CACHE_TTLS["analytics"])
+async def analytics(request):
+    try:
+        if not await db_available():
+            logger.error("❌ Database connection not available")
+            return jsonify({"error": "Database connection not available"}, 500)
+
+        try:
+            base = parse_base(request.query_params)
+            max_lag = parse_max_lag(request.query_params)
+            engine = parse_engine(request.query_params, AGGREGATION_ENGINE)
+            plan = await run_in_threadpool(plan_analytics, history_db.delegate, request.query_params, engine,
+                                           USE_ROLLUPS, archive)
+        except ValueError as e:
+            return jsonify({"error": str(e)}, 400)
+
+        logger.debug(f"📈 Analytics from {plan['start'].isoformat()} to {plan['end'].isoformat()} "
+                     f"({plan['strategy']} {plan['resolution']})")
+        return jsonify(await run_in_threadpool(read_analytics, history_db.delegate, plan, base, max_lag))
+    except Exception as e:
+        logger.error(f"❌ Error in analytics endpoint: {str(e)}")
+        logger.exception("Detailed traceback:")
+        return jsonify({"error": str(e)}, 500)
+
+
+async def export_readings(request):
+    try:
+        if not await db_available():
+            logger.error("No MongoDB connection available")
+            return jsonify({"error": "Database connection not available"}, 500)
+
+        try:
+            source = parse_export_source(request.query_params)
+            export_format = parse_export_format(request.query_params)
+            start, end = parse_range(request.query_params, timedelta(hours=24))
+        except ValueError as e:
+            return jsonify({"error": str(e)}, 400)
+
+        # Archived months first, then MongoDB on the synchronous driver, read and encoded in the threadpool
+        batches = export_batches(history_db.delegate, archive, source, start, end, request.query_params.get("room"))
+        filename = f"{source}-{start:%Y%m%d}-{end:%Y%m%d}.{export_format}"
+        logger.debug(f"📤 Exporting {source} from {start.isoformat()} to {end.isoformat()} as {export_format}")
+
+        async def generate():
+            try:
+                async for chunk in iterate_in_threadpool(iter_export(batches, source, export_format)):
+                    yield chunk
+            except Exception as e:
+                logger.error(f"❌ Error streaming export: {str(e)}")
+        return StreamingResponse(
+            generate(),
+            media_type=EXPORT_FORMATS[export_format],
+            headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+        )
+    except Exception as e:
+        logger.error(f"Error exporting readings: {str(e)}")
+        return jsonify({"error": str(e)}, 500)
+
+
+routes = [
+    Route("/metrics", metrics),
+    Route("/", index),
+    Route("/api/combined-data", combined_data),
+    Route("/api/current-conditions", current_conditions),
+    Route("/api/summary", summary),
+    Route("/api/weather-data", weather_data),
+    Route("/api/current-weather", current_weather),
+    Route("/api/debug/data-count", debug_data_count),
+    Route("/api/stream", stream),
+    Route("/api/debug/stream", debug_stream),
+    Route("/api/debug/live", debug_live),
+    Route("/api/debug/cache", debug_cache),
+    Route("/api/debug/connection", debug_connection),
+    Route("/api/debug/query-plans", debug_query_plans),
+    Route("/api/room-data/{room_name}", room_data),
+    Route("/api/rooms/history", rooms_history),
+    Route("/api/analytics", analytics),
+    Route("/api/export", export_readings),
+    Mount("/static", StaticFiles(directory=os.path.join(BASE_DIR, "static")), name="static")
+]
+
+app = Starlette(routes=routes, middleware=[Middleware(RequestMetricsMiddleware)], lifespan=lifespan)
+
+if __name__ == "__main__":
+    import uvicorn
+
+    logger.info("🌐 Starting async server on all network interfaces (0.0.0.0)")
+    uvicorn.run(app, host='0.0.0.0', port=5000)
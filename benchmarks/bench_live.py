@@ -0,0 +1,77 @@
+"""Microbenchmark: the in-memory sensor windows (live.py).
+
+    python -m benchmarks.bench_live [--rooms 20] [--capacity 1600]
+
+Feeds each room a day and a half of minute readings, so the ring buffers
+wrap, then reports the cost of adding a reading, of answering
+/api/current-conditions and /api/summary from memory, and the memory each
+room holds against ``live.sensor_bytes``.
+"""
+import argparse
+import time
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+
+from benchmarks.generator import generate_documents, room_names
+from live import DEFAULT_CAPACITY, LiveWindows, sensor_bytes
+from readings import SOURCES
+from stream import normalize_reading
+
+
+def make_readings(rooms, days):
+    docs = generate_documents(days=days, rooms=rooms, weather_cadence=86400)["temperature_logs"]
+    # The stream delivers readings in time order
+    readings = [normalize_reading("room", doc) for doc in docs]
+    return sorted(readings, key=lambda reading: reading["timestamp"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rooms", type=int, default=20)
+    parser.add_argument("--days", type=float, default=1.5)
+    parser.add_argument("--capacity", type=int, default=DEFAULT_CAPACITY)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    readings = make_readings(args.rooms, args.days)
+
+    def fill():
+        windows = LiveWindows(args.capacity)
+        windows.ready = True
+        for reading in readings:
+            windows.add_reading(reading)
+        return windows
+
+    start = time.perf_counter()
+    windows = fill()
+    added = time.perf_counter() - start
+    # A second store under tracemalloc (which slows the feed down) for the memory it keeps
+    tracemalloc.start()
+    kept = fill()
+    retained, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del kept
+
+    def best_of(func):
+        timings = []
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - started)
+        return min(timings)
+
+    now = datetime.now(timezone.utc) + timedelta(minutes=1)
+    current = best_of(windows.current_conditions)
+    summary = best_of(lambda: windows.summary(now))
+
+    rooms = len(room_names(args.rooms))
+    print(f"{len(readings):,} readings into {rooms} rooms (capacity {args.capacity})")
+    print(f"add:                {added / len(readings) * 1e6:8.2f} µs per reading")
+    print(f"current conditions: {current * 1000:8.3f} ms")
+    print(f"summary:            {summary * 1000:8.3f} ms")
+    print(f"memory per room:    {retained / rooms / 1024:8.1f} KB measured, "
+          f"{sensor_bytes(len(SOURCES['room']['fields']), args.capacity) / 1024:.1f} KB in arrays")
+
+
+if __name__ == "__main__":
+    main()
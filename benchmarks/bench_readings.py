@@ -0,0 +1,90 @@
+"""Microbenchmark: per-document dict normalization vs. the readings module.
+
+    python -m benchmarks.bench_readings [--count 1000000]
+
+Reports CPU time and the memory the normalized readings hold on to, per
+million room readings.
+"""
+import argparse
+import math
+import time
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+
+from benchmarks.generator import generate_documents
+from readings import read_readings
+
+
+def make_documents(count, rooms=4):
+    # Room readings as the sensors store them: temperatures as strings
+    days = math.ceil(count / (rooms * 1440))
+    docs = generate_documents(days=days, rooms=rooms, weather_cadence=86400)["temperature_logs"]
+    return docs[:count]
+
+
+def per_document(docs):
+    # What the routes did for every document: a dict of parsed values
+    rows = []
+    for doc in docs:
+        try:
+            rows.append({
+                "time": datetime.fromisoformat(doc["Timestamp"].replace("Z", "+00:00")),
+                "room": doc.get("Room"),
+                "temperature": float(doc["Temperature"]),
+                "humidity": float(doc["Humidity"])
+            })
+        except (KeyError, TypeError, ValueError):
+            continue
+    return rows
+
+
+def columnar(docs):
+    return read_readings(docs, "room")
+
+
+def best_of(func, docs, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(docs)
+        timings.append(time.perf_counter() - start)
+    return min(timings), result
+
+
+def retained_bytes(func, docs):
+    # Memory still allocated once the result is built (the documents themselves excluded)
+    tracemalloc.start()
+    result = func(docs)
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return retained, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--count", type=int, default=1_000_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    docs = make_documents(args.count)
+    count = len(docs)
+    slow, expected = best_of(per_document, docs, args.repeat)
+    fast, actual = best_of(columnar, docs, args.repeat)
+    if len(actual) != len(expected) or not np.allclose(actual.values["temperature"], [row["temperature"] for row in expected]):
+        raise SystemExit("readings differ from the per-document path")
+    del expected, actual
+
+    per_million = 1_000_000 / count
+    print(f"readings:      {count:,}")
+    for name, func, seconds in (("per-document", per_document, slow), ("readings", columnar, fast)):
+        retained, peak = retained_bytes(func, docs)
+        print(f"{name + ':':<14} {seconds:.3f} s ({seconds / count * 1e9:.0f} ns/row), "
+              f"{retained * per_million / 2**20:.0f} MB held, {peak * per_million / 2**20:.0f} MB peak per million")
+    print(f"speedup:       {slow / fast:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
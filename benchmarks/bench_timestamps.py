@@ -0,0 +1,72 @@
+"""Microbenchmark: per-row datetime/pytz handling vs. the timestamps module.
+
+    python -m benchmarks.bench_timestamps [--count 1000000]
+"""
+import argparse
+import time
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pytz
+
+from timestamps import LOCAL_TZ, format_minute_keys, parse_epoch_seconds
+
+EST = pytz.timezone(LOCAL_TZ)
+
+
+def make_timestamps(count, seed=0):
+    # Mix of the formats found in the collections, spread over several DST changes
+    rng = np.random.default_rng(seed)
+    base = datetime(2022, 1, 1, tzinfo=timezone.utc)
+    offsets = rng.integers(0, 3 * 365 * 86400, count)
+    micros = rng.integers(0, 1_000_000, count)
+    stamps = []
+    for i, (offset, micro) in enumerate(zip(offsets.tolist(), micros.tolist())):
+        moment = base + timedelta(seconds=offset, microseconds=micro)
+        stamps.append(moment.isoformat().replace("+00:00", "Z") if i % 2 else moment.isoformat())
+    return stamps
+
+
+def per_row(stamps):
+    # What the routes did for every document: parse, pytz convert, strftime
+    keys = []
+    for stamp in stamps:
+        utc_dt = datetime.fromisoformat(stamp.replace("Z", "+00:00"))
+        keys.append(utc_dt.astimezone(EST).strftime("%Y-%m-%d %H:%M"))
+    return keys
+
+
+def vectorized(stamps):
+    seconds, _ = parse_epoch_seconds(stamps)
+    return format_minute_keys(seconds // 60)
+
+
+def best_of(func, stamps, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(stamps)
+        timings.append(time.perf_counter() - start)
+    return min(timings), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--count", type=int, default=1_000_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    stamps = make_timestamps(args.count)
+    slow, expected = best_of(per_row, stamps, args.repeat)
+    fast, actual = best_of(vectorized, stamps, args.repeat)
+    if actual != expected:
+        raise SystemExit("vectorized minute keys differ from the per-row path")
+
+    print(f"timestamps:  {args.count:,}")
+    print(f"per-row:     {slow:.3f} s ({slow / args.count * 1e9:.0f} ns/row)")
+    print(f"vectorized:  {fast:.3f} s ({fast / args.count * 1e9:.0f} ns/row)")
+    print(f"speedup:     {slow / fast:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,255 @@
+"""Throughput of the production server (gunicorn.conf.py) as workers are added.
+
+    python -m benchmarks.bench_workers [--workers 1,2,4] [--duration 10]
+    python -m benchmarks.bench_workers --uri mongodb://localhost:27017/ --engine pipeline
+
+For each worker count gunicorn is started with gunicorn.conf.py and client
+processes request the dashboard endpoints over keep-alive connections for
+``--duration`` seconds. Three cache modes are run:
+
+- ``none``: response cache off, so throughput follows the CPU the workers get;
+- ``local``: one in-memory cache per worker, each computing every response;
+- ``shared``: the SQLite-backed cache, each response computed once in all.
+
+``computed`` is how many responses the workers built from MongoDB, summed
+from every worker's cache statistics when it exits. The clients run on the
+same machine, so leave them cores: scaling flattens out at the core count.
+
+Without ``--uri`` every worker fills its own mongomock copy of the same
+generated data (the ``mock_app`` factory), so only ``--engine python`` works.
+"""
+import argparse
+import atexit
+import http.client
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from multiprocessing import get_context
+from urllib.parse import quote
+
+import numpy as np
+
+from benchmarks.generator import DATABASE, add_data_arguments, check_scratch_uri, populate, room_names
+from benchmarks.harness import MOCK_URI
+
+ENDPOINTS = (
+    "/api/combined-data?engine={engine}",
+    "/api/current-conditions",
+    "/api/weather-data",
+    "/api/room-data/{room}?engine={engine}",
+    "/api/rooms/history?rooms={rooms}&bucket=1h&engine={engine}"
+)
+MODES = ("none", "local", "shared")
+
+
+def mock_app():
+    """gunicorn app factory: app.py against a per-worker mongomock copy of the data.
+
+    The data options come from BENCH_DATA (JSON); they carry a fixed ``end``,
+    so every worker generates identical documents and the data versions the
+    shared cache is keyed by agree across workers.
+    """
+    import mongomock
+    import pymongo
+
+    options = json.loads(os.environ["BENCH_DATA"])
+    options["end"] = datetime.fromisoformat(options["end"])
+    patcher = mongomock.patch(servers=(("benchmark.invalid", 27017),))
+    patcher.start()
+    populate(pymongo.MongoClient(MOCK_URI)[DATABASE], **options)
+    import app
+    _report(app.response_cache)
+    return app.app
+
+
+def uri_app():
+    """gunicorn app factory: app.py against MONGO_URI, already populated by the benchmark."""
+    import app
+    _report(app.response_cache)
+    return app.app
+
+
+def _report(cache):
+    # Each worker appends a line to BENCH_STATS once it is ready, and its cache statistics when it exits
+    def write(line):
+        with open(os.environ["BENCH_STATS"], "a") as f:
+            f.write(json.dumps(line) + "\n")
+    write({"ready": os.getpid()})
+    atexit.register(lambda: write({"stats": cache.stats()}))
+
+
+def read_reports(path):
+    try:
+        with open(path) as f:
+            return [json.loads(line) for line in f]
+    except FileNotFoundError:
+        return []
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_ready(server, stats_path, workers, timeout=600):
+    # Every worker must have loaded its data, not just the first
+    deadline = time.monotonic() + timeout
+    while sum("ready" in line for line in read_reports(stats_path)) < workers:
+        if server.poll() is not None or time.monotonic() > deadline:
+            raise SystemExit("gunicorn did not start")
+        time.sleep(0.2)
+
+
+def warm_up(port, paths):
+    # One request per path, so every mode starts with the same responses computed
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=120)
+    for path in paths:
+        connection.request("GET", path)
+        response = connection.getresponse()
+        response.read()
+        if response.status != 200:
+            raise SystemExit(f"{path} answered {response.status}")
+    connection.close()
+
+
+def client(port, paths, duration, offset):
+    """Request ``paths`` in turn on one keep-alive connection; returns the latencies in seconds."""
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=120)
+    latencies = []
+    deadline = time.perf_counter() + duration
+    i = offset
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        connection.request("GET", paths[i % len(paths)])
+        response = connection.getresponse()
+        response.read()
+        if response.status != 200:
+            raise RuntimeError(f"{paths[i % len(paths)]} answered {response.status}")
+        latencies.append(time.perf_counter() - start)
+        i += 1
+    connection.close()
+    return latencies
+
+
+def run_server(workers, mode, settings, paths):
+    """Start gunicorn with ``workers`` in cache ``mode``, load it, stop it; returns the results."""
+    port = free_port()
+    stats_path = os.path.join(tempfile.gettempdir(), f"bench-workers-{port}.jsonl")
+    env = dict(
+        os.environ,
+        BIND=f"127.0.0.1:{port}",
+        WEB_CONCURRENCY=str(workers),
+        SERVER_MODE="wsgi",
+        BENCH_STATS=stats_path,
+        BENCH_DATA=json.dumps(settings["data"]),
+        AGGREGATION_ENGINE=settings["engine"],
+        USE_ROLLUPS="false",
+        SNAPSHOT_WORKER="false",
+        CACHE_MAX_ENTRIES="0" if mode == "none" else "256",
+        SHARED_CACHE_PATH=os.path.join(tempfile.gettempdir(), f"bench-cache-{port}.sqlite") if mode == "shared" else ""
+    )
+    env["MONGO_URI"] = settings["uri"] or MOCK_URI
+    factory = "benchmarks.bench_workers:uri_app()" if settings["uri"] else "benchmarks.bench_workers:mock_app()"
+    server = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "--log-level", "warning", factory],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        wait_ready(server, stats_path, workers)
+        warm_up(port, paths)
+        with ProcessPoolExecutor(max_workers=settings["clients"], mp_context=get_context("spawn")) as pool:
+            started = time.perf_counter()
+            results = list(pool.map(client, *zip(*[(port, paths, settings["duration"], i) for i in range(settings["clients"])])))
+            elapsed = time.perf_counter() - started
+    finally:
+        server.terminate()
+        server.wait()
+
+    stats = [line["stats"] for line in read_reports(stats_path) if "stats" in line]
+    os.remove(stats_path)
+    latencies = np.concatenate([np.array(r) for r in results]) * 1000
+    return {
+        "workers": workers,
+        "mode": mode,
+        "requests": len(latencies),
+        "throughput_rps": len(latencies) / elapsed,
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p99_ms": float(np.percentile(latencies, 99)),
+        # Misses another worker had already answered cost nothing
+        "computed": sum(s["misses"] - s.get("shared_hits", 0) for s in stats) if mode != "none" else len(latencies)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", default=None, help="comma-separated worker counts (default: 1, 2, 4 ... up to the cores)")
+    parser.add_argument("--modes", default=",".join(MODES), help="comma-separated cache modes to run")
+    parser.add_argument("--clients", type=int, default=None, help="client processes (default: twice the most workers)")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds of load per run")
+    parser.add_argument("--days", type=float, default=1)
+    parser.add_argument("--engine", choices=("python", "pipeline"), default=None,
+                        help="aggregation engine (default: python on mongomock, pipeline with --uri)")
+    parser.add_argument("--uri", default=None, help="a scratch mongod instead of mongomock; its sensordata is replaced")
+    parser.add_argument("--output", default=None, help="also write the results as JSON")
+    add_data_arguments(parser)
+    args = parser.parse_args()
+
+    cores = os.cpu_count() or 1
+    if args.workers:
+        counts = [int(w) for w in args.workers.split(",")]
+    else:
+        counts = [1]
+        while counts[-1] * 2 <= cores:
+            counts.append(counts[-1] * 2)
+    data = {
+        "days": args.days,
+        "rooms": args.rooms,
+        "cadence": args.cadence,
+        "weather_cadence": args.weather_cadence,
+        "field_types": args.field_types,
+        "seed": args.seed,
+        "end": datetime.now(timezone.utc).isoformat()
+    }
+    settings = {
+        "engine": args.engine or ("pipeline" if args.uri else "python"),
+        "uri": args.uri,
+        "clients": args.clients or 2 * max(counts),
+        "duration": args.duration,
+        "data": data
+    }
+    if args.uri:
+        from pymongo import MongoClient
+
+        check_scratch_uri(args.uri)
+        populate(MongoClient(args.uri)[DATABASE], **{**data, "end": datetime.fromisoformat(data["end"])})
+
+    names = room_names(args.rooms)
+    paths = [template.format(engine=settings["engine"], room=quote(names[0]), rooms=",".join(quote(n) for n in names))
+             for template in ENDPOINTS]
+
+    print(f"cores: {cores}, clients: {settings['clients']}, {args.duration:.0f} s per run")
+    results = []
+    for mode in args.modes.split(","):
+        baseline = None
+        for workers in counts:
+            result = run_server(workers, mode, settings, paths)
+            baseline = baseline or result["throughput_rps"]
+            results.append(result)
+            print(f"{mode:<7} {workers:>3} workers: {result['throughput_rps']:8.1f} req/s "
+                  f"({result['throughput_rps'] / baseline:.2f}x), p50 {result['p50_ms']:.1f} ms, "
+                  f"p99 {result['p99_ms']:.1f} ms, {result['computed']} computed")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"cores": cores, "settings": settings, "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""Compare two harness result files and flag latency regressions.
+
+    python -m benchmarks.compare baseline.json candidate.json [--threshold 0.2]
+
+Exits with status 1 when any endpoint's p50 or p99 got slower than the
+baseline by more than ``--threshold`` (relative) and ``--min-delta-ms``
+(absolute, to ignore noise on fast routes).
+"""
+import argparse
+import json
+import sys
+
+METRICS = ("p50_ms", "p99_ms")
+
+
+def load(path):
+    with open(path) as f:
+        report = json.load(f)
+    results = {}
+    for size in report["sizes"]:
+        for name, result in size["endpoints"].items():
+            results[(size["days"], name)] = result
+    return report["meta"], results
+
+
+def compare(baseline, candidate, threshold=0.2, min_delta_ms=1.0):
+    """Rows of ``(days, endpoint, metric, old, new, regressed)`` for results in both files."""
+    rows = []
+    for key in sorted(baseline.keys() & candidate.keys()):
+        for metric in METRICS:
+            old, new = baseline[key][metric], candidate[key][metric]
+            regressed = new > old * (1 + threshold) and new - old > min_delta_ms
+            rows.append((*key, metric, old, new, regressed))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("baseline")
+    parser.add_argument("candidate")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed relative slowdown")
+    parser.add_argument("--min-delta-ms", type=float, default=1.0, help="ignore slowdowns smaller than this")
+    args = parser.parse_args()
+
+    baseline_meta, baseline = load(args.baseline)
+    candidate_meta, candidate = load(args.candidate)
+    if baseline_meta.get("settings") != candidate_meta.get("settings"):
+        print("⚠️ The two runs used different settings; timings may not be comparable")
+
+    print(f"{baseline_meta.get('commit')} -> {candidate_meta.get('commit')}")
+    rows = compare(baseline, candidate, args.threshold, args.min_delta_ms)
+    for days, name, metric, old, new, regressed in rows:
+        status = "❌" if regressed else "✅"
+        print(f"{status} {days:g}d {name:<20} {metric:<7} {old:9.2f} -> {new:9.2f} ms ({(new / old - 1) * 100 if old else 0:+.0f}%)")
+
+    regressions = [row for row in rows if row[-1]]
+    if regressions:
+        print(f"{len(regressions)} regression(s) over {args.threshold:.0%}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
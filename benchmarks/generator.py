@@ -0,0 +1,166 @@
+"""Synthetic sensor data shaped like the production collections.
+
+    python -m benchmarks.generator --uri mongodb://localhost:27017/ --days 7 --rooms 4
+
+Fills ``weatherData``, ``sensibo_logs`` and ``temperature_logs`` with
+readings ending now, so the dashboard's "last 24 hours"/"last 7 days"
+windows see them. The target collections are dropped first.
+"""
+import argparse
+import math
+import os
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+from dotenv import load_dotenv
+from pymongo import MongoClient
+
+DATABASE = "sensordata"
+ROOM_NAMES = ["Living Room", "Bedroom", "Office", "Kitchen", "Basement", "Guest Room"]
+WEATHER_CONDITIONS = [
+    ("clear sky", "01d"),
+    ("few clouds", "02d"),
+    ("scattered clouds", "03d"),
+    ("light rain", "10d"),
+    ("mist", "50d")
+]
+# "mixed" is what the sensors write today: room temperatures as strings,
+# everything else numeric
+FIELD_TYPES = ("mixed", "string", "numeric")
+
+
+def room_names(rooms):
+    return [ROOM_NAMES[i] if i < len(ROOM_NAMES) else f"Room {i + 1}" for i in range(rooms)]
+
+
+def _moments(start, end, cadence, rng):
+    # One reading per cadence with a few seconds of jitter, like the polling scripts
+    count = int((end - start).total_seconds() // cadence)
+    jitter = rng.integers(0, max(cadence // 10, 1), count)
+    micros = rng.integers(0, 1_000_000, count)
+    return [
+        start + timedelta(seconds=int(i * cadence + j), microseconds=int(us))
+        for i, j, us in zip(range(count), jitter, micros)
+    ]
+
+
+def _diurnal(moments, mean, swing, noise, rng):
+    # Warmest mid-afternoon, coolest before dawn
+    hours = np.array([m.hour + m.minute / 60 for m in moments])
+    return mean + swing * np.sin(2 * math.pi * (hours - 9) / 24) + rng.normal(0, noise, len(moments))
+
+
+def generate_documents(days=1, rooms=4, cadence=60, weather_cadence=600, field_types="mixed", end=None, seed=0):
+    """Build the documents for all three collections, keyed by collection name."""
+    if field_types not in FIELD_TYPES:
+        raise ValueError(f"field_types must be one of {', '.join(FIELD_TYPES)}")
+    rng = np.random.default_rng(seed)
+    end = end or datetime.now(timezone.utc)
+    start = end - timedelta(days=days)
+
+    weather_moments = _moments(start, end, weather_cadence, rng)
+    outside = _diurnal(weather_moments, 55, 12, 1.5, rng)
+    outside_humidity = np.clip(_diurnal(weather_moments, 65, -15, 4, rng), 10, 100)
+    wind = np.abs(rng.normal(6, 3, len(weather_moments)))
+    conditions = rng.integers(0, len(WEATHER_CONDITIONS), len(weather_moments))
+    weather = [
+        {
+            "Time Stamp": moment.isoformat(),
+            "Location": "Home",
+            "Current Temperature": round(float(temp), 2),
+            "Feels Like": round(float(temp - wind_speed / 3), 2),
+            "Humidity": int(humidity),
+            "Description": WEATHER_CONDITIONS[condition][0],
+            "Icon": WEATHER_CONDITIONS[condition][1],
+            "Wind Speed": round(float(wind_speed), 2)
+        }
+        for moment, temp, humidity, wind_speed, condition in zip(
+            weather_moments, outside, outside_humidity, wind, conditions)
+    ]
+
+    ac_moments = _moments(start, end, cadence, rng)
+    ac_temp = _diurnal(ac_moments, 71, 1.5, 0.3, rng)
+    ac_humidity = _diurnal(ac_moments, 45, 3, 1, rng)
+    ac = [
+        {
+            "Timestamp": moment.isoformat(),
+            "Temperature": round(float(temp), 1),
+            "Humidity": round(float(humidity), 1),
+            "Feels Like": round(float(temp + 0.8), 1)
+        }
+        for moment, temp, humidity in zip(ac_moments, ac_temp, ac_humidity)
+    ]
+
+    room_docs = []
+    for offset, room in enumerate(room_names(rooms)):
+        moments = _moments(start, end, cadence, rng)
+        temps = _diurnal(moments, 70 + offset * 0.7, 2, 0.4, rng)
+        humidities = _diurnal(moments, 47 - offset, 4, 1.2, rng)
+        for moment, temp, humidity in zip(moments, temps, humidities):
+            temp, humidity = round(float(temp), 1), round(float(humidity), 1)
+            if field_types != "numeric":
+                temp = f"{temp:.1f}"
+            if field_types == "string":
+                humidity = f"{humidity:.1f}"
+            room_docs.append({
+                "Timestamp": moment.isoformat(),
+                "Room": room,
+                "Temperature": temp,
+                "Humidity": humidity
+            })
+    room_docs.sort(key=lambda doc: doc["Timestamp"])
+
+    return {"weatherData": weather, "sensibo_logs": ac, "temperature_logs": room_docs}
+
+
+def populate(db, batch_size=10000, **options):
+    """Replace the sensor collections in ``db`` with generated data; returns the counts."""
+    counts = {}
+    for collection_name, docs in generate_documents(**options).items():
+        collection = db[collection_name]
+        collection.drop()
+        for i in range(0, len(docs), batch_size):
+            collection.insert_many(docs[i:i + batch_size], ordered=False)
+        counts[collection_name] = len(docs)
+    return counts
+
+
+def check_scratch_uri(uri):
+    # Never replace the collections the dashboard itself reads
+    load_dotenv()
+    dashboard_uri = os.getenv('MONGO_URI', 'mongodb://10.0.1.252:27017/')
+    if uri.rstrip("/") == dashboard_uri.rstrip("/"):
+        raise SystemExit(f"Refusing to overwrite the dashboard's database at {uri}; use a scratch mongod")
+
+
+def add_data_arguments(parser):
+    parser.add_argument("--rooms", type=int, default=4)
+    parser.add_argument("--cadence", type=int, default=60, help="seconds between AC and room readings")
+    parser.add_argument("--weather-cadence", type=int, default=600, help="seconds between weather readings")
+    parser.add_argument("--field-types", choices=FIELD_TYPES, default="mixed")
+    parser.add_argument("--seed", type=int, default=0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--uri", required=True, help="a scratch mongod; its sensordata collections are replaced")
+    parser.add_argument("--days", type=float, default=7)
+    add_data_arguments(parser)
+    args = parser.parse_args()
+    check_scratch_uri(args.uri)
+
+    counts = populate(
+        MongoClient(args.uri)[DATABASE],
+        days=args.days,
+        rooms=args.rooms,
+        cadence=args.cadence,
+        weather_cadence=args.weather_cadence,
+        field_types=args.field_types,
+        seed=args.seed
+    )
+    for collection_name, count in counts.items():
+        print(f"{collection_name}: {count} documents")
+
+
+if __name__ == "__main__":
+    main()
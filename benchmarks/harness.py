@@ -0,0 +1,227 @@
+"""Latency, throughput and memory benchmark for the app.py routes.
+
+    python -m benchmarks.harness --days 1,7 --requests 50 --output bench-results.json
+    python -m benchmarks.harness --uri mongodb://localhost:27017/ --engine pipeline
+
+Each data size runs in a fresh process: the generator fills the database,
+app.py is imported against it and every endpoint is called in-process
+through Flask's test client with the response cache disabled. Without
+``--uri`` the data lives in mongomock, which has no ``$dateFromString``,
+so only ``--engine python`` works there.
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime, timezone
+from multiprocessing import get_context
+from urllib.parse import quote
+
+import numpy as np
+
+from benchmarks.generator import DATABASE, add_data_arguments, check_scratch_uri, populate, room_names
+
+# Where app.py is pointed when the data lives in mongomock
+MOCK_URI = "mongodb://benchmark.invalid:27017/"
+
+ENDPOINTS = {
+    "combined_data": "/api/combined-data?engine={engine}",
+    "current_conditions": "/api/current-conditions",
+    "weather_data": "/api/weather-data",
+    "weather_data_stream": "/api/weather-data?stream=true",
+    "current_weather": "/api/current-weather",
+    "room_data": "/api/room-data/{room}?engine={engine}",
+    "rooms_history": "/api/rooms/history?rooms={rooms}&bucket=1h&engine={engine}",
+    "analytics": "/api/analytics?engine={engine}"
+}
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+
+def measure(app, path, requests, warmup, concurrency):
+    """Time ``requests`` GETs of ``path``; returns latency percentiles and throughput."""
+    client = app.test_client()
+    for _ in range(warmup):
+        client.get(path).close()
+
+    def worker(count):
+        worker_client = app.test_client()
+        latencies, statuses = [], {}
+        for _ in range(count):
+            start = time.perf_counter()
+            response = worker_client.get(path)
+            # Streamed bodies are produced while they are read, so reading is part of the latency
+            response.get_data()
+            latencies.append(time.perf_counter() - start)
+            response.close()
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+        return latencies, statuses
+
+    shares = [requests // concurrency + (i < requests % concurrency) for i in range(concurrency)]
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(worker, shares))
+    elapsed = time.perf_counter() - started
+
+    latencies = np.array([latency for worker_latencies, _ in results for latency in worker_latencies]) * 1000
+    statuses = {}
+    for _, worker_statuses in results:
+        for status, count in worker_statuses.items():
+            statuses[str(status)] = statuses.get(str(status), 0) + count
+
+    # Python-level peak allocation of one request, traced separately so it doesn't skew the timings.
+    # The body is read chunk by chunk, so a streamed response is never held whole
+    tracemalloc.start()
+    response = client.get(path)
+    response_bytes = sum(len(chunk) for chunk in response.iter_encoded())
+    response.close()
+    _, peak_alloc = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "path": path,
+        "requests": requests,
+        "statuses": statuses,
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p99_ms": float(np.percentile(latencies, 99)),
+        "mean_ms": float(latencies.mean()),
+        "throughput_rps": requests / elapsed,
+        "response_bytes": response_bytes,
+        "peak_alloc_mb": peak_alloc / (1024 * 1024),
+        "peak_rss_mb": peak_rss_mb()
+    }
+
+
+def _run_endpoints(options, settings):
+    # Keep the route logging (it is part of each request's cost) but off the
+    # terminal; app.py's own basicConfig is then a no-op
+    logging.basicConfig(level=logging.INFO, stream=open(os.devnull, "w"))
+    # app.py connects at import time, so it is imported once the data is in place
+    import app
+
+    names = room_names(options["rooms"])
+    room = quote(names[0])
+    rooms = ",".join(quote(name) for name in names)
+    results = {}
+    for name, template in ENDPOINTS.items():
+        path = template.format(engine=settings["engine"], room=room, rooms=rooms)
+        results[name] = measure(app.app, path, settings["requests"], settings["warmup"], settings["concurrency"])
+    return results
+
+
+def run_size(options, settings):
+    """Generate one data size and benchmark every endpoint against it (in a worker process)."""
+    # Measure the routes themselves, not the response cache
+    os.environ["CACHE_MAX_ENTRIES"] = "0"
+    os.environ["AGGREGATION_ENGINE"] = settings["engine"]
+    os.environ["USE_ROLLUPS"] = "false"
+
+    if settings["uri"]:
+        from pymongo import MongoClient
+
+        os.environ["MONGO_URI"] = settings["uri"]
+        counts = populate(MongoClient(settings["uri"])[DATABASE], **options)
+        endpoints = _run_endpoints(options, settings)
+    else:
+        try:
+            import mongomock
+        except ImportError:
+            raise SystemExit("mongomock is needed without --uri: pip install mongomock")
+        import pymongo
+
+        os.environ["MONGO_URI"] = MOCK_URI
+        with mongomock.patch(servers=(("benchmark.invalid", 27017),)):
+            counts = populate(pymongo.MongoClient(MOCK_URI)[DATABASE], **options)
+            endpoints = _run_endpoints(options, settings)
+
+    return {
+        "days": options["days"],
+        "documents": counts,
+        "peak_rss_mb": peak_rss_mb(),
+        "endpoints": endpoints
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--days", default="1,7", help="comma-separated data sizes in days")
+    parser.add_argument("--requests", type=int, default=50, help="timed requests per endpoint")
+    parser.add_argument("--warmup", type=int, default=3)
+    parser.add_argument("--concurrency", type=int, default=1, help="client threads per endpoint")
+    parser.add_argument("--engine", choices=("python", "pipeline"), default=None,
+                        help="aggregation engine (default: python on mongomock, pipeline with --uri)")
+    parser.add_argument("--uri", default=None, help="a scratch mongod instead of mongomock; its sensordata is replaced")
+    parser.add_argument("--output", default="bench-results.json")
+    add_data_arguments(parser)
+    args = parser.parse_args()
+
+    if args.uri:
+        check_scratch_uri(args.uri)
+    settings = {
+        "engine": args.engine or ("pipeline" if args.uri else "python"),
+        "uri": args.uri,
+        "requests": args.requests,
+        "warmup": args.warmup,
+        "concurrency": args.concurrency
+    }
+
+    sizes = []
+    for days in [float(d) for d in args.days.split(",")]:
+        options = {
+            "days": days,
+            "rooms": args.rooms,
+            "cadence": args.cadence,
+            "weather_cadence": args.weather_cadence,
+            "field_types": args.field_types,
+            "seed": args.seed
+        }
+        # A fresh process per size keeps peak RSS and imported state from leaking across sizes
+        with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as pool:
+            size = pool.submit(run_size, options, settings).result()
+        sizes.append(size)
+
+        print(f"{days:g} days ({sum(size['documents'].values())} documents, peak RSS {size['peak_rss_mb']:.0f} MB)")
+        for name, result in size["endpoints"].items():
+            print(f"  {name:<20} p50 {result['p50_ms']:8.2f} ms  p99 {result['p99_ms']:8.2f} ms  "
+                  f"{result['throughput_rps']:8.1f} req/s  {result['statuses']}")
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "created": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "backend": "mongod" if args.uri else "mongomock",
+            "settings": {**settings, "uri": None, "rooms": args.rooms, "cadence": args.cadence,
+                         "weather_cadence": args.weather_cadence, "field_types": args.field_types,
+                         "seed": args.seed}
+        },
+        "sizes": sizes
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {args.output}")
+
+
+if __name__ == "__main__":
+    main()
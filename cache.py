@@ -0,0 +1,369 @@
+import asyncio
+import logging
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import current_app, g, request
+
+logger = logging.getLogger(__name__)
+
+# Seconds a worker may hold a key while computing it before others give up waiting
+LEASE_TIMEOUT = 30.0
+# Seconds between checks for another worker's result
+LEASE_POLL_INTERVAL = 0.02
+
+
+class _Flight:
+    # One in-progress computation that concurrent callers wait on
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class TTLCache:
+    """Bounded LRU cache with per-entry TTLs and single-flight computation.
+
+    Concurrent misses on the same key share one ``compute()`` call: the first
+    caller runs it and the others wait for its result.
+    """
+
+    def __init__(self, max_size=256):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._inflight = {}
+        self._async_inflight = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._get_locked(key)
+        return entry[1] if entry is not None else None
+
+    def _get_locked(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def claim(self, name, seconds):
+        """Whether this process should do the periodic job ``name`` now. With
+        one process there is nobody to share it with, so always."""
+        return True
+
+    def get_or_compute(self, key, ttl, compute, cacheable=None):
+        """Return the cached value for ``key`` or compute it once for all waiters.
+
+        ``cacheable(value)`` decides whether a fresh value is stored; values
+        it rejects (e.g. error responses) are still handed to the waiters.
+        """
+        with self._lock:
+            entry = self._get_locked(key)
+            if entry is not None:
+                self.hits += 1
+                return entry[1]
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._inflight[key] = _Flight()
+                self.misses += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            flight.event.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+
+        try:
+            value = flight.value = self._fill(key, ttl, compute, cacheable)
+            return value
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            flight.event.set()
+
+    async def get_or_compute_async(self, key, ttl, compute, cacheable=None):
+        """``get_or_compute`` for coroutines: waiters await the leader's future
+        instead of blocking a thread."""
+        with self._lock:
+            entry = self._get_locked(key)
+            if entry is not None:
+                self.hits += 1
+                return entry[1]
+            future = self._async_inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._async_inflight[key] = asyncio.get_running_loop().create_future()
+                self.misses += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            # Shielded so one waiter disconnecting doesn't cancel it for the rest
+            return await asyncio.shield(future)
+
+        try:
+            value = await self._fill_async(key, ttl, compute, cacheable)
+            future.set_result(value)
+            return value
+        except Exception as e:
+            future.set_exception(e)
+            # Waiters re-raise it; mark it retrieved in case there are none
+            future.exception()
+            raise
+        finally:
+            with self._lock:
+                self._async_inflight.pop(key, None)
+            if not future.done():
+                # The leader itself was cancelled
+                future.cancel()
+
+    def _fill(self, key, ttl, compute, cacheable):
+        # The leader's computation of a missing key
+        value = compute()
+        if cacheable is None or cacheable(value):
+            self.set(key, value, ttl)
+        return value
+
+    async def _fill_async(self, key, ttl, compute, cacheable):
+        value = await compute()
+        if cacheable is None or cacheable(value):
+            self.set(key, value, ttl)
+        return value
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses + self.coalesced
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "evictions": self.evictions,
+                "in_flight": len(self._inflight) + len(self._async_inflight),
+                "hit_ratio": (self.hits + self.coalesced) / lookups if lookups else 0.0
+            }
+
+
+class SharedCache(TTLCache):
+    """``TTLCache`` backed by a SQLite file that every worker process opens,
+    so a response computed by one worker serves all of them.
+
+    Each process keeps its in-memory cache in front of the file. A key
+    missing from both is computed by one process only: it takes a lease on
+    the key, and the others poll the file for the result until the lease
+    runs out, after which they compute it themselves. Values are pickled; the
+    file is local to the server and written only by its workers. If the
+    file can't be used, the cache carries on per process.
+    """
+
+    def __init__(self, path, max_size=256, lease_timeout=LEASE_TIMEOUT):
+        super().__init__(max_size)
+        self.path = path
+        self.lease_timeout = lease_timeout
+        self.shared_hits = 0
+        self.lease_waits = 0
+        self.errors = 0
+        self._connection = None
+        self._pid = None
+        self._db_lock = threading.Lock()
+
+    def _execute(self, *statements):
+        # Runs the statements in one transaction; returns the last cursor, or None on failure
+        with self._db_lock:
+            try:
+                if self._pid != os.getpid():
+                    # A connection must not cross a fork
+                    self._connection = self._connect()
+                    self._pid = os.getpid()
+                cursor = None
+                with self._connection:
+                    for sql, params in statements:
+                        cursor = self._connection.execute(sql, params)
+                return cursor
+            except sqlite3.Error as e:
+                if not self.errors:
+                    logger.warning(f"⚠️ Shared cache unavailable, using the in-process cache: {str(e)}")
+                self.errors += 1
+                return None
+
+    def _connect(self):
+        connection = sqlite3.connect(self.path, timeout=5, check_same_thread=False)
+        # Losing the file on a crash only costs recomputation, so skip fsyncs
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=OFF")
+        connection.execute("CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, value BLOB, expires_at REAL)")
+        connection.execute("CREATE TABLE IF NOT EXISTS leases (key TEXT PRIMARY KEY, expires_at REAL)")
+        return connection
+
+    def _load(self, name):
+        cursor = self._execute(("SELECT value, expires_at FROM entries WHERE key = ? AND expires_at > ?",
+                                (name, time.time())))
+        row = cursor.fetchone() if cursor else None
+        return (pickle.loads(row[0]), row[1]) if row else None
+
+    def _lease(self, name, seconds=None):
+        # True when this process may compute the key: the lease is ours, or the file is unusable
+        now = time.time()
+        cursor = self._execute(
+            ("DELETE FROM leases WHERE key = ? AND expires_at <= ?", (name, now)),
+            ("INSERT OR IGNORE INTO leases (key, expires_at) VALUES (?, ?)",
+             (name, now + (self.lease_timeout if seconds is None else seconds)))
+        )
+        return cursor is None or cursor.rowcount == 1
+
+    def claim(self, name, seconds):
+        """Whether this process should do the periodic job ``name`` now: the
+        first worker to ask takes a lease on it for ``seconds``, and the others
+        are refused until it runs out. Not released, so the job runs about
+        once per ``seconds`` across all the workers."""
+        return self._lease(f"claim:{name}", seconds)
+
+    def _release(self, name):
+        self._execute(("DELETE FROM leases WHERE key = ?", (name,)))
+
+    def _adopt(self, key, found):
+        # Keep a copy of another worker's entry for the rest of its lifetime
+        value, expires_at = found
+        super().set(key, value, expires_at - time.time())
+        with self._lock:
+            self.shared_hits += 1
+        return value
+
+    def set(self, key, value, ttl):
+        super().set(key, value, ttl)
+        now = time.time()
+        self._execute(
+            ("INSERT OR REPLACE INTO entries (key, value, expires_at) VALUES (?, ?, ?)",
+             (repr(key), pickle.dumps(value, pickle.HIGHEST_PROTOCOL), now + ttl)),
+            ("DELETE FROM entries WHERE expires_at <= ?", (now,)),
+            # Past max_size, the entries closest to expiring go first
+            ("DELETE FROM entries WHERE key IN (SELECT key FROM entries ORDER BY expires_at DESC LIMIT -1 OFFSET ?)",
+             (self.max_size,))
+        )
+
+    def clear(self):
+        super().clear()
+        self._execute(("DELETE FROM entries", ()))
+
+    def _fill(self, key, ttl, compute, cacheable):
+        name = repr(key)
+        deadline = time.monotonic() + self.lease_timeout
+        waited = False
+        while True:
+            found = self._load(name)
+            if found is not None:
+                return self._adopt(key, found)
+            if self._lease(name) or time.monotonic() >= deadline:
+                break
+            if not waited:
+                waited = True
+                with self._lock:
+                    self.lease_waits += 1
+            time.sleep(LEASE_POLL_INTERVAL)
+        try:
+            return super()._fill(key, ttl, compute, cacheable)
+        finally:
+            self._release(name)
+
+    async def _fill_async(self, key, ttl, compute, cacheable):
+        # The SQLite calls take microseconds, so they run on the loop; only the polling yields
+        name = repr(key)
+        deadline = time.monotonic() + self.lease_timeout
+        waited = False
+        while True:
+            found = self._load(name)
+            if found is not None:
+                return self._adopt(key, found)
+            if self._lease(name) or time.monotonic() >= deadline:
+                break
+            if not waited:
+                waited = True
+                with self._lock:
+                    self.lease_waits += 1
+            await asyncio.sleep(LEASE_POLL_INTERVAL)
+        try:
+            return await super()._fill_async(key, ttl, compute, cacheable)
+        finally:
+            self._release(name)
+
+    def stats(self):
+        stats = super().stats()
+        cursor = self._execute(("SELECT COUNT(*) FROM entries WHERE expires_at > ?", (time.time(),)))
+        with self._lock:
+            lookups = self.hits + self.misses + self.coalesced
+            stats.update({
+                "shared_path": self.path,
+                "shared_size": cursor.fetchone()[0] if cursor else None,
+                "shared_hits": self.shared_hits,
+                "lease_waits": self.lease_waits,
+                "shared_errors": self.errors,
+                # Misses answered from the file didn't compute anything
+                "hit_ratio": (self.hits + self.coalesced + self.shared_hits) / lookups if lookups else 0.0
+            })
+        return stats
+
+
+def cached_view(cache, ttl, bypass=None, variant=None):
+    """Cache a Flask view's successful responses per path and query string.
+
+    Requests for which ``bypass()`` is true (streamed responses) skip the cache.
+    ``variant()`` names the representation negotiated from the Accept header;
+    it is part of the key, and responses are marked ``Vary: Accept``. Under
+    ``conditional_view`` the data version is part of the key too, so a new
+    reading is never answered from a body cached before it arrived.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if ttl <= 0 or cache.max_size <= 0 or (bypass and bypass()):
+                response = current_app.make_response(view(*args, **kwargs))
+            else:
+                def compute():
+                    response = current_app.make_response(view(*args, **kwargs))
+                    return response.status_code, response.get_data(), response.mimetype
+
+                status, body, mimetype = cache.get_or_compute(
+                    (view.__name__, request.full_path, variant() if variant else None, g.get("data_version")),
+                    ttl,
+                    compute,
+                    cacheable=lambda value: value[0] == 200
+                )
+                response = current_app.response_class(body, status=status, mimetype=mimetype)
+            if variant:
+                response.vary.add("Accept")
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,93 @@
+import json
+import struct
+
+import numpy as np
+import pandas as pd
+
+# Compact binary layout for /api/combined-data, decoded by decodeColumnarData
+# in static/src/dashboard.js. All numbers are little-endian:
+#
+#   4 bytes   magic "WDC1"
+#   uint32    header length
+#   header    UTF-8 JSON: {"rows", "start", "columns", "cursor"}
+#   padding   zero bytes up to a multiple of 4
+#   int32     one per row: minutes since the previous row (the first is 0;
+#             "start" is its epoch minute)
+#   columns   one after another, each a presence bitmap (a bit per row,
+#             least significant first) and then a value for every row
+#             whose bit is set; both parts are zero-padded to a multiple
+#             of 4 bytes
+#
+# "columns" lists ``[key, name, count, scale]`` in body order: ``name`` is
+# the room for the room_temps/room_humidity groups and null for the flat
+# columns, ``count`` the number of values present. Values are float32 when
+# ``scale`` is null and int16 multiples of ``1 / scale`` otherwise: sensor
+# readings carry one or two decimals, so most columns fit in two bytes a
+# value without losing anything. Most rows of a per-minute axis are gaps
+# for any one source, so gaps cost a bit each. The decoder expands every
+# column back to one float32 per row with NaN in the gaps.
+MAGIC = b"WDC1"
+MIMETYPE = "application/vnd.dashboard.columns"
+
+# Flat columns of the combined payload, in body order; rooms follow
+FLAT_COLUMNS = (
+    "outside_temp",
+    "outside_feels_like",
+    "outside_humidity",
+    "ac_temp",
+    "ac_humidity",
+    "ac_feels_like"
+)
+ROOM_GROUPS = ("room_temps", "room_humidity")
+
+
+# int16 scales tried, coarsest first
+SCALES = (10, 100)
+INT16_MAX = 32767
+
+
+def _floats(values):
+    # None and anything non-numeric become NaN
+    return pd.to_numeric(pd.Series(values, dtype=object), errors="coerce").to_numpy(dtype=float)
+
+
+def _pad(data):
+    return data + b"\0" * (-len(data) % 4)
+
+
+def _encode_values(values):
+    # int16 at the coarsest scale that represents every value exactly, else float32
+    for scale in SCALES:
+        scaled = np.round(values * scale)
+        if np.all(np.abs(scaled) <= INT16_MAX) and np.allclose(scaled / scale, values, rtol=0, atol=1e-9):
+            return scale, scaled.astype("<i2").tobytes()
+    return None, values.astype("<f4").tobytes()
+
+
+def _pack_column(values):
+    values = _floats(values)
+    present = ~np.isnan(values)
+    bitmap = np.packbits(present, bitorder="little").tobytes()
+    scale, encoded = _encode_values(values[present])
+    return int(present.sum()), scale, _pad(bitmap) + _pad(encoded)
+
+
+def pack_combined(data):
+    """Encode ``alignment.combined_columns`` output in the binary layout."""
+    minutes = np.asarray(data["minutes"], dtype=np.int64)
+    columns = [(key, None, data[key]) for key in FLAT_COLUMNS]
+    for group in ROOM_GROUPS:
+        columns += [(group, name, values) for name, values in data[group].items()]
+    packed = [_pack_column(values) for _, _, values in columns]
+
+    header = json.dumps({
+        "rows": len(minutes),
+        "start": int(minutes[0]) if len(minutes) else None,
+        "columns": [[key, name, count, scale] for (key, name, _), (count, scale, _) in zip(columns, packed)],
+        "cursor": data["cursor"]
+    }, separators=(",", ":")).encode("utf-8")
+
+    deltas = np.diff(minutes, prepend=minutes[:1]).astype("<i4")
+    parts = [_pad(MAGIC + struct.pack("<I", len(header)) + header), deltas.tobytes()]
+    parts += [body for _, _, body in packed]
+    return b"".join(parts)
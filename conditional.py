@@ -0,0 +1,148 @@
+import asyncio
+import hashlib
+import logging
+from datetime import datetime, timedelta, timezone
+from functools import wraps
+
+from flask import current_app, g, request
+from werkzeug.http import http_date, parse_date, parse_etags
+
+from readings import SOURCES
+from timestamps import parse_epoch_seconds
+
+logger = logging.getLogger(__name__)
+
+# HTTP validators for the data routes. A route's version is the latest
+# timestamp of each collection it reads, found through the time-field
+# indexes, so answering "has anything changed?" costs one indexed
+# find_one per source instead of the route's queries and aggregation.
+
+# /api/room-data answers a room with no readings in this window with the
+# readings of every room
+ROOM_FALLBACK_WINDOW = timedelta(hours=24)
+
+
+def _version_query(source, room=None):
+    spec = SOURCES[source]
+    query = {spec["room_field"]: room} if room is not None and spec["room_field"] else {}
+    return spec["collection"], spec["time_field"], query
+
+
+def latest_timestamps(db, sources, room=None):
+    """``{source: latest timestamp}`` for the given rollup source names.
+
+    With ``room`` the room source is narrowed to that room, through the
+    ``(Room, Timestamp)`` index.
+    """
+    versions = {}
+    for source in sources:
+        collection, time_field, query = _version_query(source, room)
+        doc = db[collection].find_one(query, {time_field: 1, "_id": 0}, sort=[(time_field, -1)])
+        versions[source] = doc.get(time_field) if doc else None
+    return versions
+
+
+async def latest_timestamps_async(db, sources, room=None):
+    """``latest_timestamps`` for a Motor database, one concurrent query per source."""
+    queries = [_version_query(source, room) for source in sources]
+    docs = await asyncio.gather(*(
+        db[collection].find_one(query, {time_field: 1, "_id": 0}, sort=[(time_field, -1)])
+        for collection, time_field, query in queries
+    ))
+    return {
+        source: doc.get(time_field) if doc else None
+        for source, (_, time_field, _), doc in zip(sources, queries, docs)
+    }
+
+
+def is_fallback_room(versions, now=None):
+    """Whether a room's versions (``latest_timestamps(..., room=...)``) mean
+    /api/room-data answers with its all-rooms fallback, whose version is
+    then part of the route's."""
+    seconds, _ = parse_epoch_seconds([v for v in (versions.get("room"),) if v is not None])
+    if len(seconds) == 0:
+        return True
+    now = now or datetime.now(timezone.utc)
+    return int(seconds[0]) < (now - ROOM_FALLBACK_WINDOW).timestamp()
+
+
+def make_etag(versions, *parts):
+    """Weak ETag over the data versions and whatever else picks the representation
+    (path, query string, Accept). Weak, because streamed and buffered bodies of
+    the same data may differ byte for byte."""
+    digest = hashlib.sha1(repr((sorted(versions.items()), parts)).encode("utf-8")).hexdigest()[:20]
+    return f'W/"{digest}"'
+
+
+def last_modified(versions):
+    """The version as a UTC datetime, or None when it doesn't parse.
+
+    Only single-source versions get one: the newest of several doesn't
+    change when a lagging source catches up, which would answer
+    If-Modified-Since with a false 304. Those routes rely on the ETag.
+    """
+    if len(versions) != 1:
+        return None
+    seconds, _ = parse_epoch_seconds([v for v in versions.values() if v is not None])
+    if len(seconds) == 0:
+        return None
+    return datetime.fromtimestamp(int(seconds.max()), tz=timezone.utc)
+
+
+def is_not_modified(etag, modified, if_none_match=None, if_modified_since=None):
+    """Whether the request's validators still match; If-None-Match wins over If-Modified-Since."""
+    if if_none_match:
+        return parse_etags(if_none_match).contains_weak(etag.removeprefix("W/").strip('"'))
+    if if_modified_since and modified:
+        since = parse_date(if_modified_since)
+        return since is not None and modified <= since
+    return False
+
+
+def validator_headers(etag, modified):
+    headers = {"ETag": etag}
+    if modified:
+        headers["Last-Modified"] = http_date(modified)
+    # Let browsers keep the body but revalidate before every reuse
+    headers["Cache-Control"] = "no-cache"
+    return headers
+
+
+def conditional_view(versions):
+    """Answer a Flask view with 304 when the client's validators match.
+
+    ``versions(*args, **kwargs)`` (called with the view's arguments) returns
+    the data versions, or None to skip validation. The view only runs on a
+    miss, and its 200 responses get ``ETag`` (and ``Last-Modified`` for a
+    single source) unless they already carry their own. The ETag
+    is left in ``g.data_version`` so ``cached_view`` never answers new data
+    from an older cached body.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            try:
+                current = versions(*args, **kwargs)
+            except Exception as e:
+                logger.warning(f"⚠️ Could not read data versions for {view.__name__}: {str(e)}")
+                current = None
+            if current is None:
+                return view(*args, **kwargs)
+
+            etag = make_etag(current, request.full_path, request.headers.get("Accept", ""))
+            modified = last_modified(current)
+            g.data_version = etag
+            if is_not_modified(etag, modified, request.headers.get("If-None-Match"),
+                               request.headers.get("If-Modified-Since")):
+                response = current_app.response_class(status=304)
+            else:
+                response = current_app.make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+
+            # A view answering from a snapshot sets the validators of its own data
+            for name, value in validator_headers(etag, modified).items():
+                response.headers.setdefault(name, value)
+            return response
+        return wrapper
+    return decorator
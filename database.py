@@ -0,0 +1,250 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+
+from pymongo import MongoClient, ReadPreference
+
+logger = logging.getLogger(__name__)
+
+# The app's MongoDB connection. The client is created without touching the
+# network, so startup never waits on the database; whether it is reachable is
+# checked with a ping on first use and every HEALTH_INTERVAL seconds after.
+# A failed check makes requests fail fast and is retried after an exponential
+# backoff, so an outage at startup (or later) heals on its own.
+DATABASE_NAME = "sensordata"
+# Seconds a successful ping is trusted before the next one
+HEALTH_INTERVAL = 10.0
+# Retry delays after failed pings: 1 s, 2 s, 4 s, ... up to a minute
+BACKOFF_INITIAL = 1.0
+BACKOFF_MAX = 60.0
+HISTORY_READ_PREFERENCES = {
+    "primary": ReadPreference.PRIMARY,
+    "primaryPreferred": ReadPreference.PRIMARY_PREFERRED,
+    "secondaryPreferred": ReadPreference.SECONDARY_PREFERRED,
+    "nearest": ReadPreference.NEAREST
+}
+
+
+def client_options(listeners=()):
+    """MongoClient pool and timeout options from the MONGO_* environment settings.
+
+    The timeouts are short so a request against an unreachable server fails
+    in seconds instead of pymongo's 30 s default.
+    """
+    return {
+        "maxPoolSize": int(os.getenv('MONGO_MAX_POOL_SIZE', '50')),
+        "minPoolSize": int(os.getenv('MONGO_MIN_POOL_SIZE', '0')),
+        "maxIdleTimeMS": int(os.getenv('MONGO_MAX_IDLE_MS', '300000')),
+        # How long a request waits for a pooled connection when all are in use
+        "waitQueueTimeoutMS": int(os.getenv('MONGO_WAIT_QUEUE_TIMEOUT_MS', '2000')),
+        "serverSelectionTimeoutMS": int(os.getenv('MONGO_SERVER_SELECTION_TIMEOUT_MS', '3000')),
+        "connectTimeoutMS": int(os.getenv('MONGO_CONNECT_TIMEOUT_MS', '3000')),
+        "socketTimeoutMS": int(os.getenv('MONGO_SOCKET_TIMEOUT_MS', '30000')),
+        "event_listeners": list(listeners)
+    }
+
+
+def history_read_preference(name=None):
+    """Read preference for the history routes, from MONGO_HISTORY_READ_PREFERENCE."""
+    name = name or os.getenv('MONGO_HISTORY_READ_PREFERENCE', 'primary')
+    if name not in HISTORY_READ_PREFERENCES:
+        raise ValueError(f"MONGO_HISTORY_READ_PREFERENCE must be one of: {', '.join(HISTORY_READ_PREFERENCES)}")
+    return HISTORY_READ_PREFERENCES[name]
+
+
+class ConnectionHealth:
+    """Up/down state of a connection with exponential reconnect backoff.
+
+    ``due()`` says whether a ping is needed; ``record()`` takes its outcome
+    and returns True when the connection just came (back) up.
+    """
+
+    def __init__(self, health_interval=HEALTH_INTERVAL, backoff_initial=BACKOFF_INITIAL, backoff_max=BACKOFF_MAX):
+        self.health_interval = health_interval
+        self.backoff_initial = backoff_initial
+        self.backoff_max = backoff_max
+        self.up = False
+        self.checked_at = None
+        self.retry_delay = 0.0
+        self.failures = 0
+        self.connects = 0
+        self.last_error = None
+
+    def due(self, now):
+        if self.checked_at is None:
+            return True
+        wait = self.health_interval if self.up else self.retry_delay
+        return now - self.checked_at >= wait
+
+    def record(self, now, error=None):
+        self.checked_at = now
+        if error is None:
+            came_up = not self.up
+            self.up, self.retry_delay, self.last_error = True, 0.0, None
+            if came_up:
+                self.connects += 1
+            return came_up
+        if self.up:
+            logger.error(f"❌ Lost MongoDB connection: {str(error)}")
+        self.up = False
+        self.failures += 1
+        self.last_error = str(error)
+        self.retry_delay = min(self.backoff_max, max(self.backoff_initial, self.retry_delay * 2))
+        logger.warning(f"⚠️ MongoDB unavailable, retrying in {self.retry_delay:.0f}s: {str(error)}")
+        return False
+
+    def stats(self, now):
+        return {
+            "up": self.up,
+            "failures": self.failures,
+            "connects": self.connects,
+            "last_error": self.last_error,
+            "retry_in": max(0.0, self.checked_at + self.retry_delay - now) if self.checked_at and not self.up else 0.0
+        }
+
+
+class MongoConnection:
+    """The app's MongoClient with lazy health checks and reconnect backoff.
+
+    ``db`` is the primary database handle and ``history_db`` the same
+    database with the history read preference. ``on_connect`` callbacks
+    (index bootstrap, say) run each time the server becomes reachable, on a
+    background thread so the request that noticed doesn't wait for them.
+    """
+
+    def __init__(self, uri, listeners=(), read_preference=None, on_connect=(), client_class=MongoClient):
+        self.options = client_options(listeners)
+        self.client = client_class(uri, **self.options)
+        self.db = self.client[DATABASE_NAME]
+        self.read_preference = read_preference or ReadPreference.PRIMARY
+        self.history_db = (self.db if self.read_preference == ReadPreference.PRIMARY
+                           else self.client.get_database(DATABASE_NAME, read_preference=self.read_preference))
+        self.on_connect = list(on_connect)
+        self.health = ConnectionHealth()
+        self._lock = threading.Lock()
+        # One run of the on_connect callbacks at a time; a reconnect during a
+        # run asks for another once it finishes
+        self._hooks_lock = threading.Lock()
+        self._hooks_pending = False
+        self._hooks_running = None
+
+    def available(self):
+        """Whether MongoDB is reachable. Pings at most once per health interval
+        (or backoff delay, while it is down), so most calls cost nothing."""
+        if not self.health.due(time.monotonic()):
+            return self.health.up
+        came_up = False
+        with self._lock:
+            # Another thread may have checked while this one waited
+            if self.health.due(time.monotonic()):
+                try:
+                    self.client.admin.command("ping")
+                    error = None
+                except Exception as e:
+                    error = e
+                came_up = self.health.record(time.monotonic(), error)
+        if came_up:
+            logger.info("Successfully connected to MongoDB")
+            self._schedule_hooks()
+        return self.health.up
+
+    def _schedule_hooks(self):
+        # Start the callbacks unless a run is already going, which then runs them again
+        with self._hooks_lock:
+            self._hooks_pending = True
+            if self._hooks_running is not None:
+                return
+            self._hooks_running = self._start_hooks()
+
+    def _start_hooks(self):
+        thread = threading.Thread(target=self._run_hooks, name="mongo-on-connect", daemon=True)
+        thread.start()
+        return thread
+
+    def _next_hooks_run(self):
+        # Whether another run was asked for; clears the running flag when not
+        with self._hooks_lock:
+            if not self._hooks_pending:
+                self._hooks_running = None
+                return False
+            self._hooks_pending = False
+            return True
+
+    def _run_hooks(self):
+        while self._next_hooks_run():
+            for callback in self.on_connect:
+                try:
+                    callback(self.db)
+                except Exception as e:
+                    logger.error(f"❌ Connect hook {callback.__name__} failed: {str(e)}")
+
+    def connect_in_background(self):
+        """Run the first check on a daemon thread, so startup does not wait for it."""
+        threading.Thread(target=self.available, name="mongo-connect", daemon=True).start()
+
+    def stats(self):
+        return {
+            **self.health.stats(time.monotonic()),
+            "max_pool_size": self.options["maxPoolSize"],
+            "min_pool_size": self.options["minPoolSize"],
+            "wait_queue_timeout_ms": self.options["waitQueueTimeoutMS"],
+            "history_read_preference": self.read_preference.mongos_mode
+        }
+
+    def gauges(self):
+        stats = self.stats()
+        return {
+            "dashboard_db_up": ("gauge", "Whether the last MongoDB health check succeeded.", int(stats["up"])),
+            "dashboard_db_health_check_failures_total": ("counter", "Failed MongoDB health checks.", stats["failures"]),
+            "dashboard_db_connects_total": ("counter", "Times MongoDB became reachable.", stats["connects"]),
+            "dashboard_db_pool_max_size": ("gauge", "Configured maximum connection pool size.", stats["max_pool_size"])
+        }
+
+    def close(self):
+        self.client.close()
+
+
+class AsyncMongoConnection(MongoConnection):
+    """``MongoConnection`` for a Motor client; ``available()`` is awaited.
+
+    ``db.delegate`` (and ``history_db.delegate``) are the synchronous
+    handles underneath, sharing the pool, for worker threads. Must be
+    created inside the running loop; the ``on_connect`` callbacks (which
+    may be coroutines) run as a task on it.
+    """
+
+    def __init__(self, uri, client_class, listeners=(), read_preference=None, on_connect=()):
+        super().__init__(uri, listeners, read_preference, on_connect, client_class)
+        self._lock = asyncio.Lock()
+
+    async def available(self):
+        if not self.health.due(time.monotonic()):
+            return self.health.up
+        came_up = False
+        async with self._lock:
+            if self.health.due(time.monotonic()):
+                try:
+                    await self.client.admin.command("ping")
+                    error = None
+                except Exception as e:
+                    error = e
+                came_up = self.health.record(time.monotonic(), error)
+        if came_up:
+            logger.info("Successfully connected to MongoDB")
+            self._schedule_hooks()
+        return self.health.up
+
+    def _start_hooks(self):
+        return asyncio.get_running_loop().create_task(self._run_hooks_async())
+
+    async def _run_hooks_async(self):
+        while self._next_hooks_run():
+            for callback in self.on_connect:
+                try:
+                    result = callback(self.db)
+                    if asyncio.iscoroutine(result):
+                        await result
+                except Exception as e:
+                    logger.error(f"❌ Connect hook {callback.__name__} failed: {str(e)}")
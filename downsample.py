@@ -0,0 +1,125 @@
+import numpy as np
+import pandas as pd
+
+# Below this there is no room for the first, last and at least one bucket
+MIN_POINTS = 3
+
+
+def _bucket_edges(n, n_out):
+    # Rows 1..n-2 are split into n_out - 2 equal buckets; the first and last
+    # rows are always kept on their own
+    return np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+
+
+def lttb_indices(x, Y, n_out):
+    """Largest-Triangle-Three-Buckets over several series sharing one x axis.
+
+    ``x`` is a 1-D array of length n and ``Y`` a ``(k, n)`` float array with
+    NaN in the gaps. Returns a ``(k, n_out)`` array of selected row indices,
+    -1 where a series has no point in a bucket. The loop runs once per
+    bucket and handles every series at once, so 30 rooms cost about the same
+    as one.
+    """
+    x = np.asarray(x, dtype=float)
+    Y = np.atleast_2d(np.asarray(Y, dtype=float))
+    k, n = Y.shape
+    valid = ~np.isnan(Y)
+
+    if n_out >= n or n_out < MIN_POINTS:
+        return np.where(valid, np.arange(n), -1)
+
+    edges = _bucket_edges(n, n_out)
+    n_buckets = len(edges) - 1
+
+    # Per-bucket means for the "next bucket" vertex of each triangle
+    counts = np.add.reduceat(valid[:, :n - 1], edges[:-1], axis=1)
+    sum_x = np.add.reduceat(np.where(valid, x, 0.0)[:, :n - 1], edges[:-1], axis=1)
+    sum_y = np.add.reduceat(np.where(valid, Y, 0.0)[:, :n - 1], edges[:-1], axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean_x = np.where(counts > 0, sum_x / counts, np.nan)
+        mean_y = np.where(counts > 0, sum_y / counts, np.nan)
+
+    # The last bucket looks ahead to each series' final point
+    rows = np.arange(k)
+    last = n - 1 - np.argmax(valid[:, ::-1], axis=1)
+    first = np.argmax(valid, axis=1)
+    next_x = np.column_stack([mean_x[:, 1:], x[last]])
+    next_y = np.column_stack([mean_y[:, 1:], Y[rows, last]])
+    # Empty buckets borrow the next non-empty one
+    next_x = pd.DataFrame(next_x).bfill(axis=1).to_numpy()
+    next_y = pd.DataFrame(next_y).bfill(axis=1).to_numpy()
+
+    out = np.full((k, n_out), -1, dtype=np.int64)
+    out[:, 0] = np.where(valid[:, 0], 0, -1)
+    out[:, -1] = np.where(valid[:, -1], n - 1, -1)
+
+    anchor_x = x[first]
+    anchor_y = Y[rows, first]
+    for b in range(n_buckets):
+        start, end = edges[b], edges[b + 1]
+        bucket_valid = valid[:, start:end]
+        cx = next_x[:, b][:, None]
+        cy = next_y[:, b][:, None]
+        ax = anchor_x[:, None]
+        ay = anchor_y[:, None]
+        area = np.abs((ax - cx) * (Y[:, start:end] - ay) - (ax - x[start:end]) * (cy - ay))
+        area = np.where(bucket_valid, np.nan_to_num(area, nan=0.0), -1.0)
+        best = start + np.argmax(area, axis=1)
+        has_point = bucket_valid.any(axis=1)
+        out[:, b + 1] = np.where(has_point, best, -1)
+        anchor_x = np.where(has_point, x[best], anchor_x)
+        anchor_y = np.where(has_point, Y[rows, best], anchor_y)
+    return out
+
+
+def _to_float_matrix(columns):
+    return np.array([
+        pd.to_numeric(pd.Series(col, dtype=object), errors='coerce').to_numpy(dtype=float)
+        for col in columns
+    ], dtype=float).reshape(len(columns), -1)
+
+
+def _to_list(values):
+    column = values.astype(object)
+    column[np.isnan(values)] = None
+    return column.tolist()
+
+
+def downsample_aligned(axis, columns, max_points):
+    """Downsample columns that share one axis to at most ``max_points`` rows.
+
+    ``columns`` is ``{name: {field: list}}`` as produced by
+    ``alignment.align_columns``. Each series keeps its own LTTB pick per
+    bucket; the row it is reported on is the median of the picks in that
+    bucket, so x positions move by less than one bucket (one pixel when
+    ``max_points`` matches the chart width).
+    """
+    axis = np.asarray(axis)
+    n = len(axis)
+    if not max_points or max_points < MIN_POINTS or n <= max_points:
+        return axis, columns
+
+    keys = [(name, field) for name, fields in columns.items() for field in fields]
+    Y = _to_float_matrix([columns[name][field] for name, field in keys])
+    picks = lttb_indices(axis, Y, max_points)
+
+    edges = _bucket_edges(n, max_points)
+    bucket_mid = np.concatenate([[0], (edges[:-1] + edges[1:] - 1) // 2, [n - 1]])
+    picked = np.where(picks >= 0, picks, np.nan)
+    empty = (picks < 0).all(axis=0)
+    picked[:, empty] = bucket_mid[empty]
+    rows = np.round(np.nanmedian(picked, axis=0)).astype(np.int64)
+
+    values = np.where(picks >= 0, np.take_along_axis(Y, np.maximum(picks, 0), axis=1), np.nan)
+    result = {name: {} for name in columns}
+    for (name, field), series in zip(keys, values):
+        result[name][field] = _to_list(series)
+    return axis[rows], result
+
+
+def downsample_records(records, x, values, max_points):
+    """Keep the records LTTB selects on ``values`` (e.g. temperature)."""
+    if not max_points or max_points < MIN_POINTS or len(records) <= max_points:
+        return records
+    picks = lttb_indices(x, _to_float_matrix([values]), max_points)[0]
+    return [records[i] for i in picks[picks >= 0]]
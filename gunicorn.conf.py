@@ -0,0 +1,57 @@
+"""Production server settings: ``gunicorn -c gunicorn.conf.py``.
+
+Pre-forks WEB_CONCURRENCY workers (one per core by default) serving app.py,
+or asgi_app.py with SERVER_MODE=asgi. The workers share computed responses
+through a SQLite file (SHARED_CACHE_PATH), so a dashboard refresh is
+queried from MongoDB once per TTL however many workers there are, and
+with SNAPSHOT_WORKER the snapshots are built by one worker per interval.
+"""
+import multiprocessing
+import os
+import tempfile
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+bind = os.getenv('BIND', '0.0.0.0:5000')
+workers = int(os.getenv('WEB_CONCURRENCY', str(multiprocessing.cpu_count())))
+timeout = int(os.getenv('WEB_TIMEOUT', '60'))
+graceful_timeout = 30
+keepalive = 5
+
+if os.getenv('SERVER_MODE', 'wsgi').lower() == 'asgi':
+    wsgi_app = 'asgi_app:app'
+    worker_class = 'uvicorn.workers.UvicornWorker'
+else:
+    wsgi_app = 'app:app'
+    # Threads let a worker keep serving while one holds an /api/stream connection
+    worker_class = 'gthread'
+    threads = int(os.getenv('WEB_THREADS', '8'))
+    # A stream client holds its thread for as long as it stays connected. Past
+    # half the threads a worker turns streams away with a 503 (the dashboard
+    # keeps its one-minute polling), so the other routes always get a thread.
+    # SERVER_MODE=asgi holds idle streams on the event loop instead
+    os.environ.setdefault('STREAM_MAX_CLIENTS', str(max(1, threads // 2)))
+
+# Each worker imports the app itself: a MongoClient must not cross a fork
+preload_app = False
+
+# One cache file per server, shared by its workers
+os.environ.setdefault(
+    'SHARED_CACHE_PATH',
+    os.path.join(tempfile.gettempdir(), f"dashboard-cache-{bind.rsplit(':', 1)[-1]}.sqlite")
+)
+
+
+def on_starting(server):
+    # Entries left by a previous run may predate a deploy; start empty.
+    # An empty SHARED_CACHE_PATH keeps one cache per worker
+    path = os.environ['SHARED_CACHE_PATH']
+    if not path:
+        server.log.info(f"🚀 {workers} workers, one response cache each")
+        return
+    for stale in (path, path + '-wal', path + '-shm'):
+        if os.path.exists(stale):
+            os.remove(stale)
+    server.log.info(f"🚀 {workers} workers, response cache shared through {path}")
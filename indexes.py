@@ -0,0 +1,162 @@
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+
+from dotenv import load_dotenv
+from pymongo import ASCENDING, DESCENDING, MongoClient
+
+from pipelines import latest_per_minute_pipeline, latest_per_room_pipeline, room_hourly_pipeline, rooms_history_pipeline
+from readings import SOURCES
+from rollups import ensure_rollup_indexes
+
+logger = logging.getLogger(__name__)
+
+# Indexes the routes in app.py rely on, per collection. Range queries and
+# latest-reading lookups on the time field use the (time field, _id) index
+# that ensure_rollup_indexes creates on every raw collection
+INDEXES = {
+    "temperature_logs": [
+        # Per-room range queries and the latest-per-room DISTINCT_SCAN
+        [("Room", ASCENDING), ("Timestamp", DESCENDING)]
+    ]
+}
+# Single-field time indexes created by earlier versions; the (time field, _id)
+# index serves every query they did, so they only cost writes and memory
+REDUNDANT_INDEXES = {
+    "weatherData": ["Time Stamp_1"],
+    "sensibo_logs": ["Timestamp_1"],
+    "temperature_logs": ["Timestamp_1"]
+}
+
+
+def ensure_indexes(db):
+    """Create the indexes the dashboard queries need; a no-op when they already exist."""
+    created = []
+    for collection_name, indexes in INDEXES.items():
+        for keys in indexes:
+            created.append(db[collection_name].create_index(keys))
+    ensure_rollup_indexes(db)
+    logger.info(f"🗂️ Ensured {len(created)} indexes: {', '.join(created)}")
+    # Only once their replacement exists
+    for collection_name, names in REDUNDANT_INDEXES.items():
+        existing = db[collection_name].index_information()
+        for name in names:
+            if name in existing:
+                db[collection_name].drop_index(name)
+                logger.info(f"🗂️ Dropped redundant index {collection_name}.{name}")
+    return created
+
+
+def route_queries(now=None):
+    """The queries each route issues, keyed by ``route.query`` name.
+
+    Each value is ``(collection, kind, spec)`` where ``kind`` is ``"find"``
+    (``spec`` = filter, sort or None, limit) or ``"aggregate"`` (``spec`` = pipeline).
+    """
+    now = now or datetime.now(timezone.utc)
+    day_ago = (now - timedelta(hours=24)).isoformat()
+    week_ago = (now - timedelta(days=7)).isoformat()
+    fields = {source: list(spec["fields"].values()) for source, spec in SOURCES.items()}
+    return {
+        "combined_data.weather": ("weatherData", "find", ({"Time Stamp": {"$gte": day_ago}}, [("Time Stamp", 1)], 0)),
+        "combined_data.ac": ("sensibo_logs", "find", ({"Timestamp": {"$gte": day_ago}}, [("Timestamp", 1)], 0)),
+        "combined_data.rooms": ("temperature_logs", "find", ({"Timestamp": {"$gte": day_ago}}, [("Timestamp", 1)], 0)),
+        "combined_data.weather_pipeline": ("weatherData", "aggregate",
+                                           latest_per_minute_pipeline("Time Stamp", fields["weather"], day_ago)),
+        "combined_data.ac_pipeline": ("sensibo_logs", "aggregate",
+                                      latest_per_minute_pipeline("Timestamp", fields["ac"], day_ago)),
+        "combined_data.rooms_pipeline": ("temperature_logs", "aggregate",
+                                         latest_per_minute_pipeline("Timestamp", fields["room"], day_ago, group_field="Room")),
+        "current_conditions.weather": ("weatherData", "find", ({}, [("Time Stamp", -1)], 1)),
+        "current_conditions.ac": ("sensibo_logs", "find", ({}, [("Timestamp", -1)], 1)),
+        "current_conditions.rooms": ("temperature_logs", "aggregate", latest_per_room_pipeline()),
+        "weather_data": ("weatherData", "find", ({"Time Stamp": {"$gte": week_ago}}, [("Time Stamp", 1)], 0)),
+        "room_data.room": ("temperature_logs", "find", (
+            {"Room": "__explain__", "Timestamp": {"$gte": day_ago}}, [("Timestamp", 1)], 0)),
+        "room_data.pipeline": ("temperature_logs", "aggregate", room_hourly_pipeline(day_ago, "__explain__")),
+        "rooms_history.rooms": ("temperature_logs", "find", (
+            {"Room": {"$in": ["__explain__", "__explain_2__"]}, "Timestamp": {"$gte": day_ago}}, None, 0)),
+        "rooms_history.pipeline": ("temperature_logs", "aggregate",
+                                   rooms_history_pipeline(day_ago, ["__explain__", "__explain_2__"])),
+        # Data versions behind the ETags (conditional.latest_timestamps)
+        "versions.rooms": ("temperature_logs", "find", ({}, [("Timestamp", -1)], 1)),
+        "versions.room": ("temperature_logs", "find", ({"Room": "__explain__"}, [("Timestamp", -1)], 1))
+    }
+
+
+def _plan_stages(node, stages):
+    # Collect every "stage" name below a winning plan (classic and SBE layouts)
+    if isinstance(node, dict):
+        if "stage" in node:
+            stages.append(node["stage"])
+        for value in node.values():
+            _plan_stages(value, stages)
+    elif isinstance(node, list):
+        for value in node:
+            _plan_stages(value, stages)
+
+
+def _winning_plans(explain, plans):
+    if isinstance(explain, dict):
+        for key, value in explain.items():
+            if key == "winningPlan":
+                plans.append(value)
+            else:
+                _winning_plans(value, plans)
+    elif isinstance(explain, list):
+        for value in explain:
+            _winning_plans(value, plans)
+
+
+def explain_query(db, collection_name, kind, spec):
+    if kind == "find":
+        query, sort, limit = spec
+        cursor = db[collection_name].find(query)
+        if sort:
+            cursor = cursor.sort(sort)
+        if limit:
+            cursor = cursor.limit(limit)
+        explain = cursor.explain()
+    else:
+        explain = db.command(
+            "explain",
+            {"aggregate": collection_name, "pipeline": spec, "cursor": {}},
+            verbosity="queryPlanner"
+        )
+
+    plans = []
+    _winning_plans(explain, plans)
+    stages = []
+    _plan_stages(plans, stages)
+    return {
+        "collection": collection_name,
+        "stages": stages,
+        "collscan": "COLLSCAN" in stages
+    }
+
+
+def verify_query_plans(db, now=None):
+    """Explain every route query and flag the ones that fall back to a COLLSCAN."""
+    report = {}
+    for name, (collection_name, kind, spec) in route_queries(now).items():
+        try:
+            report[name] = explain_query(db, collection_name, kind, spec)
+        except Exception as e:
+            report[name] = {"collection": collection_name, "error": str(e)}
+        if report[name].get("collscan"):
+            logger.warning(f"⚠️ {name} uses a COLLSCAN on {collection_name}")
+    return report
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s [%(levelname)s] %(message)s',
+        datefmt='%Y-%m-%d %H:%M:%S'
+    )
+    load_dotenv()
+    db = MongoClient(os.getenv('MONGO_URI', 'mongodb://10.0.1.252:27017/'))["sensordata"]
+    ensure_indexes(db)
+    for name, result in verify_query_plans(db).items():
+        status = "❌ COLLSCAN" if result.get("collscan") else ("⚠️ " + result["error"] if "error" in result else "✅")
+        print(f"{status} {name}: {' <- '.join(result.get('stages', []))}")
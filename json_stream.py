@@ -0,0 +1,65 @@
+import itertools
+import json
+
+# Items per encoded chunk; large enough to keep per-chunk overhead small
+CHUNK_ITEMS = 1000
+
+
+def dumps(obj, default=None):
+    """Encode ``obj`` as compact JSON bytes with sorted keys, ASCII-only.
+    Buffered and streamed bodies both use it, so they are the same bytes."""
+    return json.dumps(obj, ensure_ascii=True, sort_keys=True, separators=(",", ":"), default=default).encode("utf-8")
+
+
+def json_body(obj, default=None):
+    """A whole JSON response body: ``dumps`` with a trailing newline. Every
+    buffered JSON response and snapshot goes through here, so the two apps
+    (in debug mode too) send the same bytes."""
+    return dumps(obj, default) + b"\n"
+
+
+def _encode_items(items):
+    # The items of a list, comma-separated, without the brackets
+    return dumps(list(items))[1:-1]
+
+
+def chunked(iterable, size=CHUNK_ITEMS):
+    """Split any iterable into lists of at most ``size`` items."""
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def iter_json_array(batches):
+    """Yield a JSON array chunk by chunk from an iterable of item lists.
+
+    Only one batch is encoded at a time, so the full document never exists
+    as a single string. The bytes are those of ``json_body`` on the whole list.
+    """
+    yield b"["
+    first = True
+    for batch in batches:
+        if not batch:
+            continue
+        if not first:
+            yield b","
+        yield _encode_items(batch)
+        first = False
+    yield b"]\n"
+
+
+async def aiter_json_array(batches):
+    """``iter_json_array`` over an async iterable of item lists."""
+    yield b"["
+    first = True
+    async for batch in batches:
+        if not batch:
+            continue
+        if not first:
+            yield b","
+        yield _encode_items(batch)
+        first = False
+    yield b"]\n"
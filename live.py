@@ -0,0 +1,374 @@
+import logging
+import math
+import threading
+import time
+from array import array
+from collections import deque
+from datetime import datetime, timedelta, timezone
+
+from pipelines import latest_per_room_pipeline
+from readings import SOURCES
+from stream import normalize_reading
+from timestamps import parse_epoch_seconds
+
+logger = logging.getLogger(__name__)
+
+# Resident rolling windows over the newest readings of every sensor, so
+# /api/current-conditions and /api/summary answer from memory. Each sensor
+# (weather, the AC, every room) keeps a ring buffer of its last ``capacity``
+# readings; each window keeps Welford running mean/variance and monotonic
+# deques for min/max, so a reading costs O(1) to add and to expire. The
+# store is loaded from the last 24 hours at startup (and after every
+# reconnect), then fed by the reading watcher that serves /api/stream.
+
+# Window name -> length in seconds
+WINDOWS = {"1h": 3600, "24h": 86400}
+# Readings kept per sensor: 24 hours at one a minute, with room to spare.
+# At a faster cadence the 24 h window holds the last ``capacity`` readings
+DEFAULT_CAPACITY = 1600
+# Live readings held back while the store is (re)loading
+MAX_PENDING = 10000
+# Seconds without a new reading after which the store no longer answers:
+# five of the sensors' one-minute cadences
+MAX_SILENCE = 300
+
+
+def sensor_bytes(fields, capacity=DEFAULT_CAPACITY):
+    """Fixed memory of one sensor's arrays: its timestamps and values, plus a
+    min and a max deque per field per window. With the default capacity a
+    room (two fields) holds about 138 KB, weather and the AC about 200 KB."""
+    return 8 * capacity * (1 + fields + 2 * len(WINDOWS) * fields)
+
+
+def _epoch_seconds(timestamp):
+    # One reading at a time, where the bulk parser's setup would dominate; naive times are UTC as there
+    try:
+        parsed = datetime.fromisoformat(timestamp.replace("Z", "+00:00"))
+    except (AttributeError, ValueError):
+        seconds, valid = parse_epoch_seconds([timestamp])
+        return int(seconds[0]) if valid[0] else None
+    return int((parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)).timestamp())
+
+
+class _Extreme:
+    """Monotonic deque of a window's reading numbers in a fixed array; the
+    window's minimum (``sign`` 1) or maximum (``sign`` -1) is at the front."""
+
+    __slots__ = ("seqs", "head", "size", "sign")
+
+    def __init__(self, capacity, sign):
+        self.seqs = array("q", bytes(8 * capacity))
+        self.head = 0
+        self.size = 0
+        self.sign = sign
+
+    def push(self, seq, value, value_of):
+        capacity = len(self.seqs)
+        # Readings the new one beats can never be the extreme again
+        while self.size and self.sign * value_of(self.seqs[(self.head + self.size - 1) % capacity]) >= self.sign * value:
+            self.size -= 1
+        self.seqs[(self.head + self.size) % capacity] = seq
+        self.size += 1
+
+    def expire(self, seq):
+        if self.size and self.seqs[self.head] == seq:
+            self.head = (self.head + 1) % len(self.seqs)
+            self.size -= 1
+
+    def front(self):
+        return self.seqs[self.head] if self.size else None
+
+
+class _Welford:
+    """Running count, mean and sum of squared deviations, with removal."""
+
+    __slots__ = ("count", "mean", "m2")
+
+    def __init__(self):
+        self.count, self.mean, self.m2 = 0, 0.0, 0.0
+
+    def add(self, value):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+
+    def remove(self, value):
+        if self.count <= 1:
+            self.count, self.mean, self.m2 = 0, 0.0, 0.0
+            return
+        self.count -= 1
+        delta = value - self.mean
+        self.mean -= delta / self.count
+        self.m2 = max(self.m2 - delta * (value - self.mean), 0.0)
+
+
+class _Window:
+    __slots__ = ("span", "start", "stats", "mins", "maxes", "removed")
+
+    def __init__(self, span, fields, capacity):
+        self.span = span
+        # Number of the oldest reading still in the window
+        self.start = 0
+        self.stats = [_Welford() for _ in range(fields)]
+        self.mins = [_Extreme(capacity, 1) for _ in range(fields)]
+        self.maxes = [_Extreme(capacity, -1) for _ in range(fields)]
+        # Removals since the running stats were last recomputed
+        self.removed = 0
+
+
+class SensorWindow:
+    """Ring buffer of one sensor's last ``capacity`` readings and its rolling windows.
+
+    Readings must arrive in time order; one no newer than the last is
+    refused. Missing (NaN) values are kept in the ring but left out of
+    the window stats.
+    """
+
+    def __init__(self, fields, capacity=DEFAULT_CAPACITY):
+        self.fields = list(fields)
+        self.capacity = capacity
+        self.seconds = array("q", bytes(8 * capacity))
+        self.values = array("d", bytes(8 * capacity * len(self.fields)))
+        # Number the next reading gets; reading n lives in slot n % capacity
+        self.next = 0
+        self.latest = None
+        self.windows = {name: _Window(span, len(self.fields), capacity) for name, span in WINDOWS.items()}
+
+    def _value(self, seq, field):
+        return self.values[(seq % self.capacity) * len(self.fields) + field]
+
+    def add(self, seconds, values, reading=None):
+        """Append one reading (``values`` in field order); False when it is not newer than the last."""
+        if self.next and seconds <= self.seconds[(self.next - 1) % self.capacity]:
+            return False
+        if self.next >= self.capacity:
+            # The slot about to be reused leaves every window first
+            for window in self.windows.values():
+                while window.start <= self.next - self.capacity:
+                    self._drop(window)
+
+        seq = self.next
+        slot = seq % self.capacity
+        self.seconds[slot] = seconds
+        for field, value in enumerate(values):
+            self.values[slot * len(self.fields) + field] = value
+        self.next += 1
+        self.latest = reading
+
+        for window in self.windows.values():
+            for field, value in enumerate(values):
+                if value == value:
+                    window.stats[field].add(value)
+                    window.mins[field].push(seq, value, lambda s, f=field: self._value(s, f))
+                    window.maxes[field].push(seq, value, lambda s, f=field: self._value(s, f))
+        self.expire(seconds)
+        return True
+
+    def expire(self, now):
+        """Drop the readings that have left each window by ``now`` (epoch seconds)."""
+        for window in self.windows.values():
+            cutoff = now - window.span
+            while window.start < self.next and self.seconds[window.start % self.capacity] <= cutoff:
+                self._drop(window)
+
+    def _drop(self, window):
+        seq = window.start
+        for field in range(len(self.fields)):
+            value = self._value(seq, field)
+            if value == value:
+                window.stats[field].remove(value)
+                window.mins[field].expire(seq)
+                window.maxes[field].expire(seq)
+        window.start += 1
+        window.removed += 1
+        if window.removed >= self.capacity:
+            self._recompute(window)
+
+    def _recompute(self, window):
+        # Removal lets rounding error creep into the running stats; start them afresh once per ring's worth
+        window.stats = [_Welford() for _ in self.fields]
+        for seq in range(window.start, self.next):
+            for field in range(len(self.fields)):
+                value = self._value(seq, field)
+                if value == value:
+                    window.stats[field].add(value)
+        window.removed = 0
+
+    def window_stats(self, now):
+        """``{window: {"count", "since", field: {min, max, mean, std, count}}}`` as of ``now``."""
+        self.expire(now)
+        result = {}
+        for name, window in self.windows.items():
+            count = self.next - window.start
+            stats = {
+                "count": count,
+                "since": datetime.fromtimestamp(self.seconds[window.start % self.capacity], timezone.utc).isoformat()
+                if count else None
+            }
+            for field, field_name in enumerate(self.fields):
+                running = window.stats[field]
+                low, high = window.mins[field].front(), window.maxes[field].front()
+                stats[field_name] = {
+                    "min": self._value(low, field) if low is not None else None,
+                    "max": self._value(high, field) if high is not None else None,
+                    "mean": round(running.mean, 2) if running.count else None,
+                    # Sample standard deviation
+                    "std": round(math.sqrt(running.m2 / (running.count - 1)), 2) if running.count > 1 else None,
+                    "count": running.count
+                }
+            result[name] = stats
+        return result
+
+
+class LiveWindows:
+    """Rolling windows for every sensor, kept in memory.
+
+    ``warm(db)`` (re)loads the last 24 hours from MongoDB; ``add_reading``
+    takes the watcher's normalized readings (``stream.normalize_reading``).
+    Until the first load completes ``ready`` is False and callers read
+    MongoDB instead; ``fresh()`` also turns False when the feed goes quiet.
+    """
+
+    def __init__(self, capacity=DEFAULT_CAPACITY):
+        self.capacity = capacity
+        self.ready = False
+        self.stale = 0
+        # time.monotonic() of the last reading received (or load)
+        self.received_at = None
+        self._sensors = {}
+        self._pending = deque(maxlen=MAX_PENDING)
+        self._lock = threading.Lock()
+
+    def add_reading(self, reading):
+        with self._lock:
+            self.received_at = time.monotonic()
+            if self.ready:
+                self.stale += not self._add(self._sensors, reading)
+            else:
+                self._pending.append(reading)
+
+    def fresh(self, max_silence=MAX_SILENCE, now=None):
+        """Whether the store is loaded and has received a reading in the last ``max_silence`` seconds."""
+        with self._lock:
+            if not self.ready or self.received_at is None:
+                return False
+            return (now if now is not None else time.monotonic()) - self.received_at <= max_silence
+
+    def _add(self, sensors, reading, seconds=None):
+        # False when the sensor refuses the reading for not being newer than its last
+        source = reading["source"]
+        spec = SOURCES[source]
+        room = reading.get("room")
+        if spec["room_field"] and room is None:
+            return True
+        if seconds is None:
+            seconds = _epoch_seconds(reading.get("timestamp"))
+            if seconds is None:
+                return True
+        sensor = sensors.get((source, room))
+        if sensor is None:
+            sensor = sensors[(source, room)] = SensorWindow(spec["fields"], self.capacity)
+        values = [math.nan if reading.get(name) is None else reading[name] for name in spec["fields"]]
+        return sensor.add(seconds, values, reading)
+
+    def warm(self, db, now=None):
+        """Load the last 24 hours of every source, then apply the readings that arrived meanwhile."""
+        now = now or datetime.now(timezone.utc)
+        since = (now - timedelta(seconds=max(WINDOWS.values()))).isoformat()
+        with self._lock:
+            self.ready = False
+        sensors = {}
+        stale = 0
+        for source, spec in SOURCES.items():
+            time_field = spec["time_field"]
+            docs = list(db[spec["collection"]].find({time_field: {"$gte": since}}, {"_id": 0}).sort(time_field, 1))
+            seconds, valid = parse_epoch_seconds([doc.get(time_field) for doc in docs])
+            for doc, second in zip((doc for doc, ok in zip(docs, valid) if ok), seconds.tolist()):
+                stale += not self._add(sensors, normalize_reading(source, doc), second)
+            # Sensors quiet for longer than a day still report their last reading, as the database path does
+            if spec["room_field"]:
+                latest = [group["latest"] for group in db[spec["collection"]].aggregate(latest_per_room_pipeline())]
+            else:
+                latest = [db[spec["collection"]].find_one({}, {"_id": 0}, sort=[(time_field, -1)])]
+            for doc in filter(None, latest):
+                reading = normalize_reading(source, doc)
+                if (source, reading.get("room")) not in sensors:
+                    stale += not self._add(sensors, reading)
+        with self._lock:
+            self._sensors = sensors
+            while self._pending:
+                stale += not self._add(sensors, self._pending.popleft())
+            self.stale += stale
+            # The load counts as news: the watcher has until MAX_SILENCE to deliver the next reading
+            self.received_at = time.monotonic()
+            self.ready = True
+        logger.info(f"🧮 Live windows loaded for {len(sensors)} sensors")
+
+    def _sensor(self, source, room=None):
+        return self._sensors.get((source, room))
+
+    def latest_timestamps(self, sources):
+        """``conditional.latest_timestamps`` from memory."""
+        with self._lock:
+            versions = {}
+            for source in sources:
+                latest = [sensor for (name, _), sensor in self._sensors.items() if name == source and sensor.next]
+                newest = max(latest, key=lambda sensor: sensor.seconds[(sensor.next - 1) % sensor.capacity], default=None)
+                versions[source] = newest.latest.get("timestamp") if newest else None
+            return versions
+
+    def current_conditions(self):
+        """The ``/api/current-conditions`` payload (``views.current_conditions_payload``) from memory."""
+        def latest(source, room=None, extras=()):
+            sensor = self._sensor(source, room)
+            reading = sensor.latest if sensor else {}
+            names = [*SOURCES[source]["fields"], *extras, "timestamp"]
+            return {name: reading.get(name) for name in names}
+
+        with self._lock:
+            return {
+                "outside": latest("weather", extras=("description", "icon")),
+                "ac": latest("ac"),
+                "rooms": {room: latest("room", room) for source, room in self._sensors if source == "room"}
+            }
+
+    def summary(self, now=None):
+        """Latest reading and 1 h / 24 h min, max, mean and standard deviation of every sensor."""
+        now = int((now or datetime.now(timezone.utc)).timestamp())
+
+        def sensor_summary(sensor):
+            fields = [*sensor.fields, "timestamp"]
+            return {
+                "latest": {name: sensor.latest.get(name) for name in fields} if sensor.latest else None,
+                "windows": sensor.window_stats(now)
+            }
+
+        with self._lock:
+            summary = {"outside": None, "ac": None, "rooms": {}}
+            for (source, room), sensor in self._sensors.items():
+                if source == "room":
+                    summary["rooms"][room] = sensor_summary(sensor)
+                else:
+                    summary["outside" if source == "weather" else "ac"] = sensor_summary(sensor)
+            return summary
+
+    def stats(self):
+        with self._lock:
+            return {
+                "ready": self.ready,
+                "sensors": len(self._sensors),
+                "capacity": self.capacity,
+                "readings": sum(min(sensor.next, sensor.capacity) for sensor in self._sensors.values()),
+                "bytes": sum(sensor_bytes(len(sensor.fields), self.capacity) for sensor in self._sensors.values()),
+                "stale": self.stale,
+                "pending": len(self._pending),
+                "silent_seconds": round(time.monotonic() - self.received_at, 1) if self.received_at is not None else None
+            }
+
+
+def window_summary(db, capacity=DEFAULT_CAPACITY, now=None):
+    """``LiveWindows.summary`` computed from MongoDB, for when no store is kept."""
+    windows = LiveWindows(capacity)
+    windows.warm(db, now)
+    return windows.summary(now)
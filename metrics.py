@@ -0,0 +1,282 @@
+import bisect
+import contextvars
+import itertools
+import threading
+import time
+from contextlib import contextmanager
+
+from pymongo import monitoring
+
+# Upper bounds (seconds) shared by every latency histogram
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Timings of the request being handled, if any; spans outside a request are no-ops
+_current = contextvars.ContextVar("request_timings", default=None)
+
+
+class RequestTimings:
+    """Stage durations for one request, summed per stage."""
+
+    def __init__(self, route):
+        self.route = route
+        self.started = time.perf_counter()
+        self.stages = {}
+        self._lock = threading.Lock()
+
+    def add(self, stage, seconds):
+        # Concurrent fetches (async mode, worker threads) add to the same request
+        with self._lock:
+            self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+
+def begin_request(route):
+    timings = RequestTimings(route)
+    return timings, _current.set(timings)
+
+
+def end_request(token):
+    _current.reset(token)
+
+
+@contextmanager
+def span(stage):
+    """Time a block and add it to the current request's ``stage`` total."""
+    timings = _current.get()
+    if timings is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.add(stage, time.perf_counter() - started)
+
+
+def timed_fetch(make_cursor):
+    """Run a query and drain its cursor, timing the first round trip as ``query``
+    and the remaining batches as ``drain``."""
+    with span("query"):
+        cursor = make_cursor()
+        first = next(cursor, None)
+    if first is None:
+        return []
+    with span("drain"):
+        return [first, *cursor]
+
+
+def timed_cursor(make_cursor):
+    """Run a query and time its first round trip as ``query``, leaving the rest
+    of the cursor to be read lazily (by a streamed response, say)."""
+    with span("query"):
+        cursor = make_cursor()
+        first = next(cursor, None)
+    if first is None:
+        return iter(())
+    return itertools.chain((first,), cursor)
+
+
+async def timed_fetch_async(cursor):
+    """``timed_fetch`` for a Motor cursor."""
+    with span("query"):
+        first = await cursor.to_list(length=1)
+    if not first:
+        return []
+    with span("drain"):
+        return first + await cursor.to_list(length=None)
+
+
+class Histogram:
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class MetricsRegistry:
+    """Per-route request and stage histograms, rendered in Prometheus text format."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = {}
+        self.stages = {}
+        self.statuses = {}
+
+    def observe(self, timings, status):
+        duration = time.perf_counter() - timings.started
+        with self._lock:
+            self.requests.setdefault(timings.route, Histogram()).observe(duration)
+            key = (timings.route, str(status))
+            self.statuses[key] = self.statuses.get(key, 0) + 1
+            for stage, seconds in timings.stages.items():
+                self.stages.setdefault((timings.route, stage), Histogram()).observe(seconds)
+        return duration
+
+    def render(self, gauges=None, histograms=None):
+        """Prometheus exposition text; ``gauges`` adds ``{name: (type, help, value)}`` samples
+        and ``histograms`` adds ``{name: (help, {labels: Histogram})}`` ones."""
+        lines = []
+        with self._lock:
+            lines += _histogram_lines(
+                "dashboard_request_duration_seconds", "Request latency by route.",
+                {(("route", route),): h for route, h in self.requests.items()}
+            )
+            lines += _histogram_lines(
+                "dashboard_stage_duration_seconds", "Time per request spent in each stage, by route.",
+                {(("route", route), ("stage", stage)): h for (route, stage), h in self.stages.items()}
+            )
+            lines.append("# HELP dashboard_requests_total Requests by route and status.")
+            lines.append("# TYPE dashboard_requests_total counter")
+            for (route, status), count in sorted(self.statuses.items()):
+                lines.append(f"dashboard_requests_total{_labels((('route', route), ('status', status)))} {count}")
+        for name, (help_text, labelled) in (histograms or {}).items():
+            lines += _histogram_lines(name, help_text, labelled)
+        for name, (kind, help_text, value) in (gauges or {}).items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            lines.append(f"{name} {_number(value)}")
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(pairs):
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in pairs) + "}"
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(int(value))
+
+
+def _histogram_lines(name, help_text, histograms):
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+    for labels, histogram in sorted(histograms.items()):
+        cumulative = 0
+        for bound, count in zip((*histogram.buckets, "+Inf"), histogram.counts):
+            cumulative += count
+            lines.append(f"{name}_bucket{_labels((*labels, ('le', bound)))} {cumulative}")
+        lines.append(f"{name}_sum{_labels(labels)} {histogram.sum!r}")
+        lines.append(f"{name}_count{_labels(labels)} {histogram.count}")
+    return lines
+
+
+class PoolStats(monitoring.ConnectionPoolListener):
+    """Connection pool counters from pymongo's CMAP events (all servers summed)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.open = 0
+        self.checked_out = 0
+        self.created = 0
+        self.checkout_failures = 0
+        self.pool_clears = 0
+        self.checkout_wait = Histogram()
+        self._checkout_started = {}
+
+    def _bump(self, **deltas):
+        with self._lock:
+            for name, delta in deltas.items():
+                setattr(self, name, getattr(self, name) + delta)
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        # Connections dropped after a network error or failover
+        self._bump(pool_clears=1)
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        self._bump(open=1, created=1)
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        self._bump(open=-1)
+
+    def connection_check_out_started(self, event):
+        with self._lock:
+            self._checkout_started[threading.get_ident()] = time.perf_counter()
+
+    def connection_check_out_failed(self, event):
+        with self._lock:
+            self._checkout_started.pop(threading.get_ident(), None)
+            self.checkout_failures += 1
+
+    def connection_checked_out(self, event):
+        with self._lock:
+            started = self._checkout_started.pop(threading.get_ident(), None)
+            self.checked_out += 1
+            if started is not None:
+                self.checkout_wait.observe(time.perf_counter() - started)
+
+    def connection_checked_in(self, event):
+        self._bump(checked_out=-1)
+
+    def gauges(self):
+        with self._lock:
+            return {
+                "dashboard_db_connections_open": ("gauge", "Open MongoDB connections.", self.open),
+                "dashboard_db_connections_checked_out": ("gauge", "MongoDB connections in use.", self.checked_out),
+                "dashboard_db_connections_created_total": ("counter", "MongoDB connections opened.", self.created),
+                "dashboard_db_checkout_failures_total": ("counter", "Failed pool checkouts.", self.checkout_failures),
+                "dashboard_db_pool_clears_total": ("counter", "Times the pool dropped its connections.", self.pool_clears)
+            }
+
+    def stats(self):
+        with self._lock:
+            return {
+                "open": self.open,
+                "checked_out": self.checked_out,
+                "created": self.created,
+                "checkouts": self.checkout_wait.count,
+                "checkout_failures": self.checkout_failures,
+                "checkout_wait_ms": self.checkout_wait.sum * 1000,
+                "pool_clears": self.pool_clears
+            }
+
+    def histograms(self):
+        # Checkout wait per request is what MONGO_MAX_POOL_SIZE is tuned by
+        with self._lock:
+            return {
+                "dashboard_db_checkout_wait_seconds": ("Time spent waiting for a pooled connection.", {(): self.checkout_wait})
+            }
+
+
+def cache_gauges(stats):
+    gauges = {
+        "dashboard_cache_entries": ("gauge", "Cached responses.", stats["size"]),
+        "dashboard_cache_hits_total": ("counter", "Response cache hits.", stats["hits"]),
+        "dashboard_cache_misses_total": ("counter", "Response cache misses.", stats["misses"]),
+        "dashboard_cache_coalesced_total": ("counter", "Requests that waited on another's computation.",
+                                            stats["coalesced"]),
+        "dashboard_cache_evictions_total": ("counter", "Entries evicted for space.", stats["evictions"]),
+        "dashboard_cache_in_flight": ("gauge", "Computations in progress.", stats["in_flight"])
+    }
+    if "shared_hits" in stats:
+        gauges.update({
+            "dashboard_cache_shared_hits_total": ("counter", "Misses answered from another worker's entry.",
+                                                  stats["shared_hits"]),
+            "dashboard_cache_lease_waits_total": ("counter", "Misses that waited on another worker's computation.",
+                                                  stats["lease_waits"])
+        })
+    return gauges
+
+
+def format_request_line(method, path, status, duration, timings):
+    # The one INFO line per request: total time and where it went
+    stages = " ".join(f"{stage}={seconds * 1000:.1f}ms" for stage, seconds in timings.stages.items())
+    return f"{method} {path} {status} {duration * 1000:.1f}ms" + (f" [{stages}]" if stages else "")
@@ -0,0 +1,174 @@
+from readings import SOURCES
+from timestamps import LOCAL_TZ
+
+
+def _parse_date(field):
+    # Timestamps are stored as ISO strings; unparseable ones become null
+    return {"$dateFromString": {"dateString": f"${field}", "onError": None, "onNull": None}}
+
+
+def _to_double(field):
+    # Room readings arrive as strings; anything that isn't numeric becomes null
+    return {"$convert": {"input": f"${field}", "to": "double", "onError": None, "onNull": None}}
+
+
+def latest_per_room_pipeline():
+    """Latest reading of every room.
+
+    Sorting on ``Room`` first matches the ``(Room, Timestamp desc)`` index,
+    so MongoDB can answer with a DISTINCT_SCAN instead of sorting the whole
+    collection.
+    """
+    return [
+        {"$sort": {"Room": 1, "Timestamp": -1}},
+        {"$group": {
+            "_id": "$Room",
+            "latest": {"$first": "$$ROOT"}
+        }}
+    ]
+
+
+def room_hourly_pipeline(since, room_name=None):
+    """Hourly (local time) temperature/humidity averages for one room, computed server-side.
+
+    Outputs ``{"_id": <hour start>, "temperature": avg, "humidity": avg}``
+    sorted by hour.
+    """
+    match = {"Timestamp": {"$gte": since}}
+    if room_name is not None:
+        match["Room"] = room_name
+    return [
+        {"$match": match},
+        {"$project": {
+            "_id": 0,
+            "time": _parse_date("Timestamp"),
+            "temperature": _to_double("Temperature"),
+            "humidity": _to_double("Humidity")
+        }},
+        {"$match": {"time": {"$ne": None}}},
+        {"$group": {
+            "_id": {"$dateTrunc": {"date": "$time", "unit": "hour", "timezone": LOCAL_TZ}},
+            "temperature": {"$avg": "$temperature"},
+            "humidity": {"$avg": "$humidity"}
+        }},
+        {"$sort": {"_id": 1}}
+    ]
+
+
+# $dateTrunc unit and binSize of each history bucket width
+BUCKET_UNITS = {
+    "1m": ("minute", 1),
+    "15m": ("minute", 15),
+    "1h": ("hour", 1),
+    "1d": ("day", 1)
+}
+
+
+def rooms_history_pipeline(since, rooms, bucket="1h"):
+    """Temperature/humidity averages per room and (local time) bucket for several rooms.
+
+    One ``$in`` match on the ``(Room, Timestamp)`` index reads every room;
+    outputs ``{"_id": {"room", "bucket"}, "temperature": avg, "humidity": avg}``
+    sorted by bucket.
+    """
+    unit, bin_size = BUCKET_UNITS[bucket]
+    return [
+        {"$match": {"Room": {"$in": list(rooms)}, "Timestamp": {"$gte": since}}},
+        {"$project": {
+            "_id": 0,
+            "room": "$Room",
+            "time": _parse_date("Timestamp"),
+            "temperature": _to_double("Temperature"),
+            "humidity": _to_double("Humidity")
+        }},
+        {"$match": {"time": {"$ne": None}}},
+        {"$group": {
+            "_id": {
+                "room": "$room",
+                "bucket": {"$dateTrunc": {"date": "$time", "unit": unit, "binSize": bin_size, "timezone": LOCAL_TZ}}
+            },
+            "temperature": {"$avg": "$temperature"},
+            "humidity": {"$avg": "$humidity"}
+        }},
+        {"$sort": {"_id.bucket": 1}}
+    ]
+
+
+def history_buckets_pipeline(source, since, until, bucket, room=None):
+    """Per-bucket averages of a source's fields between ``since`` and ``until``.
+
+    Outputs ``{"_id": {"room", "bucket"}, <field name>: avg, ...}`` sorted by
+    bucket, with the ``rollups.SOURCES`` field names; ``room`` is null for
+    sources without rooms. Long ranges are grouped inside MongoDB so only
+    the buckets leave the server.
+    """
+    spec = SOURCES[source]
+    time_field, room_field = spec["time_field"], spec["room_field"]
+    unit, bin_size = BUCKET_UNITS[bucket]
+    match = {time_field: {"$gte": since, "$lt": until}}
+    if room is not None and room_field:
+        match[room_field] = room
+    projection = {"_id": 0, "time": _parse_date(time_field)}
+    if room_field:
+        projection["room"] = f"${room_field}"
+    for name, field in spec["fields"].items():
+        projection[name] = _to_double(field)
+    # A missing room groups as null
+    group = {"_id": {
+        "room": "$room",
+        "bucket": {"$dateTrunc": {"date": "$time", "unit": unit, "binSize": bin_size, "timezone": LOCAL_TZ}}
+    }}
+    for name in spec["fields"]:
+        group[name] = {"$avg": f"${name}"}
+    return [
+        {"$match": match},
+        {"$project": projection},
+        {"$match": {"time": {"$ne": None}}},
+        {"$group": group},
+        {"$sort": {"_id.bucket": 1}}
+    ]
+
+
+def latest_per_minute_pipeline(time_field, fields, since, group_field=None):
+    """Last reading of every minute (per ``group_field`` if given), projected to ``fields``.
+
+    Output documents keep the source field names, with ``time_field`` holding
+    the minute start as a date, so they can be fed to
+    ``alignment.build_combined_data`` unchanged.
+    """
+    group_key = {"minute": {"$dateTrunc": {"date": "$time", "unit": "minute"}}}
+    projection = {"_id": 0, "time": _parse_date(time_field)}
+    for field in fields:
+        projection[field] = 1
+    if group_field:
+        projection[group_field] = 1
+        group_key["group"] = f"${group_field}"
+
+    group = {"_id": group_key}
+    output = {"_id": 0, time_field: "$_id.minute"}
+    for i, field in enumerate(fields):
+        # Field names may contain spaces, so accumulate under positional aliases
+        group[f"f{i}"] = {"$last": f"${field}"}
+        output[field] = f"$f{i}"
+    if group_field:
+        output[group_field] = "$_id.group"
+
+    return [
+        {"$match": {time_field: {"$gte": since}}},
+        {"$sort": {time_field: 1}},
+        {"$project": projection},
+        {"$match": {"time": {"$ne": None}}},
+        {"$group": group},
+        {"$sort": {"_id.minute": 1}},
+        {"$project": output}
+    ]
+
+
+def combined_pipelines(since):
+    """The latest-per-minute pipelines behind /api/combined-data, keyed by collection."""
+    return {
+        spec["collection"]: latest_per_minute_pipeline(
+            spec["time_field"], list(spec["fields"].values()), since, group_field=spec["room_field"]
+        )
+        for spec in SOURCES.values()
+    }
@@ -0,0 +1,352 @@
+import logging
+from datetime import datetime, timezone
+
+import numpy as np
+import pytz
+
+from alignment import aligned_columns, combined_columns
+from archive import table_documents, table_readings
+from downsample import downsample_aligned, downsample_records
+from metrics import span, timed_fetch
+from pipelines import history_buckets_pipeline
+from readings import SOURCES, concat_readings, nullable, read_readings
+from rollups import RESOLUTIONS, bucket_minutes, read_bucket_means, summarize_readings
+from timestamps import format_local_iso, format_minute_keys
+from views import WEATHER_PROJECTION, parse_since, room_history_payload, weather_records
+
+logger = logging.getLogger(__name__)
+
+# Long-range history: ?start=&end=&resolution= on the history routes. One
+# bounded, indexed count per source tells the planner how many raw readings
+# the range holds; it then serves them raw when they fit the row budget and
+# otherwise picks the finest bucket width that does, bucketed from the
+# rollups, in Python, or with $group inside MongoDB. A year costs about as
+# many response rows as a day. Readings the archiver moved out of MongoDB
+# are read from the Parquet archive for the part of the range before its
+# mark, and MongoDB for the rest.
+
+# Rows per response; max_points can lower it
+DEFAULT_ROW_BUDGET = 1500
+# Up to this many raw readings are bucketed in Python; beyond it, inside MongoDB
+PYTHON_BUCKET_LIMIT = 50000
+RANGE_PARAMS = ("start", "end", "resolution")
+RESOLUTION_CHOICES = ("auto", "raw", *RESOLUTIONS)
+
+
+def range_requested(args):
+    """Whether the request asks for an explicit range (or resolution) instead of the default window."""
+    return any(args.get(name) is not None for name in RANGE_PARAMS)
+
+
+def _parse_time(args, name):
+    value = args.get(name)
+    if value is None:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        raise ValueError(f"{name} must be an ISO 8601 timestamp")
+    return parsed if parsed.tzinfo else pytz.utc.localize(parsed)
+
+
+def parse_range(args, default_span, now=None):
+    """``(start, end)`` from ?start= and ?end=; end defaults to now and start to
+    ``default_span`` before it. A since cursor moves the start up, as on the
+    default windows."""
+    end = _parse_time(args, "end") or now or datetime.now(timezone.utc)
+    start = _parse_time(args, "start") or end - default_span
+    cursor = parse_since(args)
+    if cursor:
+        start = max(start, cursor)
+    if start >= end:
+        raise ValueError("start must be before end")
+    return start, end
+
+
+def parse_resolution(args):
+    resolution = args.get("resolution", "auto")
+    if resolution not in RESOLUTION_CHOICES:
+        raise ValueError(f"resolution must be one of: {', '.join(RESOLUTION_CHOICES)}")
+    return resolution
+
+
+def _iso(moment):
+    return moment.astimezone(timezone.utc).isoformat()
+
+
+def _range_query(source, start, end, room=None):
+    spec = SOURCES[source]
+    query = {spec["time_field"]: {"$gte": _iso(start), "$lt": _iso(end)}}
+    if room is not None and spec["room_field"]:
+        query[spec["room_field"]] = room
+    return query
+
+
+def count_readings(db, sources, start, end, room=None, limit=PYTHON_BUCKET_LIMIT + 1):
+    """Raw readings in the range, summed over ``sources``. Each count walks the
+    time index and stops at ``limit``, so a year costs no more than a week."""
+    with span("plan"):
+        return sum(
+            db[SOURCES[source]["collection"]].count_documents(_range_query(source, start, end, room), limit=limit)
+            for source in sources
+        )
+
+
+def bucket_for(start, end, row_budget):
+    """Finest resolution whose bucket count over the range fits the row budget."""
+    span_minutes = (end - start).total_seconds() / 60
+    for resolution, width in RESOLUTIONS.items():
+        if span_minutes / width <= row_budget:
+            return resolution
+    # Longer than the budget in days; downsampling trims the rest
+    return "1d"
+
+
+def plan_history(readings, start, end, resolution="auto", row_budget=DEFAULT_ROW_BUDGET,
+                 engine="pipeline", use_rollups=False):
+    """Decide how to answer a history request.
+
+    ``readings`` is the (bounded) raw count from ``count_readings``. Returns
+    ``{"start", "end", "resolution", "strategy", "readings", "row_budget"}``
+    where ``resolution`` is None for raw readings and ``strategy`` is one of
+    ``"raw"``, ``"rollup"``, ``"python"`` or ``"pipeline"``. An explicit
+    ``resolution="raw"`` over more readings than the row budget raises
+    ValueError, before anything is read.
+    """
+    if resolution == "raw" and readings > row_budget:
+        raise ValueError(f"resolution=raw would return more than {row_budget} readings; "
+                         "narrow the range or pick a coarser resolution")
+    if resolution == "raw" or (resolution == "auto" and readings <= row_budget):
+        strategy, resolution = "raw", None
+    else:
+        if resolution == "auto":
+            resolution = bucket_for(start, end, row_budget)
+        # Start on a bucket boundary so the first bucket is whole, as in the rollups
+        start = _bucket_start(start, resolution)
+        if use_rollups and engine == "pipeline":
+            strategy = "rollup"
+        else:
+            strategy = _bucketing_strategy(readings, engine)
+    plan = {
+        "start": start,
+        "end": end,
+        "resolution": resolution,
+        "strategy": strategy,
+        "readings": readings,
+        "row_budget": row_budget
+    }
+    logger.debug(f"🧭 History plan: {strategy} {resolution or 'raw'} for {readings} readings, budget {row_budget}")
+    return plan
+
+
+def _bucket_start(moment, resolution):
+    minute = bucket_minutes([int(moment.timestamp() // 60)], resolution)[0]
+    return datetime.fromtimestamp(int(minute) * 60, timezone.utc)
+
+
+def _bucketing_strategy(readings, engine):
+    # Few enough readings are cheaper to bucket here than to $group
+    return "python" if engine == "python" or readings <= PYTHON_BUCKET_LIMIT else "pipeline"
+
+
+def plan_request(db, args, sources, default_span, engine, use_rollups, row_budget=DEFAULT_ROW_BUDGET, room=None,
+                 archive=None):
+    """Parse the range parameters and plan the request; invalid values raise ValueError.
+
+    With an ``archive`` (``archive.ParquetArchive``) the plan's ``archived``
+    maps each source the range reaches into the archive to its mark.
+    """
+    start, end = parse_range(args, default_span)
+    resolution = parse_resolution(args)
+    archived = archive.archived(db, sources, start) if archive else {}
+    readings = count_readings(db, sources, start, end, room, limit=max(PYTHON_BUCKET_LIMIT, row_budget) + 1)
+    with span("plan"):
+        readings += sum(archive.count(source, start, min(end, mark), room) for source, mark in archived.items())
+    plan = plan_history(readings, start, end, resolution, row_budget, engine, use_rollups)
+    plan["archive"], plan["archived"] = archive, archived
+    return plan
+
+
+def _hot_start(plan, source):
+    # MongoDB holds the readings from the archive mark on
+    mark = plan.get("archived", {}).get(source)
+    return max(plan["start"], mark) if mark else plan["start"]
+
+
+def _archived_table(plan, source, room=None):
+    # The source's archived readings in the planned range, or None when it reaches no archive
+    mark = plan.get("archived", {}).get(source)
+    if not mark:
+        return None
+    with span("query"):
+        return plan["archive"].read_table(source, plan["start"], min(plan["end"], mark), room)
+
+
+def _empty_buckets(names):
+    return np.empty(0, dtype=np.int64), {name: [] for name in names}
+
+
+def _mean(stats):
+    return stats["sum"] / stats["count"] if stats else None
+
+
+def _pipeline_buckets(docs, names):
+    # pipelines.history_buckets_pipeline output, sorted by bucket
+    buckets = {}
+    for doc in docs:
+        bucket = doc["_id"]["bucket"]
+        if not bucket.tzinfo:
+            bucket = bucket.replace(tzinfo=timezone.utc)
+        minutes, columns = buckets.setdefault(doc["_id"].get("room"), ([], {name: [] for name in names}))
+        minutes.append(int(bucket.timestamp()) // 60)
+        for name in names:
+            columns[name].append(doc.get(name))
+    return {room: (np.array(minutes, dtype=np.int64), columns) for room, (minutes, columns) in buckets.items()}
+
+
+def _summary_buckets(summary, names):
+    # rollups.summarize output ({(room, minute): stats})
+    buckets = {}
+    for room, minute in sorted(summary, key=lambda key: key[1]):
+        fields = summary[(room, minute)]
+        minutes, columns = buckets.setdefault(room, ([], {name: [] for name in names}))
+        minutes.append(minute)
+        for name in names:
+            columns[name].append(_mean(fields.get(name)))
+    return {room: (np.array(minutes, dtype=np.int64), columns) for room, (minutes, columns) in buckets.items()}
+
+
+def _merge_buckets(earlier, later):
+    # Archived buckets all precede MongoDB's, so each room's columns are concatenated
+    merged = dict(earlier)
+    for room, (minutes, columns) in later.items():
+        if room in merged:
+            first_minutes, first_columns = merged[room]
+            minutes = np.concatenate([first_minutes, minutes])
+            columns = {name: first_columns[name] + values for name, values in columns.items()}
+        merged[room] = (minutes, columns)
+    return merged
+
+
+def read_buckets(db, source, plan, room=None):
+    """Bucket means of a source's fields over the planned range, per room.
+
+    Returns ``{room: (bucket epoch minutes, {field name: means})}``; sources
+    without rooms come back under None. When the rollups turn out to be
+    empty the plan falls back to bucketing the raw readings. The rollups
+    cover archived readings too; otherwise those are bucketed in Python.
+    """
+    spec = SOURCES[source]
+    names = list(spec["fields"])
+    end, resolution = plan["end"], plan["resolution"]
+    collection = db[spec["collection"]]
+
+    if plan["strategy"] == "rollup":
+        with span("query"):
+            buckets = read_bucket_means(db, source, plan["start"], resolution, room, end)
+        if buckets is not None:
+            return buckets
+        plan["strategy"] = _bucketing_strategy(plan["readings"], "pipeline")
+
+    start = _hot_start(plan, source)
+    archived = _archived_table(plan, source, room)
+    if plan["strategy"] == "pipeline":
+        docs = timed_fetch(lambda: collection.aggregate(
+            history_buckets_pipeline(source, _iso(start), _iso(end), resolution, room)))
+        buckets = _pipeline_buckets(docs, names)
+        if archived is None:
+            return buckets
+        with span("parse"):
+            return _merge_buckets(_summary_buckets(summarize_readings(table_readings(archived, source), resolution), names),
+                                  buckets)
+
+    projection = {"_id": 0, spec["time_field"]: 1, **{field: 1 for field in spec["fields"].values()}}
+    if spec["room_field"]:
+        projection[spec["room_field"]] = 1
+    docs = timed_fetch(lambda: collection.find(_range_query(source, start, end, room), projection))
+    with span("parse"):
+        readings = read_readings(docs, source)
+        if archived is not None:
+            readings = concat_readings([table_readings(archived, source), readings], source)
+        return _summary_buckets(summarize_readings(readings, resolution), names)
+
+
+def _read_raw(db, source, plan, projection=None, room=None):
+    spec = SOURCES[source]
+    docs = timed_fetch(lambda: db[spec["collection"]].find(
+        _range_query(source, _hot_start(plan, source), plan["end"], room), projection
+    ).sort(spec["time_field"], 1))
+    archived = _archived_table(plan, source, room)
+    # Raw plans hold at most row_budget readings, so archived rows can become documents
+    return docs if archived is None else table_documents(archived, source) + docs
+
+
+def weather_history(db, plan):
+    """``/api/weather-data`` records over the planned range, at most ``row_budget`` of them."""
+    if plan["strategy"] == "raw":
+        return weather_records(_read_raw(db, "weather", plan, WEATHER_PROJECTION), plan["row_budget"])
+
+    minutes, columns = read_buckets(db, "weather", plan).get(None, _empty_buckets(SOURCES["weather"]["fields"]))
+    records = [
+        {
+            "time": time_key,
+            "temperature": temperature,
+            "feels_like": feels_like,
+            "humidity": humidity,
+            "wind_speed": None,
+            "description": None,
+            "icon": None
+        }
+        for time_key, temperature, feels_like, humidity in zip(
+            format_minute_keys(minutes), columns["temperature"], columns["feels_like"], columns["humidity"])
+    ]
+    with span("align"):
+        return downsample_records(records, minutes * 60, columns["temperature"], plan["row_budget"])
+
+
+def room_history(db, plan, room_name):
+    """``/api/room-data/<room>`` history over the planned range: raw readings or bucket means."""
+    if plan["strategy"] == "raw":
+        docs = _read_raw(db, "room", plan, {"_id": 0, "Timestamp": 1, "Temperature": 1, "Humidity": 1}, room_name)
+        with span("parse"):
+            readings = read_readings(docs, "room")
+            seconds = readings.seconds
+            temperature = nullable(readings.values["temperature"]).tolist()
+            humidity = nullable(readings.values["humidity"]).tolist()
+    else:
+        minutes, columns = read_buckets(db, "room", plan, room_name).get(room_name, _empty_buckets(SOURCES["room"]["fields"]))
+        seconds, temperature, humidity = minutes * 60, columns["temperature"], columns["humidity"]
+
+    with span("align"):
+        seconds, columns = downsample_aligned(seconds, {"room": {"temperature": temperature, "humidity": humidity}},
+                                              plan["row_budget"])
+    return room_history_payload(format_local_iso(seconds), columns["room"]["temperature"], columns["room"]["humidity"])
+
+
+def combined_history(db, plan):
+    """``alignment.combined_columns`` output over the planned range, on a shared
+    minute axis (bucket starts when bucketed) of at most ``row_budget`` rows."""
+    if plan["strategy"] == "raw":
+        docs = [_read_raw(db, source, plan) for source in ("weather", "ac", "room")]
+        return combined_columns(*docs, plan["row_budget"])
+
+    series = {}
+    for source in ("weather", "ac"):
+        minutes, columns = read_buckets(db, source, plan).get(None, _empty_buckets(SOURCES[source]["fields"]))
+        series[source] = (minutes, {
+            "temp": columns["temperature"],
+            "feels_like": columns["feels_like"],
+            "humidity": columns["humidity"]
+        })
+    rooms = read_buckets(db, "room", plan)
+    room_names = sorted(name for name in rooms if name is not None)
+    for name in room_names:
+        minutes, columns = rooms[name]
+        series[("room", name)] = (minutes, {"temp": columns["temperature"], "humidity": columns["humidity"]})
+    return aligned_columns(series, room_names, plan["row_budget"])
+
+
+def row_budget(default, max_points=None):
+    """The request's row budget: the configured one, lowered by max_points."""
+    return min(default, max_points) if max_points else default
+
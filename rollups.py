@@ -0,0 +1,474 @@
+import argparse
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pandas as pd
+from dotenv import load_dotenv
+from pymongo import ASCENDING, MongoClient, UpdateOne
+
+from alignment import minute_iso
+from readings import SOURCES, after_position, nullable, read_readings
+from timestamps import LOCAL_TZ, parse_epoch_seconds
+
+logger = logging.getLogger(__name__)
+
+# Resolution name -> bucket width in minutes, finest first
+RESOLUTIONS = {
+    "1m": 1,
+    "15m": 15,
+    "1h": 60,
+    "1d": 24 * 60
+}
+
+NS_PER_MINUTE = 60 * 1_000_000_000
+STATE_COLLECTION = "rollup_state"
+BATCH_SIZE = 50000
+# Readings newer than this are left for the next run so late inserts aren't skipped
+DEFAULT_LAG = timedelta(minutes=2)
+
+
+def rollup_collection(db, resolution):
+    return db[f"rollup_{resolution}"]
+
+
+def bucket_key(minute):
+    """ISO string of a bucket start; sorts the same way the raw timestamps do."""
+    return minute_iso(minute)
+
+
+def bucket_minutes(minutes, resolution):
+    """Floor epoch minutes to the start of their bucket (daily buckets are local days)."""
+    minutes = np.asarray(minutes, dtype=np.int64)
+    if resolution == "1d":
+        local = pd.to_datetime(minutes * NS_PER_MINUTE, utc=True).tz_convert(LOCAL_TZ)
+        return local.floor("D").asi8 // NS_PER_MINUTE
+    width = RESOLUTIONS[resolution]
+    return minutes // width * width
+
+
+def ensure_rollup_indexes(db):
+    for resolution in RESOLUTIONS:
+        rollup_collection(db, resolution).create_index(
+            [("source", ASCENDING), ("room", ASCENDING), ("bucket", ASCENDING)],
+            unique=True
+        )
+    # The worker pages through each collection in (timestamp, _id) order
+    for spec in SOURCES.values():
+        db[spec["collection"]].create_index([(spec["time_field"], ASCENDING), ("_id", ASCENDING)])
+
+
+def summarize(docs, source, resolution):
+    """Group raw documents into per-bucket min/max/sum/count stats.
+
+    Returns ``{(room, bucket_minute): {field: {min, max, sum, count}}}``.
+    """
+    return summarize_readings(read_readings(docs, source), resolution)
+
+
+def summarize_readings(readings, resolution):
+    """``summarize`` for readings already normalized (from the archive, say)."""
+    spec = SOURCES[readings.source]
+    if not len(readings):
+        return {}
+
+    frame = pd.DataFrame({
+        "room": readings.rooms,
+        "bucket": bucket_minutes(readings.minutes, resolution),
+        **readings.values
+    })
+    if spec["room_field"]:
+        frame = frame[frame["room"].notna()]
+
+    names = list(spec["fields"])
+    grouped = frame.groupby(["room", "bucket"], dropna=False, sort=False)[names]
+    stats = grouped.agg(["min", "max", "sum", "count"])
+
+    summary = {}
+    for (room, bucket), row in stats.iterrows():
+        fields = {}
+        for name in names:
+            count = int(row[(name, "count")])
+            if count:
+                fields[name] = {
+                    "min": float(row[(name, "min")]),
+                    "max": float(row[(name, "max")]),
+                    "sum": float(row[(name, "sum")]),
+                    "count": count
+                }
+        if fields:
+            summary[(None if pd.isna(room) else room, int(bucket))] = fields
+    return summary
+
+
+def _set_ops(source, summary):
+    # Each bucket is written whole, so writing it again changes nothing
+    return [
+        UpdateOne({"source": source, "room": room, "bucket": bucket_key(bucket)}, {"$set": {"fields": fields}}, upsert=True)
+        for (room, bucket), fields in summary.items()
+    ]
+
+
+def get_high_water_mark(db, source):
+    state = db[STATE_COLLECTION].find_one({"_id": source})
+    return state.get("last_timestamp") if state else None
+
+
+def _position(state):
+    # (timestamp, _id) of the last reading folded in; the _id is None for marks saved before it was
+    if not state or state.get("last_timestamp") is None:
+        return None
+    return state["last_timestamp"], state.get("last_id")
+
+
+def get_position(db, source):
+    """``(timestamp, _id)`` of the last reading folded into the rollups, or None."""
+    return _position(db[STATE_COLLECTION].find_one({"_id": source}))
+
+
+def _projection(spec):
+    projection = {spec["time_field"]: 1, **{field: 1 for field in spec["fields"].values()}}
+    if spec["room_field"]:
+        projection[spec["room_field"]] = 1
+    return projection
+
+
+def _fetch_batch(db, source, position, until):
+    # Paging on (timestamp, _id) never splits or skips readings that share a timestamp
+    spec = SOURCES[source]
+    time_field = spec["time_field"]
+    query = after_position(time_field, position) if position else {time_field: {}}
+    query[time_field]["$lte"] = until
+    docs = list(db[spec["collection"]].find(query, _projection(spec))
+                .sort([(time_field, ASCENDING), ("_id", ASCENDING)]).limit(BATCH_SIZE))
+    return docs, len(docs) == BATCH_SIZE
+
+
+def _folded_before(db, source, position, since):
+    # Readings from ``since`` up to and including ``position``: the part of
+    # the batch's first minute that earlier batches already folded in
+    spec = SOURCES[source]
+    time_field = spec["time_field"]
+    timestamp, last_id = position
+    docs = db[spec["collection"]].find({time_field: {"$gte": since, "$lte": timestamp}}, _projection(spec))
+    return [doc for doc in docs if last_id is None or doc.get(time_field) != timestamp or doc["_id"] <= last_id]
+
+
+# Resolution -> the finer rollup its buckets are rebuilt from. Local days
+# are whole 15-minute buckets, as every UTC offset in use is a multiple of 15 minutes
+REBUILT_FROM = {"15m": "1m", "1h": "15m", "1d": "15m"}
+
+
+def _rebuild(db, source, resolution, touched):
+    """Stats of the ``touched`` ``(room, bucket minute)`` keys of ``resolution``,
+    merged from the finer rollup's buckets."""
+    finer = REBUILT_FROM[resolution]
+    buckets = sorted({bucket for _, bucket in touched})
+    # A local day can run to 25 hours
+    query = {"source": source, "bucket": {
+        "$gte": bucket_key(buckets[0]),
+        "$lt": bucket_key(buckets[-1] + RESOLUTIONS[resolution] + 60)
+    }}
+    if SOURCES[source]["room_field"]:
+        query["room"] = {"$in": sorted({room for room, _ in touched})}
+    docs = list(rollup_collection(db, finer).find(query, ROLLUP_PROJECTION))
+    minutes = [int(datetime.fromisoformat(doc["bucket"]).timestamp() // 60) for doc in docs]
+    summary = {}
+    for doc, bucket in zip(docs, bucket_minutes(minutes, resolution).tolist()):
+        key = (doc.get("room"), bucket)
+        if key in touched:
+            _merge_stats(summary.setdefault(key, {}), doc.get("fields", {}))
+    return summary
+
+
+def _fold(db, source, docs, position):
+    # Rewrite every bucket the batch touches from scratch: 1m from the raw
+    # readings, the coarser ones from the finer rollups. A rerun of the same
+    # batch (after a crash before the mark was saved) writes the same values
+    spec = SOURCES[source]
+    seconds, _ = parse_epoch_seconds([doc.get(spec["time_field"]) for doc in docs])
+    if not len(seconds):
+        return
+    first_minute = int(seconds.min() // 60)
+    if position:
+        # One minute early: string bounds don't compare exactly across timestamp formats
+        since = bucket_key(first_minute - 1)
+        docs = _folded_before(db, source, position, since) + docs
+    summary = {key: fields for key, fields in summarize(docs, source, "1m").items() if key[1] >= first_minute}
+    if summary:
+        rollup_collection(db, "1m").bulk_write(_set_ops(source, summary), ordered=False)
+    for resolution in REBUILT_FROM:
+        touched = {(room, int(bucket)) for room, minute in summary
+                   for bucket in bucket_minutes([minute], resolution)}
+        if touched:
+            rollup_collection(db, resolution).bulk_write(
+                _set_ops(source, _rebuild(db, source, resolution, touched)), ordered=False)
+
+
+def _save_position(db, source, position, now):
+    timestamp, last_id = position
+    db[STATE_COLLECTION].update_one(
+        {"_id": source},
+        {"$set": {"last_timestamp": timestamp, "last_id": last_id, "updated_at": now.isoformat()}},
+        upsert=True
+    )
+
+
+def rollup_source(db, source, now=None, lag=DEFAULT_LAG):
+    """Fold raw readings newer than the source's high-water mark into every rollup."""
+    spec = SOURCES[source]
+    now = now or datetime.now(timezone.utc)
+    until = (now - lag).astimezone(timezone.utc).isoformat()
+    position = get_position(db, source)
+    processed = 0
+
+    while True:
+        docs, full = _fetch_batch(db, source, position, until)
+        if not docs:
+            break
+        _fold(db, source, docs, position)
+        position = (docs[-1].get(spec["time_field"]), docs[-1]["_id"])
+        _save_position(db, source, position, now)
+        processed += len(docs)
+        if not full:
+            break
+
+    logger.info(f"📦 Rolled up {processed} {source} readings (high-water mark: {position[0] if position else None})")
+    return processed
+
+
+def run_rollups(db, now=None, lag=DEFAULT_LAG):
+    return {source: rollup_source(db, source, now=now, lag=lag) for source in SOURCES}
+
+
+def pick_resolution(start, end, min_buckets):
+    """Coarsest resolution that still yields ``min_buckets`` buckets over the range."""
+    span_minutes = (end - start).total_seconds() / 60
+    for resolution, width in reversed(RESOLUTIONS.items()):
+        if span_minutes / width >= min_buckets:
+            return resolution
+    return "1m"
+
+
+def _merge_stats(target, fields):
+    for name, stats in fields.items():
+        current = target.get(name)
+        if current is None:
+            target[name] = dict(stats)
+        else:
+            current["min"] = min(current["min"], stats["min"])
+            current["max"] = max(current["max"], stats["max"])
+            current["sum"] += stats["sum"]
+            current["count"] += stats["count"]
+
+
+def _history_queries(source, start, resolution, position, room=None, end=None):
+    # Rollup bucket query plus the raw query for readings past the high-water mark;
+    # ``room`` may be a list of rooms, read together with $in, and None on the
+    # room source reads every room
+    spec = SOURCES[source]
+    room_filter = {"$in": list(room)} if isinstance(room, (list, tuple)) else room
+    start_minute = int(start.timestamp() // 60)
+    first_bucket = bucket_key(bucket_minutes([start_minute], resolution)[0])
+    query = {"source": source, "bucket": {"$gte": first_bucket}}
+    if room_filter is not None or not spec["room_field"]:
+        query["room"] = room_filter
+    if end is not None:
+        query["bucket"]["$lt"] = end.astimezone(timezone.utc).isoformat()
+
+    time_field = spec["time_field"]
+    raw_query = after_position(time_field, position)
+    start_iso = start.astimezone(timezone.utc).isoformat()
+    raw_query[time_field]["$gte"] = max(raw_query[time_field].get("$gte", start_iso), start_iso)
+    if end is not None:
+        raw_query[time_field]["$lt"] = end.astimezone(timezone.utc).isoformat()
+    if spec["room_field"] and room_filter is not None:
+        raw_query[spec["room_field"]] = room_filter
+    projection = {"_id": 0, time_field: 1, **{field: 1 for field in spec["fields"].values()}}
+    if spec["room_field"]:
+        projection[spec["room_field"]] = 1
+    return query, raw_query, projection
+
+
+# Rollup fields read back by the history queries
+ROLLUP_PROJECTION = {"_id": 0, "room": 1, "bucket": 1, "fields": 1}
+
+
+def _assemble_histories(source, resolution, rollup_docs, tail):
+    # {room: history}; sources without rooms come back under None
+    buckets = {}
+    for doc in rollup_docs:
+        minute = int(datetime.fromisoformat(doc["bucket"]).timestamp() // 60)
+        _merge_stats(buckets.setdefault(doc.get("room"), {}).setdefault(minute, {}), doc.get("fields", {}))
+
+    # Raw readings the worker hasn't folded in yet
+    for (room, minute), fields in summarize(tail, source, resolution).items():
+        _merge_stats(buckets.setdefault(room, {}).setdefault(minute, {}), fields)
+
+    histories = {}
+    for room, by_minute in buckets.items():
+        history = histories[room] = []
+        for minute in sorted(by_minute):
+            fields = {}
+            for name, stats in by_minute[minute].items():
+                fields[name] = {
+                    "min": stats["min"],
+                    "max": stats["max"],
+                    "mean": stats["sum"] / stats["count"],
+                    "count": stats["count"]
+                }
+            history.append({
+                "bucket": datetime.fromtimestamp(minute * 60, tz=timezone.utc),
+                "fields": fields
+            })
+    return histories
+
+
+def _assemble_history(source, resolution, rollup_docs, tail):
+    # The queries were narrowed to one room (or none), so there is at most one history
+    return next(iter(_assemble_histories(source, resolution, rollup_docs, tail).values()), [])
+
+
+def read_history(db, source, start, resolution, room=None, end=None):
+    """Read bucketed history from the rollups plus raw readings past the high-water mark.
+
+    Returns a list of ``{"bucket": datetime, "fields": {name: {min, max,
+    mean, count}}}`` sorted by bucket, or ``None`` when the rollup worker
+    has never run for the source and callers should use the raw path.
+    """
+    histories = read_histories(db, source, start, resolution, room, end)
+    if histories is None:
+        return None
+    return next(iter(histories.values()), [])
+
+
+def read_histories(db, source, start, resolution, room=None, end=None):
+    """``read_history`` keyed by room: ``{room: history}`` from one rollup query
+    and one raw query. ``room`` may be a list of rooms, or None on the room
+    source for all of them; sources without rooms come back under None.
+    Rooms without data are left out."""
+    position = get_position(db, source)
+    if position is None:
+        return None
+
+    query, raw_query, projection = _history_queries(source, start, resolution, position, room, end)
+    rollup_docs = list(rollup_collection(db, resolution).find(query, ROLLUP_PROJECTION))
+    tail = list(db[SOURCES[source]["collection"]].find(raw_query, projection))
+    return _assemble_histories(source, resolution, rollup_docs, tail)
+
+
+def read_bucket_means(db, source, start, resolution, room=None, end=None):
+    """``read_histories`` reduced to bucket means, as columns:
+    ``{room: (bucket epoch minutes, {field: means})}`` with None where a
+    bucket has no readings of a field, or ``None`` when the worker has
+    never run. No dict is built per bucket, so months of hourly buckets
+    cost a few milliseconds past the query."""
+    position = get_position(db, source)
+    if position is None:
+        return None
+
+    query, raw_query, projection = _history_queries(source, start, resolution, position, room, end)
+    names = list(SOURCES[source]["fields"])
+    rollup_projection = {"_id": 0, "room": 1, "bucket": 1,
+                         **{f"fields.{name}.{stat}": 1 for name in names for stat in ("sum", "count")}}
+    rollup_docs = list(rollup_collection(db, resolution).find(query, rollup_projection))
+    tail = list(db[SOURCES[source]["collection"]].find(raw_query, projection))
+    return _assemble_means(source, resolution, rollup_docs, tail)
+
+
+def _assemble_means(source, resolution, rollup_docs, tail):
+    names = list(SOURCES[source]["fields"])
+    # Raw readings the worker hasn't folded in yet, summed per bucket like the rollups
+    summary = summarize(tail, source, resolution)
+    stats = [doc.get("fields", {}) for doc in rollup_docs] + list(summary.values())
+    if not stats:
+        return {}
+    rooms = [doc.get("room") for doc in rollup_docs] + [room for room, _ in summary]
+    buckets = np.concatenate([
+        parse_epoch_seconds([doc["bucket"] for doc in rollup_docs])[0] // 60,
+        np.array([minute for _, minute in summary], dtype=np.int64)
+    ])
+
+    # Sort by room then bucket; a bucket appears twice when the tail runs into it
+    codes, room_names = pd.factorize(np.array(rooms, dtype=object), use_na_sentinel=False)
+    order = np.lexsort((buckets, codes))
+    codes, buckets = codes[order], buckets[order]
+    starts = np.flatnonzero(np.r_[True, (codes[1:] != codes[:-1]) | (buckets[1:] != buckets[:-1])])
+    columns = {}
+    for name in names:
+        fields = [(field.get(name) or {}) for field in stats]
+        sums = np.add.reduceat(np.array([f.get("sum", 0.0) for f in fields], dtype=float)[order], starts)
+        counts = np.add.reduceat(np.array([f.get("count", 0) for f in fields], dtype=np.int64)[order], starts)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            columns[name] = nullable(np.where(counts > 0, sums / counts, np.nan))
+
+    codes, buckets = codes[starts], buckets[starts]
+    bounds = np.r_[np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]]), len(codes)]
+    means = {}
+    for first, last in zip(bounds[:-1], bounds[1:]):
+        room = room_names[codes[first]]
+        means[None if pd.isna(room) else room] = (
+            buckets[first:last], {name: column[first:last].tolist() for name, column in columns.items()}
+        )
+    return means
+
+
+def read_room_histories(db, rooms, start, resolution, end=None):
+    """``read_history`` for several rooms at once: ``{room: history}``."""
+    return read_histories(db, "room", start, resolution, list(rooms), end)
+
+
+async def read_history_async(db, source, start, resolution, room=None, end=None):
+    """``read_history`` for an async (Motor) database; the two reads run concurrently."""
+    histories = await read_histories_async(db, source, start, resolution, room, end)
+    if histories is None:
+        return None
+    return next(iter(histories.values()), [])
+
+
+async def read_room_histories_async(db, rooms, start, resolution, end=None):
+    """``read_room_histories`` for an async (Motor) database."""
+    return await read_histories_async(db, "room", start, resolution, list(rooms), end)
+
+
+async def read_histories_async(db, source, start, resolution, room=None, end=None):
+    """``read_histories`` for an async (Motor) database."""
+    position = _position(await db[STATE_COLLECTION].find_one({"_id": source}))
+    if position is None:
+        return None
+
+    query, raw_query, projection = _history_queries(source, start, resolution, position, room, end)
+    rollup_docs, tail = await asyncio.gather(
+        rollup_collection(db, resolution).find(query, ROLLUP_PROJECTION).to_list(None),
+        db[SOURCES[source]["collection"]].find(raw_query, projection).to_list(None)
+    )
+    return _assemble_histories(source, resolution, rollup_docs, tail)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Incrementally roll up raw sensor readings")
+    parser.add_argument("--interval", type=int, default=0,
+                        help="Seconds between runs; 0 runs once and exits")
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s [%(levelname)s] %(message)s',
+        datefmt='%Y-%m-%d %H:%M:%S'
+    )
+    load_dotenv()
+    db = MongoClient(os.getenv('MONGO_URI', 'mongodb://10.0.1.252:27017/'))["sensordata"]
+    ensure_rollup_indexes(db)
+
+    while True:
+        run_rollups(db)
+        if not args.interval:
+            break
+        time.sleep(args.interval)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,235 @@
+import argparse
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from functools import wraps
+
+import pytz
+from dotenv import load_dotenv
+from flask import current_app, request
+from pymongo import MongoClient
+
+from alignment import combined_columns, with_timestamps
+from columnar import MIMETYPE as COLUMNAR_MIMETYPE, pack_combined
+from conditional import is_not_modified, last_modified, latest_timestamps, make_etag, validator_headers
+from json_stream import json_body
+from pipelines import combined_pipelines, latest_per_room_pipeline
+from planner import range_requested
+from views import current_conditions_payload, parse_format, window_start
+
+logger = logging.getLogger(__name__)
+
+# Pre-built responses for the routes every viewer asks the same question of.
+# The worker rebuilds them once per interval and stores the serialized bodies
+# in ``dashboard_snapshots``; the routes answer from the latest one with a
+# single _id lookup, and compute live when it is missing or too old.
+#
+# Snapshot documents look like:
+#   {"_id": name, "body": bytes, "mimetype", "built_at": datetime,
+#    "build_ms", "versions": {source: latest timestamp}}
+SNAPSHOT_COLLECTION = "dashboard_snapshots"
+SNAPSHOT_SOURCES = ("weather", "ac", "room")
+DEFAULT_INTERVAL = 60
+# Older snapshots are ignored; a few missed runs before the routes notice
+DEFAULT_MAX_AGE = 180
+JSON_MIMETYPE = "application/json"
+
+
+def _read_combined(db, engine):
+    since = window_start(timedelta(hours=24)).astimezone(pytz.UTC).isoformat()
+    if engine == "pipeline":
+        pipelines = combined_pipelines(since)
+        return [list(db[name].aggregate(pipelines[name])) for name in ("weatherData", "sensibo_logs", "temperature_logs")]
+    return [
+        list(db[name].find({field: {"$gte": since}}).sort(field, 1))
+        for name, field in (("weatherData", "Time Stamp"), ("sensibo_logs", "Timestamp"), ("temperature_logs", "Timestamp"))
+    ]
+
+
+def build_combined_snapshots(db, engine="pipeline"):
+    """The default /api/combined-data bodies, JSON and binary, from one read."""
+    columns = combined_columns(*_read_combined(db, engine))
+    binary = pack_combined(columns)
+    return {
+        "combined_data.json": (json_body(with_timestamps(columns)), JSON_MIMETYPE),
+        "combined_data.binary": (binary, COLUMNAR_MIMETYPE)
+    }
+
+
+def build_current_conditions_snapshot(db):
+    latest_weather = db["weatherData"].find_one(sort=[("Time Stamp", -1)])
+    latest_ac = db["sensibo_logs"].find_one(sort=[("Timestamp", -1)])
+    latest_rooms = list(db["temperature_logs"].aggregate(latest_per_room_pipeline()))
+    payload = current_conditions_payload(latest_weather, latest_ac, latest_rooms)
+    return {"current_conditions": (json_body(payload), JSON_MIMETYPE)}
+
+
+def build_snapshots(db, engine="pipeline", now=None):
+    """Rebuild and store every snapshot; returns ``{name: body size}``.
+
+    The data versions are read first, so a snapshot never claims to be
+    newer than the data it was built from.
+    """
+    now = now or datetime.now(timezone.utc)
+    versions = latest_timestamps(db, SNAPSHOT_SOURCES)
+    sizes = {}
+    for build in (lambda: build_combined_snapshots(db, engine), lambda: build_current_conditions_snapshot(db)):
+        started = time.perf_counter()
+        bodies = build()
+        build_ms = (time.perf_counter() - started) * 1000
+        for name, (body, mimetype) in bodies.items():
+            db[SNAPSHOT_COLLECTION].replace_one({"_id": name}, {
+                "body": body,
+                "mimetype": mimetype,
+                "built_at": now,
+                "build_ms": build_ms,
+                "versions": versions
+            }, upsert=True)
+            sizes[name] = len(body)
+    logger.info(f"📸 Built {len(sizes)} snapshots: " + ", ".join(f"{name} {size} bytes" for name, size in sizes.items()))
+    return sizes
+
+
+def run_forever(db, interval=DEFAULT_INTERVAL, engine="pipeline", stop=None, claim=None):
+    # A failed run is logged and retried next interval; readers fall back to live.
+    # With several processes, ``claim`` (``TTLCache.claim``) lets one build per interval
+    stop = stop or threading.Event()
+    while not stop.is_set():
+        try:
+            # The lease runs out a little early so a build is never skipped for timer drift
+            if claim is None or claim("snapshots", interval * 0.9):
+                build_snapshots(db, engine)
+        except Exception as e:
+            logger.error(f"❌ Snapshot build failed: {str(e)}")
+        stop.wait(interval)
+
+
+def start_snapshot_worker(db, interval=DEFAULT_INTERVAL, engine="pipeline", claim=None):
+    """Run the snapshot builder on a daemon thread of this process; returns its stop event.
+
+    Every worker of a server may start one: given the shared cache's
+    ``claim``, only the worker holding the lease builds each interval.
+    """
+    stop = threading.Event()
+    threading.Thread(target=run_forever, args=(db, interval, engine, stop, claim), name="snapshot-worker", daemon=True).start()
+    logger.info(f"📸 Snapshot worker rebuilding every {interval}s")
+    return stop
+
+
+def snapshot_name(route, args, accept=None):
+    """The snapshot that answers this request, or None when it needs live computation.
+
+    Only the default representation is materialized: a since cursor,
+    max_points or an explicit range asks for something else. Invalid
+    parameters also return None, so the view reports them.
+    """
+    if route == "current_conditions":
+        return "current_conditions"
+    if args.get("since") is not None or args.get("max_points") is not None or range_requested(args):
+        return None
+    try:
+        return f"{route}.{parse_format(args, accept)}"
+    except ValueError:
+        return None
+
+
+def _built_at(doc):
+    built_at = doc["built_at"]
+    return built_at if built_at.tzinfo else built_at.replace(tzinfo=timezone.utc)
+
+
+def fresh_snapshot(doc, name, max_age, now=None):
+    # The snapshot document if it is young enough to serve
+    if doc is None:
+        return None
+    age = ((now or datetime.now(timezone.utc)) - _built_at(doc)).total_seconds()
+    if age > max_age:
+        logger.warning(f"⚠️ Snapshot {name} is {age:.0f}s old; computing live")
+        return None
+    return doc
+
+
+def read_snapshot(db, name, max_age=DEFAULT_MAX_AGE, now=None):
+    return fresh_snapshot(db[SNAPSHOT_COLLECTION].find_one({"_id": name}), name, max_age, now)
+
+
+async def read_snapshot_async(db, name, max_age=DEFAULT_MAX_AGE, now=None):
+    """``read_snapshot`` for a Motor database."""
+    return fresh_snapshot(await db[SNAPSHOT_COLLECTION].find_one({"_id": name}), name, max_age, now)
+
+
+def snapshot_headers(doc, path, accept, if_none_match=None, if_modified_since=None, now=None):
+    """Headers for a snapshot response, and whether the client's copy is current.
+
+    The validators come from the data versions the snapshot was built from,
+    not the latest ones, so they always describe the body. ``Age`` is the
+    seconds since it was built.
+    """
+    built_at = _built_at(doc)
+    etag = make_etag(doc["versions"], path, accept)
+    modified = last_modified(doc["versions"])
+    headers = validator_headers(etag, modified)
+    headers["Age"] = str(max(0, int(((now or datetime.now(timezone.utc)) - built_at).total_seconds())))
+    headers["X-Snapshot-Built-At"] = built_at.isoformat()
+    return headers, is_not_modified(etag, modified, if_none_match, if_modified_since)
+
+
+def snapshot_view(load, vary=None):
+    """Answer a Flask view from its snapshot when ``load()`` returns a fresh one.
+
+    Goes between ``conditional_view`` and ``cached_view``: a snapshot is
+    already a stored body, so it skips the response cache, and its own
+    validators are kept by ``conditional_view``. ``vary`` names a request
+    header the snapshot was picked by, like ``cached_view``'s variant.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            try:
+                doc = load()
+            except Exception as e:
+                logger.warning(f"⚠️ Could not read snapshot for {view.__name__}: {str(e)}")
+                doc = None
+            if doc is None:
+                return view(*args, **kwargs)
+
+            headers, not_modified = snapshot_headers(
+                doc, request.full_path, request.headers.get("Accept", ""),
+                request.headers.get("If-None-Match"), request.headers.get("If-Modified-Since")
+            )
+            if not_modified:
+                response = current_app.response_class(status=304, headers=headers)
+            else:
+                response = current_app.response_class(doc["body"], mimetype=doc["mimetype"], headers=headers)
+            if vary:
+                response.vary.add(vary)
+            return response
+        return wrapper
+    return decorator
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pre-build the dashboard's shared responses")
+    parser.add_argument("--interval", type=int, default=0,
+                        help="Seconds between builds; 0 builds once and exits")
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s [%(levelname)s] %(message)s',
+        datefmt='%Y-%m-%d %H:%M:%S'
+    )
+    load_dotenv()
+    db = MongoClient(os.getenv('MONGO_URI', 'mongodb://10.0.1.252:27017/'))["sensordata"]
+    engine = os.getenv('AGGREGATION_ENGINE', 'pipeline')
+
+    if args.interval:
+        run_forever(db, args.interval, engine)
+    else:
+        build_snapshots(db, engine)
+
+
+if __name__ == "__main__":
+    main()
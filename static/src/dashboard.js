@@ -167,27 +167,116 @@ const chartOptions = {
     }
 };
 
+// Last payload and validators per endpoint, so a poll that finds nothing new costs a 304
+const validatedResponses = new Map();
+
+// GET an endpoint, sending back the ETag and Last-Modified of the previous
+// response for the same URL. On a 304 the stored payload is returned with
+// notModified set. `parse` decodes successful bodies; errors are JSON.
+const fetchValidated = async (url, { accept, parse = response => response.json() } = {}) => {
+    const path = url.split('?')[0];
+    const previous = validatedResponses.get(path);
+    const headers = accept ? { Accept: accept } : {};
+    if (previous && previous.url === url) {
+        headers['If-None-Match'] = previous.etag;
+        if (previous.lastModified) {
+            headers['If-Modified-Since'] = previous.lastModified;
+        }
+    }
+
+    // The validators are handled here, so keep the browser cache out of it
+    const response = await fetch(url, { headers, cache: 'no-store' });
+    if (response.status === 304 && previous) {
+        return { response, data: previous.data, notModified: true };
+    }
+
+    const data = response.ok ? await parse(response) : await response.json();
+    const etag = response.headers.get('ETag');
+    if (response.ok && etag) {
+        validatedResponses.set(path, { url, etag, lastModified: response.headers.get('Last-Modified'), data });
+    }
+    return { response, data, notModified: false };
+};
+
+// Room charts by name, kept across refreshes so only new points are fetched
+const roomCharts = new Map();
+const HISTORY_WINDOW_MS = 24 * 60 * 60 * 1000;
+
+const roomCardId = (roomName) => `room-${roomName.toLowerCase().replace(/\s+/g, '-')}`;
+
+const setRoomCardValues = (card, currentData) => {
+    const tempValue = card.querySelector('.metric-group:first-child .main-value');
+    const humidityValue = card.querySelector('.metric-group:last-child .main-value');
+    tempValue.textContent = formatTemperature(currentData.temperature);
+    humidityValue.textContent = formatHumidity(currentData.humidity);
+};
+
+// Merge a since-cursor delta into a room chart. The first returned bucket
+// replaces our last one, which was still filling up when we fetched it.
+const mergeRoomHistory = (chart, historicalData) => {
+    const datasets = chart.data.datasets;
+    const [temperatureSet, humiditySet] = datasets;
+    const times = historicalData.timestamps.map(timestamp => new Date(timestamp));
+
+    if (times.length > 0) {
+        const first = times[0].getTime();
+        datasets.forEach(dataset => {
+            while (dataset.data.length && dataset.data[dataset.data.length - 1].x.getTime() >= first) {
+                dataset.data.pop();
+            }
+        });
+    }
+
+    times.forEach((x, index) => {
+        temperatureSet.data.push({ x, y: historicalData.temperature[index] });
+        humiditySet.data.push({ x, y: historicalData.humidity[index] });
+    });
+
+    // Drop buckets that have scrolled out of the 24 hour window
+    const cutoff = new Date(Date.now() - HISTORY_WINDOW_MS);
+    cutoff.setMinutes(0, 0, 0);
+    datasets.forEach(dataset => {
+        while (dataset.data.length && dataset.data[0].x < cutoff) {
+            dataset.data.shift();
+        }
+    });
+};
+
+// Cursor of the last /api/rooms/history response: its latest bucket over all rooms
+let roomHistoryCursor = null;
+
+const roomHistoryUrl = (roomNames, since) => {
+    const rooms = roomNames.map(encodeURIComponent).join(',');
+    const params = since ? `&since=${encodeURIComponent(since)}` : '';
+    return `/api/rooms/history?rooms=${rooms}&bucket=1h${params}`;
+};
+
+const showRoomGraphError = (room) => {
+    room.failed = true;
+    room.chart.destroy();
+    room.canvas.parentElement.innerHTML = `
+        <div class="flex items-center justify-center h-full text-error">
+            <span>Failed to load graph data</span>
+        </div>
+    `;
+};
+
 // Room Graph Functions
-const createRoomGraph = async (roomName, currentData) => {
+const createRoomGraph = (roomName, currentData) => {
     console.log(`📊 Creating graph for room: ${roomName}`);
-    console.log(`Current data:`, currentData);
     
     const template = document.getElementById('room-graph-template');
     const clone = template.content.cloneNode(true);
     
     // Set up card elements
     const card = clone.querySelector('.dashboard-card');
-    card.id = `room-${roomName.toLowerCase().replace(/\s+/g, '-')}`;
+    card.id = roomCardId(roomName);
     
     const title = clone.querySelector('.card-title');
     title.textContent = roomName;
     
-    const tempValue = clone.querySelector('.metric-group:first-child .main-value');
-    const humidityValue = clone.querySelector('.metric-group:last-child .main-value');
-    
     // Set current values
-    tempValue.textContent = formatTemperature(currentData.temperature);
-    humidityValue.textContent = formatHumidity(currentData.humidity);
+    setRoomCardValues(card, currentData);
     
     // Set up chart
     const canvas = clone.querySelector('canvas');
@@ -196,103 +285,257 @@ const createRoomGraph = async (roomName, currentData) => {
     document.getElementById('room-graphs').appendChild(clone);
     console.log(`📦 Graph card added to container for ${roomName}`);
     
+    // The chart starts empty; loadRoomHistories fills it
+    const chart = new Chart(canvas, {
+        type: 'line',
+        data: {
+            datasets: [
+                {
+                    label: 'Temperature',
+                    yAxisID: 'temperature',
+                    data: [],
+                    borderColor: '#FF4B4B',
+                    backgroundColor: 'rgba(255, 75, 75, 0.1)',
+                    borderWidth: 2,
+                    tension: 0.4,
+                    fill: true
+                },
+                {
+                    label: 'Humidity',
+                    yAxisID: 'humidity',
+                    data: [],
+                    borderColor: '#4B9EFF',
+                    backgroundColor: 'rgba(75, 158, 255, 0.1)',
+                    borderWidth: 2,
+                    tension: 0.4,
+                    fill: true
+                }
+            ]
+        },
+        options: chartOptions
+    });
+
+    // Store chart instance for incremental updates
+    roomCharts.set(roomName, { chart, card, canvas, failed: false });
+};
+
+// Fetch the hourly history of several rooms in one request and merge it into
+// their charts. Without a since cursor the full 24 hours are loaded.
+const loadRoomHistories = async (roomNames, since) => {
     try {
-        console.log(`🔍 Fetching historical data for ${roomName}...`);
-        // Fetch historical data for the room
-        const response = await fetch(`/api/room-data/${encodeURIComponent(roomName)}`);
-        console.log(`📡 API Response status:`, response.status);
-        const historicalData = await response.json();
-        console.log(`📥 Historical data received:`, historicalData);
-        
-        if (historicalData && historicalData.timestamps && historicalData.temperature && historicalData.humidity) {
-            console.log(`✨ Creating data points for ${roomName}...`);
-            // Create data points with proper timestamps
-            const data = historicalData.timestamps.map((timestamp, index) => ({
-                x: new Date(timestamp),
-                y: historicalData.temperature[index]
-            }));
-            
-            const humidityData = historicalData.timestamps.map((timestamp, index) => ({
-                x: new Date(timestamp),
-                y: historicalData.humidity[index]
-            }));
-            
-            console.log(`📈 Temperature data points:`, data);
-            console.log(`💧 Humidity data points:`, humidityData);
-            
-            console.log(`🎨 Creating chart for ${roomName}...`);
-            const chart = new Chart(canvas, {
+        console.log(`🔍 Fetching historical data for ${roomNames.length} rooms...`);
+        const { response, data, notModified } = await fetchValidated(roomHistoryUrl(roomNames, since));
+        if (notModified) return;
+        if (!response.ok || !data.rooms) {
+            throw new Error(data.error || `HTTP ${response.status}`);
+        }
+
+        roomNames.forEach(roomName => {
+            const room = roomCharts.get(roomName);
+            mergeRoomHistory(room.chart, data.rooms[roomName]);
+            room.chart.update(since ? 'none' : undefined);
+        });
+        if (data.cursor && (!roomHistoryCursor || new Date(data.cursor) > new Date(roomHistoryCursor))) {
+            roomHistoryCursor = data.cursor;
+        }
+    } catch (error) {
+        console.error(`❌ Error loading room history for ${roomNames.join(', ')}:`, error);
+        // A graph that never loaded shows the failure; existing ones keep their data
+        if (!since) {
+            roomNames.forEach(roomName => showRoomGraphError(roomCharts.get(roomName)));
+        }
+    }
+};
+
+// Compact binary /api/combined-data (layout documented in columnar.py)
+const COLUMNAR_TYPE = 'application/vnd.dashboard.columns';
+
+// Decode a columnar payload into typed arrays: timestamps in epoch ms
+// (Float64Array) and one Float32Array per series with NaN in the gaps.
+// Typed array views use the platform byte order, which is little-endian
+// everywhere browsers run.
+const decodeColumnarData = (buffer) => {
+    const view = new DataView(buffer);
+    const magic = String.fromCharCode(...new Uint8Array(buffer, 0, 4));
+    if (magic !== 'WDC1') {
+        throw new Error('Unexpected columnar payload');
+    }
+    const headerLength = view.getUint32(4, true);
+    const header = JSON.parse(new TextDecoder().decode(new Uint8Array(buffer, 8, headerLength)));
+    const rows = header.rows;
+    const padded = (length) => Math.ceil(length / 4) * 4;
+    let offset = padded(8 + headerLength);
+
+    // Minutes are delta-encoded from the first row's epoch minute
+    const deltas = new Int32Array(buffer, offset, rows);
+    offset += rows * 4;
+    const timestamps = new Float64Array(rows);
+    let minute = header.start;
+    for (let i = 0; i < rows; i++) {
+        minute += deltas[i];
+        timestamps[i] = minute * 60000;
+    }
+
+    // Each column is a presence bitmap plus the values present, in row
+    // order: float32, or int16 multiples of 1 / scale
+    const data = { timestamps, cursor: header.cursor, room_temps: {}, room_humidity: {} };
+    header.columns.forEach(([key, name, count, scale]) => {
+        const bitmap = new Uint8Array(buffer, offset, Math.ceil(rows / 8));
+        offset += padded(bitmap.length);
+        const values = scale ? new Int16Array(buffer, offset, count) : new Float32Array(buffer, offset, count);
+        offset += padded(values.byteLength);
+
+        const column = new Float32Array(rows).fill(NaN);
+        const divisor = scale || 1;
+        for (let i = 0, next = 0; i < rows; i++) {
+            if (bitmap[i >> 3] & (1 << (i & 7))) {
+                column[i] = values[next++] / divisor;
+            }
+        }
+        if (name === null) {
+            data[key] = column;
+        } else {
+            data[key][name] = column;
+        }
+    });
+    return data;
+};
+
+const fetchCombinedData = async (params = '') => {
+    const { response, data, notModified } = await fetchValidated(`/api/combined-data${params}`, {
+        accept: COLUMNAR_TYPE,
+        parse: async body => decodeColumnarData(await body.arrayBuffer())
+    });
+    if (!notModified && !response.ok) {
+        throw new Error(data.error || `HTTP ${response.status}`);
+    }
+    return { data, notModified };
+};
+
+// Longest run of NaN rows drawn as a line: weather reports every few minutes
+// on a per-minute axis, while a longer silence shows as a gap
+const COMBINED_MAX_GAP_MS = 30 * 60 * 1000;
+
+// Chart.js data for decoded columns; the typed arrays are used as-is and
+// NaN values are skipped
+const combinedChartData = (data, series) => ({
+    labels: Array.from(data.timestamps),
+    datasets: series.map(({ label, values, yAxisID, color }) => ({
+        label,
+        data: values,
+        yAxisID,
+        borderColor: color,
+        borderWidth: 2,
+        pointRadius: 0,
+        spanGaps: COMBINED_MAX_GAP_MS
+    }))
+});
+
+// The 24 hour chart of outside, AC and room temperatures, drawn from the
+// binary /api/combined-data
+let combinedChart = null;
+const ROOM_COLORS = ['#03DAC6', '#FFB74D', '#81C784', '#F06292', '#9575CD', '#4DD0E1'];
+
+const combinedSeries = (data) => [
+    { label: 'Outside', values: data.outside_temp, yAxisID: 'temperature', color: '#FF4B4B' },
+    { label: 'AC', values: data.ac_temp, yAxisID: 'temperature', color: '#BB86FC' },
+    { label: 'Outside Humidity', values: data.outside_humidity, yAxisID: 'humidity', color: '#4B9EFF' },
+    ...Object.entries(data.room_temps).map(([roomName, values], index) => ({
+        label: roomName,
+        values,
+        yAxisID: 'temperature',
+        color: ROOM_COLORS[index % ROOM_COLORS.length]
+    }))
+];
+
+const updateCombinedChart = async () => {
+    try {
+        const { data, notModified } = await fetchCombinedData();
+        if (notModified && combinedChart) return;
+
+        const chartData = combinedChartData(data, combinedSeries(data));
+        if (combinedChart) {
+            combinedChart.data = chartData;
+            combinedChart.update('none');
+        } else {
+            combinedChart = new Chart(document.getElementById('combined-chart'), {
                 type: 'line',
-                data: {
-                    datasets: [
-                        {
-                            label: 'Temperature',
-                            yAxisID: 'temperature',
-                            data: data,
-                            borderColor: '#FF4B4B',
-                            backgroundColor: 'rgba(255, 75, 75, 0.1)',
-                            borderWidth: 2,
-                            tension: 0.4,
-                            fill: true
-                        },
-                        {
-                            label: 'Humidity',
-                            yAxisID: 'humidity',
-                            data: humidityData,
-                            borderColor: '#4B9EFF',
-                            backgroundColor: 'rgba(75, 158, 255, 0.1)',
-                            borderWidth: 2,
-                            tension: 0.4,
-                            fill: true
-                        }
-                    ]
-                },
+                data: chartData,
                 options: chartOptions
             });
-            
-            console.log(`✅ Chart created successfully for ${roomName}`);
-            
-            // Store chart instance for updates
-            card.dataset.chartInstance = chart;
-        } else {
-            console.error(`❌ Invalid data structure for ${roomName}:`, historicalData);
-            throw new Error('Invalid data structure received from API');
         }
     } catch (error) {
-        console.error(`❌ Error creating graph for ${roomName}:`, error);
-        console.error('Error stack:', error.stack);
-        canvas.parentElement.innerHTML = `
-            <div class="flex items-center justify-center h-full text-error">
-                <span>Failed to load graph data</span>
-            </div>
-        `;
+        console.error('❌ Error loading combined history:', error);
     }
 };
 
+// Latest /api/current-conditions payload, patched in place by live readings
+let latestConditions = null;
+
+// Apply one pushed reading from /api/stream to the cards
+const applyLiveReading = (reading) => {
+    if (!latestConditions) return;
+
+    if (reading.source === 'weather') {
+        Object.assign(latestConditions.outside, reading);
+        updateOutdoorCard(latestConditions);
+    } else if (reading.source === 'ac') {
+        Object.assign(latestConditions.ac, reading);
+        updateACCard(latestConditions);
+    } else if (reading.source === 'room' && reading.room) {
+        const current = latestConditions.rooms[reading.room] || {};
+        latestConditions.rooms[reading.room] = Object.assign(current, {
+            temperature: reading.temperature,
+            humidity: reading.humidity,
+            timestamp: reading.timestamp
+        });
+        updateIndoorCard(latestConditions);
+        if (roomCharts.has(reading.room)) {
+            setRoomCardValues(roomCharts.get(reading.room).card, latestConditions.rooms[reading.room]);
+        }
+    }
+};
+
+const connectLiveStream = () => {
+    if (!window.EventSource) return;
+
+    const source = new EventSource('/api/stream');
+    source.addEventListener('reading', event => applyLiveReading(JSON.parse(event.data)));
+    // The server dropped events we were too slow to read; refetch everything
+    source.addEventListener('resync', () => updateDashboard());
+};
+
 // Main update function
 const updateDashboard = async () => {
     try {
-        // Destroy existing charts before clearing the container
-        const roomGraphs = document.getElementById('room-graphs');
-        roomGraphs.querySelectorAll('.dashboard-card').forEach(card => {
-            const chart = card.dataset.chartInstance;
-            if (chart) {
-                chart.destroy();
-            }
-        });
-        roomGraphs.innerHTML = '';
-        
-        const response = await fetch('/api/current-conditions');
-        const data = await response.json();
+        // A 304 hands back the stored payload, which live readings keep patching
+        const { data } = await fetchValidated('/api/current-conditions');
+        latestConditions = data;
         
         updateOutdoorCard(data);
         updateIndoorCard(data);
         updateACCard(data);
+        updateCombinedChart();
         
-        // Create room graphs
+        // Create new room graphs and extend the existing ones, one history request each
         if (data.rooms) {
+            const newRooms = [];
+            const existingRooms = [];
             for (const [roomName, roomData] of Object.entries(data.rooms)) {
-                await createRoomGraph(roomName, roomData);
+                if (roomCharts.has(roomName)) {
+                    const room = roomCharts.get(roomName);
+                    setRoomCardValues(room.card, roomData);
+                    if (!room.failed) existingRooms.push(roomName);
+                } else {
+                    createRoomGraph(roomName, roomData);
+                    newRooms.push(roomName);
+                }
+            }
+            if (newRooms.length) {
+                await loadRoomHistories(newRooms, null);
+            }
+            if (existingRooms.length) {
+                await loadRoomHistories(existingRooms, roomHistoryCursor);
             }
         }
     } catch (error) {
@@ -303,6 +546,7 @@ const updateDashboard = async () => {
 // Initialize dashboard
 document.addEventListener('DOMContentLoaded', () => {
     updateDashboard();
-    // Update every minute
+    // Cards update live from the stream; graphs still extend every minute
+    connectLiveStream();
     setInterval(updateDashboard, 60000);
-}); 
\ No newline at end of file
+});
@@ -0,0 +1,268 @@
+import asyncio
+import json
+import logging
+import queue
+import threading
+import time
+
+from pymongo.errors import OperationFailure, PyMongoError
+
+from readings import SOURCES, after_position, to_number
+
+logger = logging.getLogger(__name__)
+
+# Collection name -> source, for routing change-stream events
+COLLECTION_SOURCES = {spec["collection"]: source for source, spec in SOURCES.items()}
+
+
+def normalize_reading(source, doc):
+    """Shape a raw document like the entries of /api/current-conditions."""
+    spec = SOURCES[source]
+    reading = {"source": source, "timestamp": doc.get(spec["time_field"])}
+    if spec["room_field"]:
+        reading["room"] = doc.get(spec["room_field"])
+    for name, field in spec["fields"].items():
+        reading[name] = to_number(doc.get(field))
+    if source == "weather":
+        reading["description"] = doc.get("Description")
+        reading["icon"] = doc.get("Icon")
+    return reading
+
+
+def format_sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+class Subscriber:
+    """One connected client with a bounded event queue.
+
+    A client that falls ``max_queue`` events behind has its backlog dropped
+    and gets a single ``resync`` event instead, so slow clients cost a
+    fixed amount of memory and never hold up the watcher.
+    """
+
+    full, empty = queue.Full, queue.Empty
+
+    def __init__(self, max_queue):
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.dropped = 0
+
+    def put(self, event):
+        self._offer(event)
+
+    def _offer(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except self.full:
+            while True:
+                try:
+                    self.queue.get_nowait()
+                    self.dropped += 1
+                except self.empty:
+                    break
+            self.queue.put_nowait(("resync", {"dropped": self.dropped}))
+
+    def get(self, timeout):
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class AsyncSubscriber(Subscriber):
+    """A subscriber served from an asyncio event loop.
+
+    The watcher thread hands each event to the client's loop, so a waiting
+    client holds no thread. Must be created inside the running loop.
+    """
+
+    full, empty = asyncio.QueueFull, asyncio.QueueEmpty
+
+    def __init__(self, max_queue):
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=max_queue)
+        self.dropped = 0
+
+    def put(self, event):
+        try:
+            self.loop.call_soon_threadsafe(self._offer, event)
+        except RuntimeError:
+            # The loop has shut down; the client is gone
+            pass
+
+    async def get(self, timeout):
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class ReadingBroadcaster:
+    """Fans new sensor readings out to every SSE subscriber from one shared watcher.
+
+    The watcher thread starts with the first subscriber or listener and
+    idles while there are none. Listeners are called with every reading
+    on the watcher thread. It uses a change stream when the deployment supports
+    one and otherwise polls each collection past its latest timestamp.
+    """
+
+    def __init__(self, db, max_queue=100, max_clients=500, poll_interval=5.0):
+        self.db = db
+        self.max_queue = max_queue
+        self.max_clients = max_clients
+        self.poll_interval = poll_interval
+        self.mode = None
+        # time.monotonic() of the first error since the watcher last read successfully
+        self.failing_since = None
+        self._subscribers = set()
+        self._listeners = []
+        self._lock = threading.Lock()
+        self._active = threading.Event()
+        self._thread = None
+        # Polling position per source, (timestamp, _id), and the change stream's
+        # resume token: kept across errors so an outage's readings still go out
+        self._high_water_marks = None
+        self._resume_token = None
+
+    def subscribe(self, subscriber_class=Subscriber):
+        with self._lock:
+            if len(self._subscribers) >= self.max_clients:
+                return None
+            subscriber = subscriber_class(self.max_queue)
+            self._subscribers.add(subscriber)
+            self._start()
+        return subscriber
+
+    def add_listener(self, callback):
+        """Call ``callback(reading)`` with every new reading from now on."""
+        with self._lock:
+            self._listeners.append(callback)
+            self._start()
+
+    def _start(self):
+        self._active.set()
+        # A watcher that died (it shouldn't) is replaced rather than waited on forever
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="reading-watcher", daemon=True)
+            self._thread.start()
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+            if not self._subscribers and not self._listeners:
+                self._active.clear()
+
+    def publish(self, event, data):
+        with self._lock:
+            subscribers = list(self._subscribers)
+            listeners = list(self._listeners)
+        for subscriber in subscribers:
+            subscriber.put((event, data))
+        for listener in listeners:
+            try:
+                listener(data)
+            except Exception as e:
+                logger.error(f"❌ Reading listener error: {str(e)}")
+
+    def healthy(self):
+        """Whether the watcher thread is running and its last read succeeded."""
+        with self._lock:
+            running = self._thread is not None and self._thread.is_alive()
+        return running and self._active.is_set() and self.failing_since is None
+
+    def _failed(self):
+        if self.failing_since is None:
+            self.failing_since = time.monotonic()
+
+    def stats(self):
+        healthy = self.healthy()
+        with self._lock:
+            return {
+                "mode": self.mode,
+                "healthy": healthy,
+                "clients": len(self._subscribers),
+                "max_clients": self.max_clients,
+                "dropped": sum(s.dropped for s in self._subscribers)
+            }
+
+    def _run(self):
+        polling = False
+        while True:
+            self._active.wait()
+            try:
+                if polling:
+                    self._poll()
+                else:
+                    self._watch_changes()
+            except OperationFailure as e:
+                if polling:
+                    logger.error(f"❌ Reading watcher error: {str(e)}")
+                    self._failed()
+                    time.sleep(self.poll_interval)
+                elif self._resume_token is not None:
+                    # The token may have fallen off the oplog; watch from now rather than give up on change streams
+                    logger.warning(f"⚠️ Could not resume the change stream, reopening it: {str(e)}")
+                    self._resume_token = None
+                    self._failed()
+                else:
+                    # Standalone servers have no change streams; tail on the timestamps instead
+                    logger.info(f"📡 Change streams unavailable ({e.code}), polling every {self.poll_interval}s")
+                    polling = True
+            except PyMongoError as e:
+                # Outages are retried, whether watching or polling
+                logger.error(f"❌ Reading watcher error: {str(e)}")
+                self._failed()
+                time.sleep(self.poll_interval)
+            except Exception:
+                # Nor may a bug end the watcher: every client would silently stop getting readings
+                logger.exception("❌ Unexpected reading watcher error")
+                self._failed()
+                time.sleep(self.poll_interval)
+
+    def _watch_changes(self):
+        pipeline = [{"$match": {
+            "operationType": "insert",
+            "ns.coll": {"$in": list(COLLECTION_SOURCES)}
+        }}]
+        # After an error, pick up where the last stream stopped so nothing written meanwhile is lost
+        with self.db.watch(pipeline, max_await_time_ms=1000, resume_after=self._resume_token) as changes:
+            self.mode = "change_stream"
+            logger.info("📡 Watching sensor collections with a change stream")
+            while self._active.is_set():
+                change = changes.try_next()
+                self.failing_since = None
+                self._resume_token = changes.resume_token
+                if change is None:
+                    continue
+                source = COLLECTION_SOURCES[change["ns"]["coll"]]
+                self.publish("reading", normalize_reading(source, change["fullDocument"]))
+        # Idle: the next subscriber starts from its own time, not the backlog
+        self._resume_token = None
+
+    def _latest_position(self, source):
+        time_field = SOURCES[source]["time_field"]
+        latest = self.db[SOURCES[source]["collection"]].find_one(
+            {}, {time_field: 1}, sort=[(time_field, -1), ("_id", -1)]
+        )
+        return (latest.get(time_field), latest["_id"]) if latest else None
+
+    def _poll(self):
+        # Pages on (timestamp, _id), like the rollups, so a reading that shares
+        # the last one's timestamp but lands after the poll is still sent
+        self.mode = "polling"
+        if self._high_water_marks is None:
+            self._high_water_marks = {source: self._latest_position(source) for source in SOURCES}
+        high_water_marks = self._high_water_marks
+        while self._active.is_set():
+            for source, spec in SOURCES.items():
+                time_field = spec["time_field"]
+                position = high_water_marks[source]
+                query = after_position(time_field, position) if position else {}
+                cursor = self.db[spec["collection"]].find(query).sort([(time_field, 1), ("_id", 1)]).limit(1000)
+                for doc in cursor:
+                    high_water_marks[source] = (doc.get(time_field), doc["_id"])
+                    self.publish("reading", normalize_reading(source, doc))
+            self.failing_since = None
+            time.sleep(self.poll_interval)
+        # Idle: the next subscriber starts from its own time, not the backlog
+        self._high_water_marks = None
@@ -0,0 +1,43 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+pytest.importorskip("pyarrow")
+mongomock = pytest.importorskip("mongomock")
+
+from archive import ParquetArchive, archive_source  # noqa: E402
+from rollups import run_rollups  # noqa: E402
+
+NOW = datetime(2026, 3, 8, 12, 0, tzinfo=timezone.utc)
+
+
+def weather_db():
+    db = mongomock.MongoClient().db
+    db.weatherData.insert_many([
+        {"Time Stamp": (NOW - timedelta(hours=6 * step)).isoformat(), "Current Temperature": 50.0}
+        for step in range(4 * 30)
+    ])
+    return db
+
+
+def test_nothing_is_archived_before_the_rollups_cover_it(tmp_path):
+    db = weather_db()
+    archive = ParquetArchive(str(tmp_path))
+    assert archive_source(db, archive, "weather", now=NOW, age=timedelta(days=10), grace=0) == 0
+    assert db.weatherData.count_documents({}) == 120
+    assert db.archive_state.count_documents({}) == 0
+
+    # Without rollups there is no high-water mark to wait for
+    assert archive_source(db, archive, "weather", now=NOW, age=timedelta(days=10), use_rollups=False, grace=0) > 0
+
+
+def test_moving_the_mark_refreshes_the_cached_marks(tmp_path):
+    db = weather_db()
+    run_rollups(db, now=NOW)
+    archive = ParquetArchive(str(tmp_path))
+    assert archive.marks(db) == {}
+
+    moved = archive_source(db, archive, "weather", now=NOW, age=timedelta(days=10), grace=0)
+    assert moved > 0 and db.weatherData.count_documents({}) == 120 - moved
+    mark = archive.marks(db)["weather"]
+    assert archive.count("weather", NOW - timedelta(days=30), mark) == moved
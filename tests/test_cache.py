@@ -0,0 +1,22 @@
+import time
+
+from cache import SharedCache, TTLCache
+
+
+def test_one_worker_claims_a_periodic_job(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    first, second = SharedCache(path), SharedCache(path)
+
+    assert first.claim("snapshots", 0.2)
+    assert not second.claim("snapshots", 0.2)
+    assert not first.claim("snapshots", 0.2)
+    # Other jobs and cache keys are leased separately
+    assert second.claim("rollups", 0.2)
+
+    time.sleep(0.25)
+    assert second.claim("snapshots", 0.2)
+
+
+def test_a_lone_process_always_claims():
+    cache = TTLCache()
+    assert cache.claim("snapshots", 60) and cache.claim("snapshots", 60)
@@ -0,0 +1,27 @@
+from datetime import datetime, timezone
+
+from conditional import is_fallback_room, is_not_modified, last_modified, make_etag
+
+NOW = datetime(2026, 3, 8, 12, 0, tzinfo=timezone.utc)
+
+
+def test_lagging_source_is_not_answered_with_a_false_304():
+    before = {"weather": "2026-03-08T11:59:00+00:00", "room": "2026-03-08T11:30:00+00:00"}
+    # The room readings catch up, but stay older than the newest weather reading
+    after = {"weather": "2026-03-08T11:59:00+00:00", "room": "2026-03-08T11:45:00+00:00"}
+    sent = last_modified(before)
+    assert sent is None
+    assert not is_not_modified(make_etag(after, "/api/combined-data?"), last_modified(after),
+                               if_modified_since="Sun, 08 Mar 2026 11:59:00 GMT")
+
+
+def test_single_source_keeps_last_modified():
+    modified = last_modified({"weather": "2026-03-08T11:59:00+00:00"})
+    assert modified == datetime(2026, 3, 8, 11, 59, tzinfo=timezone.utc)
+    assert is_not_modified("W/\"x\"", modified, if_modified_since="Sun, 08 Mar 2026 11:59:00 GMT")
+
+
+def test_room_without_recent_readings_uses_the_fallback():
+    assert is_fallback_room({"room": None}, NOW)
+    assert is_fallback_room({"room": "2026-03-07T11:00:00+00:00"}, NOW)
+    assert not is_fallback_room({"room": "2026-03-08T11:00:00+00:00"}, NOW)
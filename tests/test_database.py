@@ -0,0 +1,82 @@
+import asyncio
+import threading
+
+import pytest
+
+from database import AsyncMongoConnection, MongoConnection
+
+mongomock = pytest.importorskip("mongomock")
+
+
+class SlowHook:
+    """An on_connect callback that blocks until released, counting its runs."""
+
+    def __init__(self):
+        self.release = threading.Event()
+        self.started = threading.Event()
+        self.running = 0
+        self.overlapped = False
+        self.runs = 0
+
+    def __call__(self, db):
+        self.running += 1
+        self.overlapped = self.overlapped or self.running > 1
+        self.started.set()
+        self.release.wait(5)
+        self.runs += 1
+        self.running -= 1
+
+
+def reconnect(mongo):
+    # Pretend the connection dropped and the next check finds it back up
+    mongo.health.up = False
+    mongo.health.checked_at = None
+
+
+def test_connect_hooks_run_off_the_request_thread():
+    hook = SlowHook()
+    mongo = MongoConnection("mongodb://localhost", on_connect=[hook], client_class=mongomock.MongoClient)
+
+    # The request that notices the connection does not wait for the hook
+    assert mongo.available()
+    assert hook.started.wait(5)
+    assert hook.runs == 0
+
+    # A reconnect while the hook runs queues one more run instead of a concurrent one
+    reconnect(mongo)
+    assert mongo.available()
+    reconnect(mongo)
+    assert mongo.available()
+
+    running = mongo._hooks_running
+    hook.release.set()
+    running.join(5)
+    assert not running.is_alive()
+    assert hook.runs == 2
+    assert not hook.overlapped
+    assert mongo._hooks_running is None
+
+
+def test_async_connect_hooks_run_as_a_task():
+    mongomock_motor = pytest.importorskip("mongomock_motor")
+
+    async def scenario():
+        calls = []
+        started = asyncio.Event()
+        release = asyncio.Event()
+
+        async def hook(db):
+            calls.append(db)
+            started.set()
+            await release.wait()
+
+        mongo = AsyncMongoConnection("mongodb://localhost", mongomock_motor.AsyncMongoMockClient, on_connect=[hook])
+        assert await mongo.available()
+        await asyncio.wait_for(started.wait(), 5)
+        task = mongo._hooks_running
+        assert not task.done()
+        release.set()
+        await asyncio.wait_for(task, 5)
+        assert len(calls) == 1 and mongo._hooks_running is None
+
+    asyncio.run(scenario())
@@ -0,0 +1,17 @@
+import pytest
+from pymongo import ASCENDING
+
+from indexes import ensure_indexes
+
+mongomock = pytest.importorskip("mongomock")
+
+
+def test_single_field_time_indexes_give_way_to_the_compound_ones():
+    db = mongomock.MongoClient()["sensordata"]
+    db["weatherData"].create_index([("Time Stamp", ASCENDING)])
+
+    ensure_indexes(db)
+
+    assert sorted(db["weatherData"].index_information()) == ["Time Stamp_1__id_1", "_id_"]
+    assert sorted(db["sensibo_logs"].index_information()) == ["Timestamp_1__id_1", "_id_"]
+    assert "Timestamp_1" not in db["temperature_logs"].index_information()
@@ -0,0 +1,8 @@
+from json_stream import chunked, iter_json_array, json_body
+
+
+def test_streamed_array_is_the_buffered_body():
+    rows = [{"temperature": 70.5 + i, "room": "Café", "humidity": float("nan") if i % 3 else 40} for i in range(25)]
+    streamed = b"".join(iter_json_array(chunked(rows, 4)))
+    assert streamed == json_body(rows)
+    assert b"".join(iter_json_array([])) == json_body([])
@@ -0,0 +1,40 @@
+from datetime import datetime, timedelta, timezone
+
+from live import LiveWindows
+
+NOW = datetime(2026, 3, 8, 12, 0, tzinfo=timezone.utc)
+
+
+def reading(minutes_ago, temperature=70.0, room="Office"):
+    timestamp = (NOW - timedelta(minutes=minutes_ago)).isoformat()
+    return {"source": "room", "room": room, "timestamp": timestamp, "temperature": temperature, "humidity": 40.0}
+
+
+def loaded_windows():
+    windows = LiveWindows(capacity=16)
+    windows.ready = True
+    return windows
+
+
+def test_windows_go_stale_when_readings_stop():
+    windows = loaded_windows()
+    assert not windows.fresh(300)
+
+    windows.add_reading(reading(1))
+    received = windows.received_at
+    assert windows.fresh(300, now=received + 299)
+    # The watcher is alive but nothing has come through for five minutes
+    assert not windows.fresh(300, now=received + 301)
+
+    windows.add_reading(reading(0))
+    assert windows.fresh(300)
+
+
+def test_out_of_order_readings_are_counted():
+    windows = loaded_windows()
+    windows.add_reading(reading(1))
+    windows.add_reading(reading(2))
+    windows.add_reading(reading(1))
+    windows.add_reading(reading(0))
+    assert windows.stats()["stale"] == 2
+    assert windows.current_conditions()["rooms"]["Office"]["timestamp"] == reading(0)["timestamp"]
@@ -0,0 +1,29 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from planner import plan_history, plan_request
+
+mongomock = pytest.importorskip("mongomock")
+
+START = datetime(2026, 3, 1, tzinfo=timezone.utc)
+
+
+def test_raw_within_the_budget_is_planned_raw():
+    plan = plan_history(100, START, START + timedelta(hours=2), "raw", row_budget=100)
+    assert plan["strategy"] == "raw" and plan["resolution"] is None
+
+
+def test_raw_over_the_budget_is_refused_before_reading():
+    db = mongomock.MongoClient().db
+    db.weatherData.insert_many([
+        {"Time Stamp": (START + timedelta(minutes=minute)).isoformat(), "Temperature": 20.0}
+        for minute in range(50)
+    ])
+    args = {"start": START.isoformat(), "end": (START + timedelta(days=1)).isoformat(), "resolution": "raw"}
+    with pytest.raises(ValueError, match="resolution=raw"):
+        plan_request(db, args, ("weather",), timedelta(days=1), "pipeline", False, row_budget=20)
+    # A bucketed resolution over the same range still plans
+    plan = plan_request(db, {**args, "resolution": "1h"}, ("weather",), timedelta(days=1), "pipeline", False,
+                        row_budget=20)
+    assert plan["resolution"] == "1h"
@@ -0,0 +1,121 @@
+import math
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+mongomock = pytest.importorskip("mongomock")
+
+import rollups
+from rollups import RESOLUTIONS, ensure_rollup_indexes, read_histories, rollup_collection, rollup_source, summarize
+
+# Spans a local midnight and the switch to daylight saving time
+START = datetime(2026, 3, 8, 3, 0, tzinfo=timezone.utc)
+ROOMS = ["Bedroom", "Kitchen", "Office"]
+
+
+@pytest.fixture
+def db():
+    db = mongomock.MongoClient()["sensordata"]
+    ensure_rollup_indexes(db)
+    return db
+
+
+def room_docs(minutes, rooms=ROOMS, start=START):
+    # One reading per room every minute, at a few seconds past; room sensors store strings
+    return [
+        {
+            "Timestamp": (start + timedelta(minutes=minute, seconds=7)).isoformat(),
+            "Room": room,
+            "Temperature": str(round(68 + math.sin(minute / 20 + i), 2)),
+            "Humidity": 40 + (minute + i) % 9
+        }
+        for minute in range(minutes) for i, room in enumerate(rooms)
+    ]
+
+
+def rolled_up(db, resolution):
+    return {
+        (doc["room"], int(datetime.fromisoformat(doc["bucket"]).timestamp() // 60)): doc["fields"]
+        for doc in rollup_collection(db, resolution).find({"source": "room"})
+    }
+
+
+def assert_rollups_match(db, docs):
+    for resolution in RESOLUTIONS:
+        expected = summarize(docs, "room", resolution)
+        actual = rolled_up(db, resolution)
+        assert actual.keys() == expected.keys(), resolution
+        for key, fields in expected.items():
+            for name, stats in fields.items():
+                got = actual[key][name]
+                assert got["count"] == stats["count"], (resolution, key, name)
+                assert got["min"] == stats["min"] and got["max"] == stats["max"], (resolution, key, name)
+                assert got["sum"] == pytest.approx(stats["sum"]), (resolution, key, name)
+
+
+def until(docs):
+    return datetime.fromisoformat(docs[-1]["Timestamp"]) + timedelta(seconds=1)
+
+
+def test_incremental_runs_match_one_full_summary(db):
+    docs = room_docs(300)
+    db["temperature_logs"].insert_many([dict(doc) for doc in docs[:400]])
+    rollup_source(db, "room", now=until(docs[:400]), lag=timedelta(0))
+    db["temperature_logs"].insert_many([dict(doc) for doc in docs[400:]])
+    assert rollup_source(db, "room", now=until(docs), lag=timedelta(0)) == len(docs) - 400
+    # Nothing new: a third run folds nothing and changes nothing
+    assert rollup_source(db, "room", now=until(docs), lag=timedelta(0)) == 0
+    assert_rollups_match(db, docs)
+
+
+def test_readings_sharing_a_timestamp_across_batches(db, monkeypatch):
+    monkeypatch.setattr(rollups, "BATCH_SIZE", 4)
+    # Ten rooms report at the same instant, so batches of four split them
+    docs = room_docs(3, rooms=[f"Room {i}" for i in range(10)])
+    db["temperature_logs"].insert_many([dict(doc) for doc in docs])
+    assert rollup_source(db, "room", now=until(docs), lag=timedelta(0)) == len(docs)
+    assert_rollups_match(db, docs)
+
+
+def test_history_reads_between_batches_of_a_tie(db, monkeypatch):
+    monkeypatch.setattr(rollups, "BATCH_SIZE", 4)
+    docs = room_docs(2, rooms=[f"Room {i}" for i in range(10)])
+    db["temperature_logs"].insert_many([dict(doc) for doc in docs])
+
+    # Stop after the first batch: the mark sits inside a run of equal timestamps
+    fold = rollups._fold
+    calls = []
+    def fold_once(*args):
+        calls.append(1)
+        if len(calls) > 1:
+            raise RuntimeError("stopped")
+        fold(*args)
+    monkeypatch.setattr(rollups, "_fold", fold_once)
+    with pytest.raises(RuntimeError):
+        rollup_source(db, "room", now=until(docs), lag=timedelta(0))
+
+    histories = read_histories(db, "room", START, "1h")
+    expected = summarize(docs, "room", "1h")
+    assert {room for room, _ in expected} == set(histories)
+    for (room, _), fields in expected.items():
+        [bucket] = histories[room]
+        assert bucket["fields"]["temperature"]["count"] == fields["temperature"]["count"]
+
+
+def test_rerun_after_a_crash_before_the_mark_is_saved(db, monkeypatch):
+    docs = room_docs(120)
+    db["temperature_logs"].insert_many([dict(doc) for doc in docs[:200]])
+    rollup_source(db, "room", now=until(docs[:200]), lag=timedelta(0))
+    db["temperature_logs"].insert_many([dict(doc) for doc in docs[200:]])
+
+    # The rollups are written, then the process dies before saving the mark
+    def crash(*args):
+        raise RuntimeError("crashed")
+    with monkeypatch.context() as patched:
+        patched.setattr(rollups, "_save_position", crash)
+        with pytest.raises(RuntimeError):
+            rollup_source(db, "room", now=until(docs), lag=timedelta(0))
+
+    # The rerun folds the same batch again without counting it twice
+    assert rollup_source(db, "room", now=until(docs), lag=timedelta(0)) == len(docs) - 200
+    assert_rollups_match(db, docs)
@@ -0,0 +1,147 @@
+import threading
+import time
+from datetime import datetime, timezone
+
+import pytest
+
+mongomock = pytest.importorskip("mongomock")
+
+from pymongo.errors import AutoReconnect, OperationFailure
+
+from stream import ReadingBroadcaster
+
+
+def wait_for(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+@pytest.fixture
+def polling_broadcaster(monkeypatch):
+    # A standalone server: no change streams, so the watcher polls
+    db = mongomock.MongoClient()["sensordata"]
+    broadcaster = ReadingBroadcaster(db, poll_interval=0.02)
+
+    def no_change_streams():
+        raise OperationFailure("The $changeStream stage is only supported on replica sets", code=40573)
+    monkeypatch.setattr(broadcaster, "_watch_changes", no_change_streams)
+    return db, broadcaster
+
+
+def test_polling_watcher_survives_an_outage(polling_broadcaster, monkeypatch):
+    db, broadcaster = polling_broadcaster
+    subscriber = broadcaster.subscribe()
+    assert wait_for(lambda: broadcaster.mode == "polling")
+
+    # MongoDB goes away for a few polls
+    failures = []
+    find = mongomock.collection.Collection.find
+    def flaky_find(self, *args, **kwargs):
+        if len(failures) < 3:
+            failures.append(1)
+            raise AutoReconnect("connection refused")
+        return find(self, *args, **kwargs)
+    monkeypatch.setattr(mongomock.collection.Collection, "find", flaky_find)
+    assert wait_for(lambda: len(failures) == 3)
+
+    db["weatherData"].insert_one({"Time Stamp": datetime.now(timezone.utc).isoformat(), "Current Temperature": 71.5})
+    event, reading = subscriber.get(timeout=5)
+    assert event == "reading" and reading["temperature"] == 71.5
+    assert broadcaster._thread.is_alive()
+
+
+def test_dead_watcher_is_restarted(polling_broadcaster):
+    db, broadcaster = polling_broadcaster
+    dead = threading.Thread(target=lambda: None)
+    dead.start()
+    dead.join()
+    broadcaster._thread = dead
+
+    subscriber = broadcaster.subscribe()
+    assert broadcaster._thread.is_alive()
+    assert wait_for(lambda: broadcaster.mode == "polling")
+    db["sensibo_logs"].insert_one({"Timestamp": datetime.now(timezone.utc).isoformat(), "Temperature": 70})
+    assert subscriber.get(timeout=5)[1]["source"] == "ac"
+
+
+def test_health_follows_the_watcher(polling_broadcaster, monkeypatch):
+    db, broadcaster = polling_broadcaster
+    assert not broadcaster.healthy()
+    broadcaster.add_listener(lambda reading: None)
+    assert wait_for(lambda: broadcaster.mode == "polling" and broadcaster.healthy())
+
+    down = threading.Event()
+    down.set()
+    find = mongomock.collection.Collection.find
+    def failing_find(self, *args, **kwargs):
+        if down.is_set():
+            raise AutoReconnect("connection refused")
+        return find(self, *args, **kwargs)
+    monkeypatch.setattr(mongomock.collection.Collection, "find", failing_find)
+    assert wait_for(lambda: not broadcaster.healthy())
+    assert not broadcaster.stats()["healthy"]
+
+    down.clear()
+    assert wait_for(broadcaster.healthy)
+
+
+def test_polling_sends_readings_that_tie_with_the_mark(polling_broadcaster):
+    db, broadcaster = polling_broadcaster
+    timestamp = datetime.now(timezone.utc).isoformat()
+    db["temperature_logs"].insert_one({"Timestamp": timestamp, "Room": "Office", "Temperature": "70.0"})
+    subscriber = broadcaster.subscribe()
+    assert wait_for(lambda: broadcaster._high_water_marks is not None)
+
+    # Another sensor reports the same second, after the watcher took its mark
+    db["temperature_logs"].insert_one({"Timestamp": timestamp, "Room": "Den", "Temperature": "68.0"})
+    event, reading = subscriber.get(timeout=5)
+    assert reading["room"] == "Den" and reading["timestamp"] == timestamp
+
+
+class FakeChangeStream:
+    """A change stream that hands out ``changes`` and then fails, or idles."""
+
+    def __init__(self, changes, fail):
+        self.changes = list(changes)
+        self.fail = fail
+        self.resume_token = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def try_next(self):
+        if self.changes:
+            change = self.changes.pop(0)
+            self.resume_token = {"_data": change["_id"]}
+            return change
+        if self.fail:
+            raise AutoReconnect("connection reset")
+        time.sleep(0.01)
+        return None
+
+
+def test_change_stream_resumes_after_an_error():
+    def change(token, temperature):
+        return {"_id": token, "ns": {"coll": "weatherData"},
+                "fullDocument": {"Time Stamp": datetime.now(timezone.utc).isoformat(), "Current Temperature": temperature}}
+
+    opened = []
+    streams = [FakeChangeStream([change("1", 70.0)], fail=True), FakeChangeStream([change("2", 71.0)], fail=False)]
+
+    class FakeDb:
+        def watch(self, pipeline, max_await_time_ms=None, resume_after=None):
+            opened.append(resume_after)
+            return streams.pop(0)
+
+    broadcaster = ReadingBroadcaster(FakeDb(), poll_interval=0.01)
+    subscriber = broadcaster.subscribe()
+    assert subscriber.get(timeout=5)[1]["temperature"] == 70.0
+    assert subscriber.get(timeout=5)[1]["temperature"] == 71.0
+    assert opened == [None, {"_data": "1"}]
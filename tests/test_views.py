@@ -0,0 +1,15 @@
+import logging
+
+from views import hourly_room_averages
+
+
+def test_hourly_room_averages_with_nothing_parsed_at_debug_level(caplog):
+    caplog.set_level(logging.DEBUG, logger="views")
+    result = hourly_room_averages([{"Timestamp": "not a time", "Room": "Office", "Temperature": "n/a"}])
+    assert result == {"timestamps": [], "temperature": [], "humidity": [], "cursor": None}
+
+
+def test_hourly_room_averages_keeps_the_since_cursor_when_empty():
+    since = "2026-03-08T10:00:00-04:00"
+    result = hourly_room_averages([{"Timestamp": "not a time", "Room": "Office", "Temperature": "n/a"}], since)
+    assert result["timestamps"] == [] and result["cursor"] == since
@@ -0,0 +1,228 @@
+import functools
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+import pytz
+
+# Timezone used for everything shown on the dashboard
+LOCAL_TZ = 'America/New_York'
+
+SECONDS_PER_DAY = 86400
+NS_PER_SECOND = 1_000_000_000
+_EPOCH = datetime(1970, 1, 1)
+# Days from 0000-03-01 to 1970-01-01 in the proleptic Gregorian calendar
+_DAYS_TO_EPOCH = 719468
+_ZERO = ord('0')
+
+# "YYYY-MM-DDTHH:MM:SS" positions of the separators and of every digit
+_SEPARATORS = {4: b'-', 7: b'-', 13: b':', 16: b':'}
+_DIGITS = [0, 1, 2, 3, 5, 6, 8, 9, 11, 12, 14, 15, 17, 18]
+
+
+def _days_from_civil(year, month, day):
+    # Vectorized days-since-epoch for Gregorian dates (H. Hinnant's algorithm)
+    year = year - (month <= 2)
+    era = np.floor_divide(year, 400)
+    year_of_era = year - era * 400
+    day_of_year = (153 * np.where(month > 2, month - 3, month + 9) + 2) // 5 + day - 1
+    day_of_era = year_of_era * 365 + year_of_era // 4 - year_of_era // 100 + day_of_year
+    return era * 146097 + day_of_era - _DAYS_TO_EPOCH
+
+
+def _civil_from_days(days):
+    # Inverse of _days_from_civil: (year, month, day) arrays
+    days = days + _DAYS_TO_EPOCH
+    era = np.floor_divide(days, 146097)
+    day_of_era = days - era * 146097
+    year_of_era = (day_of_era - day_of_era // 1460 + day_of_era // 36524 - day_of_era // 146096) // 365
+    day_of_year = day_of_era - (365 * year_of_era + year_of_era // 4 - year_of_era // 100)
+    shifted_month = (5 * day_of_year + 2) // 153
+    day = day_of_year - (153 * shifted_month + 2) // 5 + 1
+    month = np.where(shifted_month < 10, shifted_month + 3, shifted_month - 9)
+    year = year_of_era + era * 400 + (month <= 2)
+    return year, month, day
+
+
+def _parse_fixed_width(strings):
+    """Parse canonical ISO strings with byte arithmetic.
+
+    Handles ``YYYY-MM-DD[T ]HH:MM:SS[.fff...][Z|+HH:MM|-HH:MM]`` (naive means
+    UTC). Returns ``(seconds, ok)``; rows with ``ok`` False need the slow path.
+    """
+    raw = np.array(strings, dtype='S40')
+    width = raw.dtype.itemsize
+    chars = raw.view(np.uint8).reshape(len(raw), width)
+    length = np.count_nonzero(chars, axis=1)
+
+    # Strings that filled the buffer may have been truncated
+    ok = (length >= 19) & (length < width)
+    for position, separator in _SEPARATORS.items():
+        ok &= chars[:, position] == ord(separator)
+    ok &= (chars[:, 10] == ord('T')) | (chars[:, 10] == ord(' '))
+    # uint8 subtraction wraps, so anything that is not a digit ends up above 9
+    digits = chars[:, _DIGITS] - np.uint8(_ZERO)
+    ok &= (digits <= 9).all(axis=1)
+    digits = digits.astype(np.int64)
+
+    year = digits[:, 0] * 1000 + digits[:, 1] * 100 + digits[:, 2] * 10 + digits[:, 3]
+    month = digits[:, 4] * 10 + digits[:, 5]
+    day = digits[:, 6] * 10 + digits[:, 7]
+    hour = digits[:, 8] * 10 + digits[:, 9]
+    minute = digits[:, 10] * 10 + digits[:, 11]
+    second = digits[:, 12] * 10 + digits[:, 13]
+    ok &= (month >= 1) & (month <= 12) & (day >= 1) & (day <= 31)
+    ok &= (hour < 24) & (minute < 60) & (second < 60)
+
+    # Trailing "Z" or "+HH:MM"/"-HH:MM"; anything else after the seconds must be a fraction
+    rows = np.arange(len(raw))
+    last = chars[rows, np.maximum(length - 1, 0)]
+    sign_char = chars[rows, np.maximum(length - 6, 0)]
+    has_offset = ((sign_char == ord('+')) | (sign_char == ord('-'))) & (chars[rows, np.maximum(length - 3, 0)] == ord(':'))
+    offset_digits = chars[rows[:, None], np.maximum(length - 5, 0)[:, None] + np.array([0, 1, 3, 4])].astype(np.int64) - _ZERO
+    offset = (offset_digits[:, 0] * 10 + offset_digits[:, 1]) * 3600 + (offset_digits[:, 2] * 10 + offset_digits[:, 3]) * 60
+    offset = np.where(has_offset, np.where(sign_char == ord('-'), -offset, offset), 0)
+
+    body_end = np.where(has_offset, length - 6, np.where(last == ord('Z'), length - 1, length))
+    ok &= (body_end == 19) | ((body_end > 20) & (chars[:, 19] == ord('.')))
+    # Only the columns past the seconds can hold a fraction
+    in_fraction = np.arange(20, width) < body_end[:, None]
+    ok &= ~(in_fraction & ((chars[:, 20:] - np.uint8(_ZERO)) > 9)).any(axis=1)
+    if has_offset.any():
+        ok &= ~has_offset | ((offset_digits >= 0) & (offset_digits <= 9)).all(axis=1)
+
+    days = _days_from_civil(year, month, day)
+    # Reject dates like Feb 30 that would silently roll over
+    ok &= (_civil_from_days(days)[2] == day)
+    seconds = days * SECONDS_PER_DAY + hour * 3600 + minute * 60 + second - offset
+    return seconds, ok
+
+
+def parse_epoch_seconds(timestamps):
+    """Bulk-parse ISO timestamp strings (or datetimes) into integer epoch seconds.
+
+    Returns ``(seconds, valid)`` where ``valid`` masks the inputs that
+    parsed; ``seconds`` only holds those. Canonical ISO strings go through
+    a vectorized byte parser; anything else falls back to pandas.
+    """
+    timestamps = list(timestamps)
+    n = len(timestamps)
+    seconds = np.zeros(n, dtype=np.int64)
+    valid = np.zeros(n, dtype=bool)
+    if n == 0:
+        return seconds, valid
+
+    is_str = np.fromiter((isinstance(t, str) for t in timestamps), dtype=bool, count=n)
+    if is_str.any():
+        str_rows = np.flatnonzero(is_str)
+        strings = timestamps if is_str.all() else [timestamps[i] for i in str_rows]
+        try:
+            parsed, ok = _parse_fixed_width(strings)
+        except UnicodeEncodeError:
+            parsed, ok = np.zeros(len(str_rows), dtype=np.int64), np.zeros(len(str_rows), dtype=bool)
+        seconds[str_rows[ok]] = parsed[ok]
+        valid[str_rows[ok]] = True
+
+    slow_rows = np.flatnonzero(~valid)
+    if len(slow_rows):
+        parsed = pd.to_datetime(
+            pd.Series([timestamps[i] for i in slow_rows], dtype=object),
+            utc=True,
+            errors='coerce',
+            format='ISO8601'
+        )
+        slow_ok = parsed.notna().to_numpy()
+        seconds[slow_rows[slow_ok]] = pd.DatetimeIndex(parsed[slow_ok]).asi8 // NS_PER_SECOND
+        valid[slow_rows[slow_ok]] = True
+
+    return seconds[valid], valid
+
+
+@functools.lru_cache(maxsize=None)
+def transition_table(tz_name=LOCAL_TZ):
+    """UTC transition instants (epoch seconds) and the UTC offset in force from each.
+
+    Built once per timezone from pytz's own transition data, so lookups give
+    the same answers as ``astimezone`` without a per-row call.
+    """
+    tz = pytz.timezone(tz_name)
+    transitions = getattr(tz, '_utc_transition_times', None)
+    if not transitions:
+        offset = int(tz.utcoffset(datetime(2000, 1, 1)).total_seconds())
+        return np.array([np.iinfo(np.int64).min], dtype=np.int64), np.array([offset], dtype=np.int64)
+    starts = np.array([(t - _EPOCH) // timedelta(seconds=1) for t in transitions], dtype=np.int64)
+    offsets = np.array([int(info[0].total_seconds()) for info in tz._transition_info], dtype=np.int64)
+    return starts, offsets
+
+
+def utc_offsets(seconds, tz=LOCAL_TZ):
+    """UTC offset in seconds in ``tz`` at each epoch second."""
+    starts, offsets = transition_table(tz)
+    index = np.searchsorted(starts, np.asarray(seconds, dtype=np.int64), side='right') - 1
+    return offsets[np.maximum(index, 0)]
+
+
+def to_local_seconds(seconds, tz=LOCAL_TZ):
+    """Epoch seconds shifted to wall-clock seconds in ``tz``."""
+    seconds = np.asarray(seconds, dtype=np.int64)
+    return seconds + utc_offsets(seconds, tz)
+
+
+# "00".."99" as byte pairs, so two digits are written with one lookup
+_PAIRS = np.array([[_ZERO + i // 10, _ZERO + i % 10] for i in range(100)], dtype=np.uint8)
+
+
+def _write_digits(out, column, values, width):
+    for i in range(0, width, 2):
+        out[:, column + width - 2 - i:column + width - i] = _PAIRS[values // (10 ** i) % 100]
+
+
+def _wall_clock_bytes(local_seconds, width):
+    local_seconds = np.asarray(local_seconds, dtype=np.int64)
+    days = np.floor_divide(local_seconds, SECONDS_PER_DAY)
+    second_of_day = local_seconds - days * SECONDS_PER_DAY
+    year, month, day = _civil_from_days(days)
+
+    out = np.empty((len(local_seconds), width), dtype=np.uint8)
+    _write_digits(out, 0, year, 4)
+    out[:, 4] = ord('-')
+    _write_digits(out, 5, month, 2)
+    out[:, 7] = ord('-')
+    _write_digits(out, 8, day, 2)
+    _write_digits(out, 11, second_of_day // 3600, 2)
+    out[:, 13] = ord(':')
+    _write_digits(out, 14, second_of_day // 60 % 60, 2)
+    return out, second_of_day
+
+
+def _to_strings(out):
+    width = out.shape[1]
+    return out.view(f'S{width}').ravel().astype(f'U{width}').tolist()
+
+
+def format_minute_keys(minutes, tz=LOCAL_TZ):
+    """Format epoch minutes as local ``YYYY-MM-DD HH:MM`` keys, by arithmetic."""
+    if len(minutes) == 0:
+        return []
+    out, _ = _wall_clock_bytes(to_local_seconds(np.asarray(minutes, dtype=np.int64) * 60, tz), 16)
+    out[:, 10] = ord(' ')
+    return _to_strings(out)
+
+
+def format_local_iso(seconds, tz=LOCAL_TZ):
+    """Format epoch seconds like ``datetime.isoformat()`` of the local time, e.g.
+    ``2024-03-10T03:00:00-04:00``."""
+    if len(seconds) == 0:
+        return []
+    seconds = np.asarray(seconds, dtype=np.int64)
+    offsets = utc_offsets(seconds, tz)
+    out, second_of_day = _wall_clock_bytes(seconds + offsets, 25)
+    out[:, 10] = ord('T')
+    out[:, 16] = ord(':')
+    _write_digits(out, 17, second_of_day % 60, 2)
+    out[:, 19] = np.where(offsets < 0, ord('-'), ord('+'))
+    magnitude = np.abs(offsets)
+    _write_digits(out, 20, magnitude // 3600, 2)
+    out[:, 22] = ord(':')
+    _write_digits(out, 23, magnitude // 60 % 60, 2)
+    return _to_strings(out)
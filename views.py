@@ -0,0 +1,396 @@
+import logging
+from datetime import datetime
+
+import numpy as np
+import pytz
+
+import columnar
+from downsample import MIN_POINTS, downsample_records
+from json_stream import chunked, iter_json_array
+from metrics import span
+from rollups import RESOLUTIONS
+from readings import read_readings, to_number
+from timestamps import format_local_iso, format_minute_keys
+
+logger = logging.getLogger(__name__)
+
+# Define timezone
+EST = pytz.timezone('America/New_York')
+
+# Response shaping shared by the Flask app (app.py) and the ASGI app
+# (asgi_app.py), so both serve the same JSON. ``args`` is any mapping of
+# query parameters: Flask's request.args or Starlette's query_params.
+
+
+# Function to convert UTC to EST
+def convert_to_est(utc_dt):
+    try:
+        if isinstance(utc_dt, str):
+            try:
+                utc_dt = datetime.fromisoformat(utc_dt.replace("Z", "+00:00"))
+            except Exception as e:
+                logger.error(f"❌ Error parsing timestamp string: {utc_dt}")
+                logger.error(f"   └─ Error details: {str(e)}")
+                raise
+
+        if not utc_dt.tzinfo:
+            utc_dt = pytz.utc.localize(utc_dt)
+        est_dt = utc_dt.astimezone(EST)
+        return est_dt
+    except Exception as e:
+        logger.error(f"❌ Error converting to EST: {str(e)}")
+        logger.error(f"   └─ Input datetime: {utc_dt}")
+        raise
+
+# Add a separator function for cleaner logs
+def log_separator(message=""):
+    logger.debug("=" * 50)
+    if message:
+        logger.debug(message)
+        logger.debug("=" * 50)
+
+# Parse the optional max_points query parameter shared by the history routes
+def parse_max_points(args):
+    if "max_points" not in args:
+        return None
+    try:
+        max_points = int(args.get("max_points"))
+    except (TypeError, ValueError):
+        max_points = None
+    if max_points is None or max_points < MIN_POINTS:
+        raise ValueError(f"max_points must be an integer >= {MIN_POINTS}")
+    return max_points
+
+# Pick the aggregation engine, allowing a per-request ?engine= override
+def parse_engine(args, default):
+    engine = args.get("engine", default)
+    if engine not in ("pipeline", "python"):
+        raise ValueError("engine must be 'pipeline' or 'python'")
+    return engine
+
+# Parse the optional stream flag; a streamed body is encoded and sent batch by batch
+def parse_stream(args, default):
+    value = args.get("stream")
+    if value is None:
+        return default
+    if value.lower() in ("1", "true"):
+        return True
+    if value.lower() in ("0", "false"):
+        return False
+    raise ValueError("stream must be 'true' or 'false'")
+
+# Pick the response format from ?format= or, failing that, the Accept header
+def parse_format(args, accept=None):
+    response_format = args.get("format")
+    if response_format is None:
+        return "binary" if columnar.MIMETYPE in (accept or "") else "json"
+    if response_format not in ("json", "binary"):
+        raise ValueError("format must be 'json' or 'binary'")
+    return response_format
+
+# Parse the optional since cursor (the "cursor" value of an earlier response)
+def parse_since(args):
+    since = args.get("since")
+    if since is None:
+        return None
+    try:
+        cursor = datetime.fromisoformat(since.replace("Z", "+00:00"))
+    except ValueError:
+        raise ValueError("since must be an ISO 8601 timestamp")
+    if not cursor.tzinfo:
+        cursor = pytz.utc.localize(cursor)
+    return cursor
+
+# Parse the rooms list: comma-separated, and/or the parameter repeated
+def parse_rooms(args):
+    rooms = []
+    for value in args.getlist("rooms"):
+        for room in value.split(","):
+            room = room.strip()
+            if room and room not in rooms:
+                rooms.append(room)
+    if not rooms:
+        raise ValueError("rooms must name at least one room")
+    return rooms
+
+# Parse the history bucket width; one of the rollup resolutions
+def parse_bucket(args, default="1h"):
+    bucket = args.get("bucket", default)
+    if bucket not in RESOLUTIONS:
+        raise ValueError(f"bucket must be one of: {', '.join(RESOLUTIONS)}")
+    return bucket
+
+# Start of a history window, moved up to the since cursor when one is given
+def window_start(span, cursor=None):
+    start = datetime.now(EST) - span
+    return max(start, cursor) if cursor else start
+
+# Room history payload; the cursor is the last bucket, which clients send back as since
+def room_history_payload(timestamps, temperature, humidity, since=None):
+    return {
+        "timestamps": timestamps,
+        "temperature": temperature,
+        "humidity": humidity,
+        "cursor": timestamps[-1] if timestamps else since
+    }
+
+def rollup_history_payload(history, since=None):
+    return room_history_payload(
+        [convert_to_est(b["bucket"]).isoformat() for b in history],
+        [b["fields"].get("temperature", {}).get("mean") for b in history],
+        [b["fields"].get("humidity", {}).get("mean") for b in history],
+        since
+    )
+
+def hourly_pipeline_payload(hourly, since=None):
+    return room_history_payload(
+        [convert_to_est(h["_id"]).isoformat() for h in hourly],
+        [h["temperature"] for h in hourly],
+        [h["humidity"] for h in hourly],
+        since
+    )
+
+def rooms_history_payload(series, rooms, since=None):
+    """Per-room history for /api/rooms/history.
+
+    ``series`` maps room to ``(bucket epoch seconds, temperature, humidity)``
+    lists, sorted by bucket. Every requested room gets an entry, empty when
+    it had no readings; the cursor is the latest bucket of any room.
+    """
+    payload = {}
+    latest = None
+    for room in rooms:
+        seconds, temperature, humidity = series.get(room, ([], [], []))
+        payload[room] = {
+            "timestamps": format_local_iso(seconds),
+            "temperature": list(temperature),
+            "humidity": list(humidity)
+        }
+        if len(seconds) and (latest is None or seconds[-1] > latest):
+            latest = seconds[-1]
+    return {
+        "rooms": payload,
+        "cursor": format_local_iso([latest])[0] if latest is not None else since
+    }
+
+def _mean(stats):
+    return stats["sum"] / stats["count"] if stats else None
+
+def summary_room_series(summary):
+    # rollups.summarize output ({(room, minute): stats}) as per-room series
+    series = {}
+    for room, minute in sorted(summary, key=lambda key: key[1]):
+        fields = summary[(room, minute)]
+        seconds, temperature, humidity = series.setdefault(room, ([], [], []))
+        seconds.append(minute * 60)
+        temperature.append(_mean(fields.get("temperature")))
+        humidity.append(_mean(fields.get("humidity")))
+    return series
+
+def rollup_room_series(histories):
+    # rollups.read_room_histories output as per-room series
+    return {
+        room: (
+            [int(b["bucket"].timestamp()) for b in history],
+            [b["fields"].get("temperature", {}).get("mean") for b in history],
+            [b["fields"].get("humidity", {}).get("mean") for b in history]
+        )
+        for room, history in histories.items()
+    }
+
+def pipeline_room_series(buckets):
+    # pipelines.rooms_history_pipeline output (sorted by bucket) as per-room series
+    series = {}
+    for doc in buckets:
+        bucket = doc["_id"]["bucket"]
+        if not bucket.tzinfo:
+            bucket = pytz.utc.localize(bucket)
+        seconds, temperature, humidity = series.setdefault(doc["_id"]["room"], ([], [], []))
+        seconds.append(int(bucket.timestamp()))
+        temperature.append(doc["temperature"])
+        humidity.append(doc["humidity"])
+    return series
+
+def log_combined_fetch(weather_data, ac_data, room_data):
+    # Debug-only detail; skip building the messages when nobody will see them
+    if not logger.isEnabledFor(logging.DEBUG):
+        return
+    weather_status = "✅" if len(weather_data) > 0 else "⚠️"
+    logger.debug(f"{weather_status} Weather Data: {len(weather_data)} points")
+    if len(weather_data) > 0:
+        logger.debug(f"   └─ First weather timestamp: {weather_data[0].get('Time Stamp')}")
+        logger.debug(f"   └─ Last weather timestamp: {weather_data[-1].get('Time Stamp')}")
+
+    ac_status = "✅" if len(ac_data) > 0 else "⚠️"
+    logger.debug(f"{ac_status} AC Data: {len(ac_data)} points")
+    if len(ac_data) > 0:
+        logger.debug(f"   └─ First AC timestamp: {ac_data[0].get('Timestamp')}")
+        logger.debug(f"   └─ Last AC timestamp: {ac_data[-1].get('Timestamp')}")
+
+    room_status = "✅" if len(room_data) > 0 else "⚠️"
+    logger.debug(f"{room_status} Room Data: {len(room_data)} points")
+    if len(room_data) > 0:
+        logger.debug(f"   └─ First room timestamp: {room_data[0].get('Timestamp')}")
+        logger.debug(f"   └─ Last room timestamp: {room_data[-1].get('Timestamp')}")
+        logger.debug(f"   └─ Sample room data: {room_data[0]}")
+
+def log_combined_summary(processed_data):
+    if not logger.isEnabledFor(logging.DEBUG):
+        return
+    log_separator("📈 Data Summary")
+    logger.debug(f"⏰ Total timestamps: {len(processed_data['timestamps'])}")
+    if processed_data['timestamps']:
+        logger.debug(f"📅 Time range: {processed_data['timestamps'][0]} to {processed_data['timestamps'][-1]}")
+
+    if len(processed_data['outside_temp']) > 0:
+        outside_temps = list(filter(None, processed_data['outside_temp']))
+        if outside_temps:
+            logger.debug(f"🌡️ Outside temp range: {min(outside_temps)}°F to {max(outside_temps)}°F")
+
+    if len(processed_data['ac_temp']) > 0:
+        ac_temps = list(filter(None, processed_data['ac_temp']))
+        if ac_temps:
+            logger.debug(f"❄️ AC temp range: {min(ac_temps)}°F to {max(ac_temps)}°F")
+
+    # Log room data summary
+    for room_name in processed_data["room_temps"]:
+        room_temps = list(filter(None, processed_data["room_temps"][room_name]))
+        if room_temps:
+            logger.debug(f"🏠 {room_name} temp range: {min(room_temps)}°F to {max(room_temps)}°F")
+
+def current_conditions_payload(latest_weather, latest_ac, latest_rooms):
+    # Get latest room data for each room
+    room_data = {}
+    for room in latest_rooms:
+        room_name = room["_id"]
+        latest = room["latest"]
+        room_data[room_name] = {
+            "temperature": to_number(latest.get("Temperature")),
+            "humidity": to_number(latest.get("Humidity")),
+            "timestamp": latest.get("Timestamp")
+        }
+
+    return {
+        "outside": {
+            "temperature": to_number(latest_weather.get("Current Temperature")) if latest_weather else None,
+            "feels_like": to_number(latest_weather.get("Feels Like")) if latest_weather else None,
+            "humidity": to_number(latest_weather.get("Humidity")) if latest_weather else None,
+            "description": latest_weather.get("Description") if latest_weather else None,
+            "icon": latest_weather.get("Icon") if latest_weather else None,
+            "timestamp": latest_weather.get("Time Stamp") if latest_weather else None
+        },
+        "ac": {
+            "temperature": to_number(latest_ac.get("Temperature")) if latest_ac else None,
+            "feels_like": to_number(latest_ac.get("Feels Like")) if latest_ac else None,
+            "humidity": to_number(latest_ac.get("Humidity")) if latest_ac else None,
+            "timestamp": latest_ac.get("Timestamp") if latest_ac else None
+        },
+        "rooms": room_data
+    }
+
+# Only the fields weather_records reads leave the server
+WEATHER_PROJECTION = {
+    "_id": 0,
+    "Time Stamp": 1,
+    "Current Temperature": 1,
+    "Feels Like": 1,
+    "Humidity": 1,
+    "Wind Speed": 1,
+    "Description": 1,
+    "Icon": 1
+}
+
+def weather_rows(docs):
+    # Normalize the documents into columns in one pass and format the local minute keys by arithmetic
+    with span("parse"):
+        readings = read_readings(docs, "weather", extras=True)
+        time_keys = format_minute_keys(readings.minutes)
+    return readings.records(time_keys), readings.seconds
+
+def weather_records(docs, max_points=None):
+    data, seconds = weather_rows(docs)
+
+    logger.debug(f"Retrieved {len(data)} weather records")
+    if max_points:
+        with span("align"):
+            data = downsample_records(data, seconds, [d["temperature"] for d in data], max_points)
+        logger.debug(f"Downsampled to {len(data)} weather records")
+    return data
+
+def iter_weather_records(docs, batch_size):
+    """``weather_records`` as JSON chunks, converting ``batch_size`` documents at a time.
+
+    ``docs`` may be a live cursor; only one batch of documents and rows is
+    held at once. Downsampling needs the whole series, so it isn't offered here.
+    """
+    return iter_json_array(weather_rows(batch)[0] for batch in chunked(docs, batch_size))
+
+def current_weather_payload(latest):
+    # Convert timestamp to EST
+    time_str = latest.get("Time Stamp")
+    if time_str:
+        est_time = convert_to_est(time_str)
+        timestamp = est_time.strftime("%Y-%m-%d %H:%M")
+    else:
+        timestamp = None
+
+    return {
+        "location": latest.get("Location"),
+        "temperature": to_number(latest.get("Current Temperature")),
+        "feels_like": to_number(latest.get("Feels Like")),
+        "humidity": to_number(latest.get("Humidity")),
+        "wind_speed": latest.get("Wind Speed"),
+        "description": latest.get("Description"),
+        "icon": latest.get("Icon"),
+        "timestamp": timestamp
+    }
+
+def _hourly_means(readings):
+    # Mean temperature and humidity per local hour (local hours start on UTC
+    # hours in this timezone). Readings without a temperature are skipped;
+    # bincount adds in reading order, so the means match summing per hour.
+    temperature = readings.values["temperature"]
+    kept = ~np.isnan(temperature)
+    hours, inverse = np.unique(readings.seconds[kept] // 3600 * 3600, return_inverse=True)
+    temperature = np.bincount(inverse, temperature[kept], len(hours)) / np.bincount(inverse, minlength=len(hours))
+
+    humidity = readings.values["humidity"][kept]
+    has_humidity = ~np.isnan(humidity)
+    counts = np.bincount(inverse[has_humidity], minlength=len(hours))
+    sums = np.bincount(inverse[has_humidity], humidity[has_humidity], len(hours))
+    humidity = sums[counts > 0] / counts[counts > 0]
+    return hours, temperature, humidity, len(readings) - int(kept.sum())
+
+def hourly_room_averages(room_data, since=None):
+    """Average raw room readings into local hourly buckets in Python.
+
+    The in-app processing, kept as the reference for the pipeline and
+    rollup paths. Like theirs, an empty result keeps ``since`` as its cursor.
+    """
+    # Normalize the readings and average them per hour
+    with span("parse"):
+        readings = read_readings(room_data, "room")
+        hours, temperature, humidity, skipped_records = _hourly_means(readings)
+        skipped_records += len(room_data) - len(readings)
+
+    processed_data = {
+        "timestamps": format_local_iso(hours),
+        "temperature": temperature.tolist(),
+        "humidity": humidity.tolist()
+    }
+
+    if skipped_records:
+        logger.warning(f"⚠️ Skipped {skipped_records} unparseable room readings")
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(f"✨ Processing complete:")
+        logger.debug(f"   └─ Input records: {len(room_data)}")
+        logger.debug(f"   └─ Output hourly points: {len(processed_data['timestamps'])}")
+        logger.debug(f"   └─ Sample data point: {processed_data['timestamps'][0] if processed_data['timestamps'] else 'None'}")
+        # Nothing may have parsed; an empty result is still a valid response
+        if processed_data['temperature']:
+            logger.debug(f"   └─ Temperature range: {min(processed_data['temperature'])} to {max(processed_data['temperature'])}")
+        if processed_data['humidity']:
+            logger.debug(f"   └─ Humidity range: {min(processed_data['humidity'])} to {max(processed_data['humidity'])}")
+
+    processed_data["cursor"] = processed_data["timestamps"][-1] if processed_data["timestamps"] else since
+    return processed_data